@@ -5,12 +5,34 @@ import sys
 import time
 import shlex
 import argparse
+import atexit
 from pathlib import Path
 import os
 import threading
 import random 
 import math 
 import json # For saving/loading USER_CONFIG
+import functools
+import re
+import io
+import tarfile
+import asyncio
+import shutil
+import stat
+import errno
+import signal
+import socket
+import selectors
+import collections
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import NamedTuple
+
+# Python 3.10+ is required (X | None annotations, slotted dataclasses). It also keeps every spawn below on CPython's fast path:
+# vfork() plus close_range()/proc-fd scanning for close_fds=True, instead of closing each fd up to the ulimit after a full fork.
+# That path is lost with preexec_fn, so none of the Popen/run calls in this file pass one; close_fds stays at its safe default.
+if sys.version_info < (3, 10): sys.exit("This installer requires Python 3.10 or newer.")
 
 # --- Global Dry Run Flag ---
 DRY_RUN_MODE = False
@@ -27,11 +49,12 @@ INSTALL_STEPS = [
     "chroot_configure",     # 7
     "cleanup"               # 8
 ]
+STEP_IDX = {step_name: i for i, step_name in enumerate(INSTALL_STEPS)} # O(1) name -> index, instead of list.index scans
 CURRENT_STEP = 0
 RESTART_STEP = 0
 
 # --- Configuration Constants (User-configurable defaults) ---
-USER_CONFIG = {
+_DEFAULT_USER_CONFIG = MappingProxyType({ # Read-only; every (re)initialisation of USER_CONFIG copies it
     "username": "bao",
     "hostname": "bao",
     "timezone": "America/Denver",
@@ -52,15 +75,36 @@ USER_CONFIG = {
     "ssh_key_email": "kunihir0@tutanota.com",
     "gpg_key_name": "kunihir0",
     "gpg_key_email": "kunihir0@tutanota.com",
+    "gpg_key_algo": "ed25519", # Or "rsa4096" where RSA compatibility is needed (keygen takes seconds instead of milliseconds)
     "cpu_march": "icelake-client", 
     "add_chaotic_aur": True,
     "default_monospace_font_pkg": "ttf-sourcecodepro-nerd",
     "btrfs_mount_options": "compress=zstd,ssd,noatime,discard=async"
+})
+USER_CONFIG = dict(_DEFAULT_USER_CONFIG)
+
+GPG_KEY_SPECS = { # gpg --batch parameter lines per gpg_key_algo; one parameter per line, as the batch format requires
+    "ed25519": "Key-Type: EDDSA\nKey-Curve: ed25519\nSubkey-Type: ECDH\nSubkey-Curve: cv25519",
+    "rsa4096": "Key-Type: RSA\nKey-Length: 4096\nSubkey-Type: RSA\nSubkey-Length: 4096",
 }
 
 # Hardcoded Passwords
-BAO_PASSWORD = "7317"
-ROOT_PASSWORD = "73177317"
+_HASH_EXECUTOR = ThreadPoolExecutor(max_workers=1)
+def _sha512_crypt(plaintext: str) -> str | None:
+    try: return subprocess.run(["openssl", "passwd", "-6", "-stdin"], input=plaintext, capture_output=True, text=True, check=True).stdout.strip() or None # -stdin keeps it out of argv
+    except (OSError, subprocess.CalledProcessError): return None
+@dataclass
+class Credential:
+    plaintext: str = field(repr=False)
+    _hash_future: Future | None = field(default=None, repr=False)
+    def start_hashing(self):
+        if self._hash_future is None: self._hash_future = _HASH_EXECUTOR.submit(_sha512_crypt, self.plaintext)
+    def hash(self) -> str | None: self.start_hashing(); return self._hash_future.result()
+    def chpasswd_line(self, user: str) -> str: # Pre-hashed when openssl was available, plaintext chpasswd otherwise
+        crypted = self.hash()
+        return f"echo {shlex.quote(f'{user}:{crypted}')} | chpasswd -e" if crypted else f"echo {shlex.quote(f'{user}:{self.plaintext}')} | chpasswd"
+BAO_PASSWORD = Credential("7317")
+ROOT_PASSWORD = Credential("73177317")
 
 # --- UI System ---
 class Colors:
@@ -78,17 +122,26 @@ PROGRESS_SYMBOL = f"{Colors.BLUE}→{Colors.RESET}"; NOTE_SYMBOL = f"{Colors.LAV
 STAR_SYMBOL = f"{Colors.PURPLE}★{Colors.RESET}"
 
 PROGRESS_FILE = Path("/tmp/arch_install_progress.json") 
+SURFACE_KEY_URL = "https://raw.githubusercontent.com/linux-surface/linux-surface/master/pkg/keys/surface.asc"
+SURFACE_KEY_TMP_PATH = Path("/tmp/surface.asc")
+SURFACE_KEY_ID = "56C464BAAC421453"
+_BG_TASKS: dict[str, subprocess.Popen] = {} # Long-running live-environment commands started early and collected later
 
+_LAST_SAVED_PROGRESS: str | None = None # Serialized state last persisted; an unchanged state skips the fsync'd write
 def save_progress():
-    global USER_CONFIG 
+    global USER_CONFIG, _LAST_SAVED_PROGRESS
     if not DRY_RUN_MODE:
         try:
             progress_data = {
                 "current_step": CURRENT_STEP,
                 "user_config": USER_CONFIG 
             }
-            with open(PROGRESS_FILE, "w") as f:
-                json.dump(progress_data, f, indent=4)
+            payload = json.dumps(progress_data, separators=(",", ":"))
+            if payload == _LAST_SAVED_PROGRESS: return
+            tmp_progress_file = PROGRESS_FILE.with_suffix(".json.tmp") # Write-then-rename so a crash never leaves a torn file
+            with open(tmp_progress_file, "w") as f:
+                f.write(payload); f.flush(); os.fsync(f.fileno())
+            os.replace(tmp_progress_file, PROGRESS_FILE); _LAST_SAVED_PROGRESS = payload
         except Exception as e: print_color(f"Note: Could not save progress: {e}", Colors.YELLOW, prefix=WARNING_SYMBOL)
 
 def load_progress():
@@ -103,7 +156,7 @@ def load_progress():
 
             if isinstance(step, int) and 0 <= step < len(INSTALL_STEPS) and isinstance(loaded_user_config, dict):
                 RESTART_STEP = step
-                USER_CONFIG.update(loaded_user_config) 
+                USER_CONFIG.update(loaded_user_config); refresh_layout()
                 print_color(f"Found saved progress at step {step} ({INSTALL_STEPS[step]}) and loaded USER_CONFIG.", Colors.CYAN, prefix=INFO_SYMBOL)
                 
                 if not USER_CONFIG.get("target_drive"):
@@ -119,140 +172,294 @@ def load_progress():
             PROGRESS_FILE.unlink(missing_ok=True)
     return 0
 
+@functools.lru_cache(maxsize=4)
+def _part_sep(drive: str) -> str: return "p" if ("nvme" in drive or "loop" in drive) else "" # nvme/loop devices name partitions <drive>p<N>
+@dataclass(frozen=True, slots=True)
+class Layout: # Device paths derived from USER_CONFIG, built once per run instead of re-assembled in every step
+    part_sep: str; efi_part_dev: str; lvm_part_dev: str; lv_root: str; lv_swap: str; lv_root_mapper: str; lv_swap_mapper: str; btrfs_opts: str
+    @classmethod
+    def from_config(cls, config: dict) -> "Layout":
+        drive = config.get("target_drive") or ""; sep = _part_sep(drive); vg = config["lvm_vg_name"]; lv_root_name = config["lvm_lv_root_name"]; lv_swap_name = config["lvm_lv_swap_name"]
+        return cls(sep, f"{drive}{sep}1", f"{drive}{sep}2", f"/dev/{vg}/{lv_root_name}", f"/dev/{vg}/{lv_swap_name}", f"/dev/mapper/{vg}-{lv_root_name}", f"/dev/mapper/{vg}-{lv_swap_name}", config["btrfs_mount_options"])
+LAYOUT: Layout | None = None
+def refresh_layout():
+    global LAYOUT; LAYOUT = Layout.from_config(USER_CONFIG)
+
 def print_color(text: str, color: str, bold: bool = False, prefix: str | None = None, italic: bool = False):
     style_str = (Colors.BOLD if bold else "") + (Colors.ITALIC if italic else "")
     prefix_str = f"{prefix} " if prefix else ""
     print(f"{prefix_str}{style_str}{color}{text}{Colors.RESET}")
 
+class OutputBuffer(io.StringIO):
+    # Collects everything printed inside a `with` block and hands it to the terminal in one write.
+    # flush() drains early: input() and prompt_yes_no flush before reading, so a question is never stuck in the buffer.
+    def __enter__(self): self._real_stdout, sys.stdout = sys.stdout, self; return self
+    def __exit__(self, *exc_info): sys.stdout = self._real_stdout; self.flush(); return False
+    def flush(self):
+        if self.tell(): self._real_stdout.write(self.getvalue()); self.seek(0); self.truncate()
+        self._real_stdout.flush()
+def buffered_output(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with OutputBuffer(): return fn(*args, **kwargs)
+    return wrapper
+
 def print_header(title: str): print_color(f"❄️ === {title} === ❄️", Colors.PINK_BG + Colors.CYAN + Colors.BOLD); print("")
-def print_section_header(title: str):
-    gradient_colors = [Colors.PINK, Colors.PURPLE, Colors.CYAN, Colors.BLUE, Colors.MAGENTA]
-    styled_title = "".join(f"{gradient_colors[i % len(gradient_colors)]}{char}" for i, char in enumerate(title))
-    print_color(f"--- {styled_title}{Colors.RESET} ---", Colors.PURPLE, bold=True, prefix=STAR_SYMBOL); print("")
+SECTION_GRADIENT_COLORS = (Colors.PINK, Colors.PURPLE, Colors.CYAN, Colors.BLUE, Colors.MAGENTA)
+@functools.lru_cache(maxsize=64)
+def _gradient(title: str) -> str: # Section titles come from a small fixed set, so each is styled only once
+    n_colors = len(SECTION_GRADIENT_COLORS)
+    return "".join([f"{SECTION_GRADIENT_COLORS[i % n_colors]}{char}" for i, char in enumerate(title)])
+def print_section_header(title: str): print_color(f"--- {_gradient(title)}{Colors.RESET} ---", Colors.PURPLE, bold=True, prefix=STAR_SYMBOL); print("")
 def print_step_info(message: str): print_color(message, Colors.LIGHT_BLUE, prefix=INFO_SYMBOL)
 def print_command_info(cmd_str: str): print_color(f"Executing: {cmd_str}", Colors.CYAN, prefix=PROGRESS_SYMBOL)
 def print_dry_run_command(cmd_str: str): print_color(f"Would execute: {cmd_str}", Colors.PEACH, prefix=f"{Colors.YELLOW}[DRY RUN]{Colors.RESET}")
 
 class Spinner:
+    # One long-lived thread shared by every run_command; callers just swap the message and pause/resume it
     def __init__(self, message="Processing...", delay=0.1, spinner_chars=None):
         self.spinner_chars = spinner_chars if spinner_chars else ["⠋", "⠙", "⠹", "⠸", "⠼", "⠴", "⠦", "⠧", "⠇", "⠏"]
         self.delay = delay
         self.message = message
         self._thread = None
-        self.running = False
+        self._lock = threading.Lock(); self._active = threading.Event(); self._shutdown = False
+    @property
+    def running(self): return self._active.is_set()
     def _spin(self):
         idx = 0
-        while self.running:
-            spinner_char = self.spinner_chars[idx % len(self.spinner_chars)]
-            sys.stdout.write(f"\r{Colors.LIGHT_BLUE}{spinner_char}{Colors.RESET} {self.message} "); sys.stdout.flush(); time.sleep(self.delay); idx += 1
-        sys.stdout.write(f"\r{' ' * (len(self.message) + 5)}\r"); sys.stdout.flush()
-    def start(self):
-        if sys.stdout.isatty(): self.running = True; self._thread = threading.Thread(target=self._spin); self._thread.daemon = True; self._thread.start()
-    def stop(self):
-        if self.running: self.running = False
+        while True:
+            self._active.wait()
+            with self._lock:
+                if self._shutdown: break
+                if not self._active.is_set(): continue
+                sys.stdout.write(f"\r{Colors.LIGHT_BLUE}{self.spinner_chars[idx % len(self.spinner_chars)]}{Colors.RESET} {self.message} "); sys.stdout.flush()
+            time.sleep(self.delay); idx += 1
+    def set_message(self, message: str):
+        with self._lock:
+            if self._active.is_set(): self._clear_line()
+            self.message = message
+    def resume(self):
+        if not sys.stdout.isatty(): return
+        if self._thread is None: self._thread = threading.Thread(target=self._spin, daemon=True); self._thread.start()
+        self._active.set()
+    def pause(self):
+        if not self._active.is_set(): return
+        with self._lock: self._active.clear(); self._clear_line()
+    def shutdown(self):
+        self.pause()
+        with self._lock: self._shutdown = True
+        self._active.set() # Wake the thread so it sees _shutdown
         if self._thread and self._thread.is_alive(): self._thread.join(timeout=self.delay * 2)
-        sys.stdout.write(f"\r{' ' * (len(self.message) + 5)}\r"); sys.stdout.flush()
+    def _clear_line(self): sys.stdout.write(f"\r{' ' * (len(self.message) + 5)}\r"); sys.stdout.flush()
+SPINNER = Spinner()
+atexit.register(SPINNER.shutdown)
+
+# --- Dry-Run Mock Outputs (built on demand, cached per USER_CONFIG snapshot) ---
+def _config_fingerprint() -> tuple: return tuple(sorted((k, v) for k, v in USER_CONFIG.items() if not isinstance(v, (dict, list))))
+@functools.lru_cache(maxsize=8)
+def _mock_lsblk(cmd_str: str, fingerprint: tuple) -> str | None:
+    if "-f" not in cmd_str: return None
+    cfg = dict(fingerprint)
+    mock_stdout = ( f"NAME FSTYPE FSVER LABEL UUID                                 FSAVAIL FSUSE% MOUNTPOINTS\n"
+        f"{cfg['target_drive']}{_part_sep(cfg['target_drive'])}1 vfat   FAT32         0000-0000                            /mnt/boot/efi\n"
+        f"└─{cfg['target_drive']}                                                               \n"
+        f"{cfg['lvm_vg_name']}-{cfg['lvm_lv_root_name']} btrfs             xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx /mnt\n"
+        f"└─{cfg['target_drive']}{_part_sep(cfg['target_drive'])}2 LVM2_member                                               \n" )
+    if float(cfg.get('swap_size_gb', 0)) > 0: 
+         mock_stdout += f"{cfg['lvm_vg_name']}-{cfg['lvm_lv_swap_name']} swap   1             yyyyyyyy-yyyy-yyyy-yyyy-yyyyyyyyyyyy [SWAP]\n"
+    return mock_stdout
+@functools.lru_cache(maxsize=8)
+def _mock_findmnt(cmd_str: str, fingerprint: tuple) -> str:
+    cfg = dict(fingerprint)
+    return ( f"TARGET                                SOURCE                                                               FSTYPE OPTIONS\n"
+        f"/mnt                                  /dev/mapper/{cfg['lvm_vg_name']}-{cfg['lvm_lv_root_name']}[/{cfg['btrfs_subvol_root']}] btrfs  rw,noatime,{cfg['btrfs_mount_options']},subvol=/{cfg['btrfs_subvol_root']}\n"
+        f"/mnt/home                             /dev/mapper/{cfg['lvm_vg_name']}-{cfg['lvm_lv_root_name']}[/{cfg['btrfs_subvol_home']}] btrfs  rw,noatime,{cfg['btrfs_mount_options']},subvol=/{cfg['btrfs_subvol_home']}\n"
+        f"/mnt/var                              /dev/mapper/{cfg['lvm_vg_name']}-{cfg['lvm_lv_root_name']}[/{cfg['btrfs_subvol_var']}] btrfs  rw,noatime,{cfg['btrfs_mount_options']},subvol=/{cfg['btrfs_subvol_var']}\n"
+        f"/mnt/boot/efi                         {cfg['target_drive']}{_part_sep(cfg['target_drive'])}1              vfat   rw,relatime\n" )
+@functools.lru_cache(maxsize=8)
+def _mock_swapon(cmd_str: str, fingerprint: tuple) -> str | None:
+    cfg = dict(fingerprint)
+    if "--show" not in cmd_str or float(cfg.get('swap_size_gb', 0)) <= 0: return None # Fall back to the generic placeholder
+    return f"NAME                                     TYPE      SIZE USED PRIO\n/dev/mapper/{cfg['lvm_vg_name']}-{cfg['lvm_lv_swap_name']} partition 8G   0B   -2"
+def _mock_pacman_q(cmd_str: str, fingerprint: tuple) -> str | None:
+    if "-Q" not in cmd_str: return None
+    if "linux-surface" in cmd_str: return "linux-surface 6.14.2.arch1-1" # Example, adjust if needed
+    if "dracut" in cmd_str: return "dracut 059-1"
+    return "some-package 1.0-1"
+_DRY_RUN_MOCKS = {"lsblk": _mock_lsblk, "findmnt": _mock_findmnt, "swapon": _mock_swapon, "pacman": _mock_pacman_q} # Keyed on the program name
+def _dry_run_mock_builder(command: list[str] | str):
+    argv = command if isinstance(command, list) else command.split()
+    if argv and Path(argv[0]).name == "arch-chroot": argv = argv[2:] # arch-chroot <root> <program> ...: dispatch on the inner program
+    return _DRY_RUN_MOCKS.get(Path(argv[0]).name) if argv else None
 
 # --- Core Helper Functions ---
-def run_command( command: list[str] | str, check: bool = True, capture_output: bool = False, text: bool = True, shell: bool = False, cwd: Path | str | None = None, env: dict | None = None, destructive: bool = True, show_spinner: bool = True, retry_count: int = 1, retry_delay: float = 3.0, custom_spinner_message: str | None = None) -> subprocess.CompletedProcess | None:
+def run_command( command: list[str] | str, check: bool = True, capture_output: bool = False, text: bool | None = None, shell: bool = False, cwd: Path | str | None = None, env: dict | None = None, destructive: bool = True, show_spinner: bool = True, retry_count: int = 1, retry_delay: float = 3.0, custom_spinner_message: str | None = None, wait: bool = True, stream: bool = False, allow_shell: bool = False, input_text: str | None = None) -> subprocess.CompletedProcess | subprocess.Popen | None:
+    if shell and not allow_shell: raise ValueError(f"shell=True requires allow_shell=True; pass an argv list instead: {command!r}") # Keep argv-list discipline
+    if input_text is not None and (stream or not wait): raise ValueError("input_text is only supported for blocking, non-streaming commands")
     cmd_str = ' '.join(command) if isinstance(command, list) else command
     if DRY_RUN_MODE and destructive:
         print_dry_run_command(cmd_str)
         if capture_output: 
-            mock_stdout = f"[DRY RUN SIMULATED OUTPUT FOR: {cmd_str}]"
-            if "lsblk" in cmd_str and "-f" in cmd_str : 
-                mock_stdout = ( f"NAME FSTYPE FSVER LABEL UUID                                 FSAVAIL FSUSE% MOUNTPOINTS\n"
-                    f"{USER_CONFIG['target_drive']}p1 vfat   FAT32         0000-0000                            /mnt/boot/efi\n"
-                    f"└─{USER_CONFIG['target_drive']}                                                               \n"
-                    f"{USER_CONFIG['lvm_vg_name']}-{USER_CONFIG['lvm_lv_root_name']} btrfs             xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx /mnt\n"
-                    f"└─{USER_CONFIG['target_drive']}p2 LVM2_member                                               \n" )
-                if float(USER_CONFIG.get('swap_size_gb', 0)) > 0: 
-                     mock_stdout += f"{USER_CONFIG['lvm_vg_name']}-{USER_CONFIG['lvm_lv_swap_name']} swap   1             yyyyyyyy-yyyy-yyyy-yyyy-yyyyyyyyyyyy [SWAP]\n"
-            elif "findmnt" in cmd_str: 
-                 mock_stdout = ( f"TARGET                                SOURCE                                                               FSTYPE OPTIONS\n"
-                    f"/mnt                                  /dev/mapper/{USER_CONFIG['lvm_vg_name']}-{USER_CONFIG['lvm_lv_root_name']}[/{USER_CONFIG['btrfs_subvol_root']}] btrfs  rw,noatime,{USER_CONFIG['btrfs_mount_options']},subvol=/{USER_CONFIG['btrfs_subvol_root']}\n"
-                    f"/mnt/home                             /dev/mapper/{USER_CONFIG['lvm_vg_name']}-{USER_CONFIG['lvm_lv_root_name']}[/{USER_CONFIG['btrfs_subvol_home']}] btrfs  rw,noatime,{USER_CONFIG['btrfs_mount_options']},subvol=/{USER_CONFIG['btrfs_subvol_home']}\n"
-                    f"/mnt/var                              /dev/mapper/{USER_CONFIG['lvm_vg_name']}-{USER_CONFIG['lvm_lv_root_name']}[/{USER_CONFIG['btrfs_subvol_var']}] btrfs  rw,noatime,{USER_CONFIG['btrfs_mount_options']},subvol=/{USER_CONFIG['btrfs_subvol_var']}\n"
-                    f"/mnt/boot/efi                         {USER_CONFIG['target_drive']}{'p1' if 'nvme' in USER_CONFIG['target_drive'] else '1'}              vfat   rw,relatime\n" )
-            elif "swapon --show" in cmd_str and float(USER_CONFIG.get('swap_size_gb', 0)) > 0:
-                mock_stdout = f"NAME                                     TYPE      SIZE USED PRIO\n/dev/mapper/{USER_CONFIG['lvm_vg_name']}-{USER_CONFIG['lvm_lv_swap_name']} partition 8G   0B   -2"
-            elif "pacman -Q" in cmd_str: 
-                if "linux-surface" in cmd_str: mock_stdout = "linux-surface 6.14.2.arch1-1" # Example, adjust if needed
-                elif "dracut" in cmd_str: mock_stdout = "dracut 059-1" 
-                else: mock_stdout = f"some-package 1.0-1" 
+            mock_builder = _dry_run_mock_builder(command)
+            mock_stdout = (mock_builder(cmd_str, _config_fingerprint()) if mock_builder else None) or f"[DRY RUN SIMULATED OUTPUT FOR: {cmd_str}]"
             return subprocess.CompletedProcess(args=command if isinstance(command, list) else shlex.split(cmd_str), returncode=0, stdout=mock_stdout, stderr="")
         return None
     print_command_info(cmd_str)
+    if text is None: text = capture_output or stream # Only decode when someone will read the output
+    if isinstance(command, list) and command and "/" not in command[0] and env is None:
+        tool_path = resolve_tool(command[0]) # Fail before forking, and spare exec() the PATH walk
+        if tool_path is None: print_color(f"Command not found: {command[0]}", Colors.RED, prefix=ERROR_SYMBOL, bold=True); raise FileNotFoundError(errno.ENOENT, "Command not found", command[0])
+        command = [tool_path] + command[1:]
+    if destructive: invalidate_probes() # Anything destructive may change what the read-only probes report
+    if not wait: # Non-blocking variant: caller owns the handle and must wait_process() it
+        pipe = subprocess.PIPE if capture_output else None
+        return subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=pipe, stderr=pipe, text=text, shell=shell, cwd=cwd, env=env) # Never share the terminal with a prompt
     for attempt in range(retry_count):
-        spinner = None
-        if show_spinner and not capture_output and (not shell or (shell and "&" not in cmd_str)): 
+        spinning = show_spinner and not capture_output and not stream and (not shell or (shell and "&" not in cmd_str))
+        if spinning: 
             spinner_msg_to_show = custom_spinner_message if custom_spinner_message else (cmd_str[:70] + "..." if len(cmd_str) > 70 else cmd_str)
-            spinner = Spinner(message=f"Running '{spinner_msg_to_show}'")
-            spinner.start()
+            SPINNER.set_message(f"Running '{spinner_msg_to_show}'"); SPINNER.resume()
         try:
-            process = subprocess.run( command, check=False, capture_output=capture_output, text=text, shell=shell, cwd=cwd, env=env )
-            if spinner: spinner.stop()
-            if process.stderr and process.returncode != 0 : 
+            if stream: process = _run_streaming(command, text=text, shell=shell, cwd=cwd, env=env)
+            else: process = subprocess.run( command, check=False, capture_output=capture_output, text=text, shell=shell, cwd=cwd, env=env, input=input_text if text or input_text is None else input_text.encode() )
+            if spinning: SPINNER.pause()
+            if process.stderr and process.returncode != 0 and not stream: # Streamed stderr is already on screen
                  print_color(f"Stderr for '{cmd_str}':\n{process.stderr.strip()}", Colors.ORANGE, prefix=WARNING_SYMBOL)
             if check and process.returncode != 0: 
                 process.check_returncode() 
             return process
         except subprocess.CalledProcessError as e:
-            if spinner: spinner.stop()
+            if spinning: SPINNER.pause()
             if attempt < retry_count - 1:
                 print_color(f"Command failed (attempt {attempt+1}/{retry_count}): {cmd_str}", Colors.ORANGE, prefix=WARNING_SYMBOL)
                 print_color(f"Retrying in {retry_delay} seconds...", Colors.BLUE); time.sleep(retry_delay)
                 continue
             print_color(f"Command failed: {cmd_str}", Colors.RED, prefix=ERROR_SYMBOL, bold=True)
-            if e.stdout: print_color(f"Stdout:\n{e.stdout.strip()}", Colors.RED)
+            if e.stdout and not stream: print_color(f"Stdout:\n{e.stdout.strip()}", Colors.RED)
             raise
         except FileNotFoundError:
-            if spinner: spinner.stop()
+            if spinning: SPINNER.pause()
             print_color(f"Command not found: {command[0] if isinstance(command, list) else cmd_str.split()[0]}", Colors.RED, prefix=ERROR_SYMBOL, bold=True)
             raise
         finally:
-            if spinner and spinner.running: spinner.stop()
+            if spinning: SPINNER.pause()
+
+_TOOL_PATHS: dict[str, str] = {}
+def resolve_tool(name: str) -> str | None:
+    # Only hits are cached: tools such as pacstrap/arch-chroot may appear once pacman installs them mid-run
+    tool_path = _TOOL_PATHS.get(name)
+    if tool_path is None:
+        tool_path = shutil.which(name)
+        if tool_path: _TOOL_PATHS[name] = tool_path
+    return tool_path
+def _run_streaming(command: list[str] | str, text: bool = True, shell: bool = False, cwd: Path | str | None = None, env: dict | None = None, tail_bytes: int = 8192) -> subprocess.CompletedProcess:
+    # Echo output live and keep only the last tail_bytes of each stream for error reporting, so chatty commands stay flat in memory
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=shell, cwd=cwd, env=env)
+    tails = {process.stdout: collections.deque(maxlen=tail_bytes), process.stderr: collections.deque(maxlen=tail_bytes)}
+    sinks = {process.stdout: sys.stdout, process.stderr: sys.stderr}
+    with selectors.DefaultSelector() as selector:
+        for pipe in tails: selector.register(pipe, selectors.EVENT_READ)
+        while selector.get_map():
+            for key, _ in selector.select():
+                chunk = os.read(key.fd, 65536)
+                if not chunk: selector.unregister(key.fileobj); key.fileobj.close(); continue
+                tails[key.fileobj].extend(chunk); sink = sinks[key.fileobj]; sink.flush(); sink.buffer.write(chunk); sink.buffer.flush()
+    stdout, stderr = bytes(tails[process.stdout]), bytes(tails[process.stderr])
+    if text: stdout, stderr = stdout.decode(errors="replace"), stderr.decode(errors="replace")
+    return subprocess.CompletedProcess(command, process.wait(), stdout, stderr)
+
+@functools.lru_cache(maxsize=64)
+def _probe(cmd_tuple: tuple[str, ...]) -> subprocess.CompletedProcess | None:
+    # Memoized read-only probe; returns the whole CompletedProcess since callers test returncode as well as stdout
+    return run_command(list(cmd_tuple), capture_output=True, destructive=False, show_spinner=False, check=False)
+_STAT_CACHE: dict[str, os.stat_result | None] = {} # path -> stat result (None if missing); verification probes overlapping paths while the disk is quiescent
+def cached_stat(path: Path | str) -> os.stat_result | None:
+    key = os.fspath(path)
+    if key not in _STAT_CACHE:
+        try: _STAT_CACHE[key] = os.stat(key)
+        except (FileNotFoundError, NotADirectoryError): _STAT_CACHE[key] = None
+    return _STAT_CACHE[key]
+def path_exists(path: Path | str) -> bool: return cached_stat(path) is not None
+def path_is_dir(path: Path | str) -> bool: st = cached_stat(path); return st is not None and stat.S_ISDIR(st.st_mode)
+def invalidate_probes(): _probe.cache_clear(); _STAT_CACHE.clear() # Any destructive command may change what was probed
+def wait_process(process: subprocess.Popen | subprocess.CompletedProcess | None, check: bool = True) -> int:
+    if process is None: return 0 # Dry run: nothing was launched
+    if isinstance(process, subprocess.CompletedProcess): return process.returncode # Dry run with capture_output: already-finished mock
+    stdout, stderr = process.communicate()
+    cmd_str = ' '.join(process.args) if isinstance(process.args, list) else process.args
+    if stderr and process.returncode != 0: print_color(f"Stderr for '{cmd_str}':\n{stderr.strip()}", Colors.ORANGE, prefix=WARNING_SYMBOL)
+    if check and process.returncode != 0:
+        print_color(f"Command failed: {cmd_str}", Colors.RED, prefix=ERROR_SYMBOL, bold=True)
+        raise subprocess.CalledProcessError(process.returncode, process.args, output=stdout, stderr=stderr)
+    return process.returncode
+def start_background_pacman_sync():
+    if DRY_RUN_MODE or "pacman_sync" in _BG_TASKS: return
+    ensure_surface_repo() # Finalize pacman.conf first: a sync that predates the [linux-surface] entry would have to be redone
+    print_step_info("Syncing pacman databases in the background...")
+    _BG_TASKS["pacman_sync"] = run_command(["pacman", "-Sy"], capture_output=True, destructive=True, wait=False)
+def _reap_background_tasks():
+    for process in _BG_TASKS.values():
+        if process.poll() is not None: continue
+        process.send_signal(signal.SIGINT) # pacman releases db.lck on SIGINT/SIGHUP; SIGTERM would leave it behind
+        try: process.wait(timeout=30)
+        except subprocess.TimeoutExpired: process.kill(); process.wait()
+atexit.register(_reap_background_tasks)
 
 def make_dir_dry_run(path: Path, parents: bool = True, exist_ok: bool = True):
     if DRY_RUN_MODE: print_dry_run_command(f"mkdir {'-p ' if parents else ''}{path}")
     else: path.mkdir(parents=parents, exist_ok=exist_ok); print_color(f"Created directory: {path}", Colors.MINT)
+def print_content_preview(label: str, content: str):
+    print_color(f"--BEGIN CONTENT for {label}--", Colors.PEACH); print(content[:300] + ('...' if len(content) > 300 else '')); print_color(f"--END CONTENT for {label}--", Colors.PEACH)
 def write_file_dry_run(path: Path, content: str, mode: str = "w", sudo: bool = False):
     if DRY_RUN_MODE:
         print_dry_run_command(f"write to {path} (mode: {mode})")
-        print_color(f"--BEGIN CONTENT for {path}--", Colors.PEACH); print(content[:300] + ('...' if len(content) > 300 else '')); print_color(f"--END CONTENT for {path}--", Colors.PEACH)
+        print_content_preview(str(path), content)
     else:
         try:
             with open(path, mode) as f: f.write(content)
             print_color(f"Written to file: {path}", Colors.MINT)
         except Exception as e: print_color(f"Error writing to file {path}: {e}", Colors.RED, prefix=ERROR_SYMBOL); raise
-def unlink_file_dry_run(path: Path, missing_ok: bool = True):
+def write_files_dry_run(base: Path, files: list[tuple[Path, str, int]]):
+    # Lay down many small files in one tar extraction under base; missing parent directories are created on the way
     if DRY_RUN_MODE:
-        if path.exists() or (not missing_ok and not path.exists()): print_dry_run_command(f"delete file: {path}")
-    else:
-        try:
-            path.unlink(missing_ok=missing_ok); print_color(f"Deleted file: {path}", Colors.MINT)
-        except FileNotFoundError:
-            if not missing_ok: print_color(f"Error deleting file {path}: Not found.", Colors.RED, prefix=ERROR_SYMBOL); raise
-            else: print_color(f"File {path} not found, skipping deletion (missing_ok=True).", Colors.CYAN)
-        except Exception as e: print_color(f"Error deleting file {path}: {e}", Colors.RED, prefix=ERROR_SYMBOL); raise
+        for path, content, _ in files: write_file_dry_run(path, content)
+        return
+    tar_buffer = io.BytesIO(); now = time.time()
+    try:
+        with tarfile.open(fileobj=tar_buffer, mode="w") as tar:
+            for path, content, file_mode in files:
+                data = content.encode(); info = tarfile.TarInfo(str(path.relative_to(base))); info.size = len(data); info.mode = file_mode; info.mtime = now
+                tar.addfile(info, io.BytesIO(data))
+        tar_buffer.seek(0)
+        with tarfile.open(fileobj=tar_buffer, mode="r") as tar: tar.extractall(base, **({"filter": "data"} if hasattr(tarfile, "data_filter") else {}))
+        print_color(f"Written {len(files)} files under {base}: {', '.join(str(path.relative_to(base)) for path, _, _ in files)}", Colors.MINT)
+    except Exception as e: print_color(f"Error writing files under {base}: {e}", Colors.RED, prefix=ERROR_SYMBOL); raise
+STDIN_IS_TTY = sys.stdin is not None and sys.stdin.isatty()
+YES_NO_SUFFIXES = (f" [{Colors.LAVENDER}y/{Colors.PINK}N{Colors.LAVENDER}]", f" [{Colors.PINK}Y{Colors.LAVENDER}/n{Colors.LAVENDER}]")
+def read_reply(prompt_text: str) -> str:
+    if STDIN_IS_TTY: return input(prompt_text)
+    sys.stdout.write(prompt_text); sys.stdout.flush() # Piped replays: skip input()'s per-call tty probing
+    line = sys.stdin.readline()
+    if not line: raise EOFError
+    return line.rstrip("\n")
 def prompt_yes_no(question: str, default_yes: bool = False) -> bool:
-    suffix = f" [{Colors.PINK}Y{Colors.LAVENDER}/n{Colors.LAVENDER}]" if default_yes else f" [{Colors.LAVENDER}y/{Colors.PINK}N{Colors.LAVENDER}]"
+    prompt_text = f"{Colors.LAVENDER}{question}{YES_NO_SUFFIXES[default_yes]}: {Colors.RESET}"
     while True:
-        reply = input(f"{Colors.LAVENDER}{question}{suffix}: {Colors.RESET}").strip().lower()
+        reply = read_reply(prompt_text).strip().lower()
         if not reply: return default_yes
-        if reply in ['y', 'yes']: return True
-        if reply in ['n', 'no']: return False
+        if reply in ('y', 'yes'): return True
+        if reply in ('n', 'no'): return False
         print_color("Invalid input. Please enter 'y' or 'n'.", Colors.ORANGE, prefix=WARNING_SYMBOL)
 def prompt_input(question: str, default: str | None = None, validator=None, sensitive: bool = False) -> str:
     suffix = f" (default: {Colors.CYAN}{default}{Colors.MINT})" if default and not sensitive else ""
     prompt_text = f"{Colors.MINT}{question}{suffix}: {Colors.RESET}"
     while True:
-        reply = input(prompt_text).strip() if not sensitive else input(prompt_text) 
+        reply = read_reply(prompt_text).strip() if not sensitive else read_reply(prompt_text) 
         if reply:
-            if validator and not validator(reply): continue
+            if validator is not None and not validator(reply): continue
             return reply
         if default is not None:
-            if validator and not validator(default): print_color("Default value is invalid, this is a script bug.", Colors.RED, prefix=ERROR_SYMBOL); sys.exit(1)
+            if validator is not None and not validator(default): print_color("Default value is invalid, this is a script bug.", Colors.RED, prefix=ERROR_SYMBOL); sys.exit(1)
             return default
         print_color("Input cannot be empty.", Colors.ORANGE, prefix=WARNING_SYMBOL)
 def verify_step(success: bool, message: str, critical: bool = True, max_retries: int = 1, retry_delay: float = 2.0, retry_func=None):
@@ -280,7 +487,7 @@ def gather_initial_config():
     print_section_header("Gathering System Configuration")
     
     # Only prompt for target_drive
-    USER_CONFIG["target_drive"] = select_drive()
+    USER_CONFIG["target_drive"] = select_drive(); refresh_layout()
     
     # Use defaults for other settings, but ensure they are correctly typed if loaded from JSON
     # For example, swap_size_gb should be a string representation of an int.
@@ -297,19 +504,61 @@ def gather_initial_config():
     print_color(f"Using disk swap size: {USER_CONFIG['swap_size_gb']}GB (default)", Colors.CYAN)
     print_color(f"Using ZRAM fraction: {USER_CONFIG['zram_fraction']} (default)", Colors.CYAN)
     print_color(f"Adding Chaotic-AUR: {'Yes' if USER_CONFIG['add_chaotic_aur'] else 'No'} (default)", Colors.CYAN)
+    print_color(f"Using GPG key algorithm: {USER_CONFIG['gpg_key_algo']} (default)", Colors.CYAN)
 
     print_color("Initial configuration set (mostly defaults).", Colors.GREEN, prefix=SUCCESS_SYMBOL)
-    CURRENT_STEP = INSTALL_STEPS.index("prepare_environment")
+    CURRENT_STEP = STEP_IDX["prepare_environment"]
     save_progress() # Save USER_CONFIG with the selected target_drive
     print("")
 
+def format_size(size_bytes: int) -> str: # Mirrors lsblk's human-readable SIZE column
+    size = float(size_bytes)
+    for unit in ["B", "K", "M", "G", "T", "P"]:
+        if size < 1024 or unit == "P": break
+        size /= 1024
+    return f"{int(size)}{unit}" if size == int(size) else f"{size:.1f}{unit}"
+def list_drives_sysfs() -> list[dict]:
+    drives = []
+    try: block_devs = sorted(Path("/sys/block").iterdir())
+    except OSError: return drives
+    for dev in block_devs:
+        try:
+            if "/virtual/" in str(dev.resolve()) and not dev.name.startswith("loop"): continue # zram, ram, dm-*, etc.
+            sectors = int((dev / "size").read_text()); read_only = (dev / "ro").read_text().strip() == "1"
+            if sectors == 0 or read_only: continue
+            model_path = dev / "device/model"; model = model_path.read_text().strip() if model_path.exists() else ""
+            if (dev / "removable").read_text().strip() == "1": model = f"{model} (removable)".strip()
+            drives.append({"name": f"/dev/{dev.name}", "size": format_size(sectors * 512), "model": model or "N/A"}) # sysfs size is in 512-byte sectors
+        except (OSError, ValueError): continue
+    return drives
+def read_proc_mounts() -> dict[str, str]: # mountpoint -> source, parsed from /proc/self/mountinfo
+    mounts = {}
+    try: mountinfo = Path("/proc/self/mountinfo").read_text()
+    except OSError: return mounts
+    for line in mountinfo.splitlines():
+        fields = line.split()
+        if len(fields) < 10 or "-" not in fields[6:]: continue
+        sep = fields.index("-", 6); mounts[fields[4].replace("\\040", " ")] = fields[sep + 2] if len(fields) > sep + 2 else ""
+    return mounts
+def list_dir_names(path: str) -> set[str]:
+    try:
+        with os.scandir(path) as it: return {entry.name for entry in it}
+    except (FileNotFoundError, NotADirectoryError): return set()
+def scan_dir(path: str) -> dict[str, os.DirEntry]:
+    # DirEntry.is_file()/is_dir() answer from the d_type getdents already returned, so checks against the result cost no extra stat
+    try:
+        with os.scandir(path) as it: return {entry.name: entry for entry in it}
+    except (FileNotFoundError, NotADirectoryError): return {}
+def read_proc_swaps() -> list[str]:
+    try: return [line.split()[0].replace("\\040", " ") for line in Path("/proc/swaps").read_text().splitlines()[1:] if line.strip()]
+    except OSError: return []
 def select_drive() -> str: 
     print_step_info("Detecting available drives...")
     try:
-        lsblk_process = run_command(["lsblk", "-dnpo", "NAME,SIZE,MODEL"], capture_output=True, destructive=False, show_spinner=False)
-        lsblk_output = lsblk_process.stdout if lsblk_process else ""
-        drives = []
-        if lsblk_output:
+        drives = list_drives_sysfs()
+        if not drives: # Fall back to lsblk if sysfs is unavailable or yields nothing
+            lsblk_process = _probe(("lsblk", "-dnpo", "NAME,SIZE,MODEL"))
+            lsblk_output = lsblk_process.stdout if lsblk_process else ""
             header_skipped = False
             for line in lsblk_output.strip().split('\n'):
                 if not header_skipped and "NAME" in line and "SIZE" in line: header_skipped = True; continue
@@ -340,7 +589,7 @@ def display_summary_and_confirm():
     # Ensure all USER_CONFIG values are strings for display if they might be other types (like bool for add_chaotic_aur)
     summary_user_config = {k: (str(v).lower() if isinstance(v, bool) else str(v)) for k, v in USER_CONFIG.items()}
 
-    summary_items = [("User", summary_user_config['username'], BAO_PASSWORD[:2] + "** (hardcoded)"), ("Root Password", ROOT_PASSWORD[:2] + "** (hardcoded, login will be disabled)", ""),
+    summary_items = [("User", summary_user_config['username'], BAO_PASSWORD.plaintext[:2] + "** (hardcoded)"), ("Root Password", ROOT_PASSWORD.plaintext[:2] + "** (hardcoded, login will be disabled)", ""),
         ("Hostname", summary_user_config['hostname'], ""), ("Target Drive", summary_user_config['target_drive'], Colors.BOLD + Colors.PINK), ("EFI Partition Size", summary_user_config['efi_partition_size'], ""),
         ("Disk Swap Size", f"{summary_user_config['swap_size_gb']}GB", "LVM LV, resizable post-install" if float(summary_user_config['swap_size_gb']) > 0 else "None (ZRAM only)"),
         ("ZRAM Fraction", f"{summary_user_config['zram_fraction']} (of total RAM)", ""), ("LVM VG Name", summary_user_config['lvm_vg_name'], ""),
@@ -359,56 +608,95 @@ def display_summary_and_confirm():
     print_color("Proceeding with installation...", Colors.GREEN, prefix=PROGRESS_SYMBOL); print("")
 def prepare_live_environment(): 
     global CURRENT_STEP; print_section_header("Preparing Live Environment")
-    if CURRENT_STEP > INSTALL_STEPS.index("prepare_environment"): print_step_info("Skipping (already completed)"); print(""); return
+    if CURRENT_STEP > STEP_IDX["prepare_environment"]: print_step_info("Skipping (already completed)"); print(""); return
     if not check_internet_connection() and not DRY_RUN_MODE:
         if not prompt_yes_no("Internet connection check failed. Continue anyway?", default_yes=False): sys.exit(1)
-    run_command(["pacman", "-S", "--noconfirm", "--needed", "curl", "arch-install-scripts"], destructive=True, custom_spinner_message="Installing essential tools")
-    pacman_conf_path = Path("/etc/pacman.conf"); surface_repo_header = "[linux-surface]"; surface_repo_entry = f"\n{surface_repo_header}\nServer = https://pkg.surfacelinux.com/arch/\n"
-    if DRY_RUN_MODE: print_dry_run_command(f"ensure {surface_repo_header} in {pacman_conf_path}")
+    sync_proc = _BG_TASKS.pop("pacman_sync", None) # pacman holds the db lock, so the early sync must finish before pacman -S
+    dbs_synced = sync_proc is not None and wait_process(sync_proc, check=False) == 0
+    essential_tools_cmd = ["pacman", "-S", "--noconfirm", "--needed", "curl", "arch-install-scripts"]
+    surface_key_fetch_cmd = ["curl", "-s", "-o", str(SURFACE_KEY_TMP_PATH), SURFACE_KEY_URL]
+    if DRY_RUN_MODE: # Serialize in dry run so the log stays deterministic
+        run_command(essential_tools_cmd, destructive=True, custom_spinner_message="Installing essential tools")
+        print_step_info("Fetching linux-surface GPG key..."); run_command(surface_key_fetch_cmd, destructive=True)
+        conf_changed = ensure_surface_repo()
     else:
+        # The tools install, the key download and the pacman.conf edit are independent: overlap them
+        print_step_info("Installing essential tools and fetching linux-surface GPG key in parallel...")
+        tools_proc = run_command(essential_tools_cmd, destructive=True, wait=False)
+        key_fetch_proc = run_command(surface_key_fetch_cmd, destructive=True, wait=False)
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            repo_future = pool.submit(ensure_surface_repo); pending = [pool.submit(wait_process, tools_proc), pool.submit(wait_process, key_fetch_proc), repo_future]
+            for future in pending: future.result() # Re-raises CalledProcessError from either command
+            conf_changed = repo_future.result()
+    surface_key_cmds = [f"pacman-key --add {shlex.quote(str(SURFACE_KEY_TMP_PATH))}", f"pacman-key --lsign-key {SURFACE_KEY_ID}"]
+    if conf_changed or not dbs_synced: surface_key_cmds.append("pacman -Sy") # No early sync (dry run or resumed run), it failed, or the repo entry only landed now
+    print_step_info("Adding linux-surface GPG key to live environment" + (" and syncing pacman databases..." if "pacman -Sy" in surface_key_cmds else "..."))
+    if DRY_RUN_MODE: # Keep one line per command so the dry-run log stays readable
+        for cmd in surface_key_cmds: print_dry_run_command(cmd)
+    else: run_command(" && ".join(surface_key_cmds), shell=True, allow_shell=True, destructive=True, stream=True)
+    print_color("Live environment prepared.", Colors.GREEN, prefix=SUCCESS_SYMBOL); CURRENT_STEP = STEP_IDX["partition_format"]; save_progress(); print("")
+PACMAN_CONF_PATH = Path("/etc/pacman.conf")
+_PACMAN_CONF_SECTIONS: set[str] | None = None # Bracketed headers of PACMAN_CONF_PATH, read once and kept in step with our appends
+def _load_pacman_conf_sections() -> set[str]:
+    global _PACMAN_CONF_SECTIONS
+    if _PACMAN_CONF_SECTIONS is None:
         try:
-            content = pacman_conf_path.read_text() if pacman_conf_path.exists() else ""
-            if surface_repo_header not in content:
-                with open(pacman_conf_path, "a") as f: f.write(surface_repo_entry)
-                print_color(f"Appended {surface_repo_header} to {pacman_conf_path}", Colors.MINT)
-            else: print_color(f"{surface_repo_header} already in {pacman_conf_path}", Colors.CYAN)
-        except Exception as e: print_color(f"Error updating {pacman_conf_path}: {e}", Colors.ORANGE, prefix=WARNING_SYMBOL)
-    print_step_info("Adding linux-surface GPG key to live environment...")
-    run_command("curl -s https://raw.githubusercontent.com/linux-surface/linux-surface/master/pkg/keys/surface.asc | pacman-key --add -", shell=True, destructive=True)
-    run_command(["pacman-key", "--lsign-key", "56C464BAAC421453"], destructive=True) 
-    print_step_info("Syncing pacman databases..."); run_command(["pacman", "-Sy"], destructive=True)
-    print_color("Live environment prepared.", Colors.GREEN, prefix=SUCCESS_SYMBOL); CURRENT_STEP = INSTALL_STEPS.index("partition_format"); save_progress(); print("")
+            with open(PACMAN_CONF_PATH) as f: _PACMAN_CONF_SECTIONS = {line.strip() for line in f if line.lstrip().startswith("[")}
+        except FileNotFoundError: _PACMAN_CONF_SECTIONS = set()
+    return _PACMAN_CONF_SECTIONS
+def _ensure_pacman_section(header: str, entry: str) -> bool:
+    sections = _load_pacman_conf_sections()
+    if header in sections: return False
+    with open(PACMAN_CONF_PATH, "a") as f: f.write(entry)
+    sections.add(header); return True
+def ensure_surface_repo() -> bool: # True if pacman.conf gained the repo (so the databases need a re-sync)
+    surface_repo_header = "[linux-surface]"; surface_repo_entry = f"\n{surface_repo_header}\nServer = https://pkg.surfacelinux.com/arch/\n"
+    if DRY_RUN_MODE: print_dry_run_command(f"ensure {surface_repo_header} in {PACMAN_CONF_PATH}"); return True
+    try:
+        if _ensure_pacman_section(surface_repo_header, surface_repo_entry): print_color(f"Appended {surface_repo_header} to {PACMAN_CONF_PATH}", Colors.MINT); return True
+        print_color(f"{surface_repo_header} already in {PACMAN_CONF_PATH}", Colors.CYAN)
+    except Exception as e: print_color(f"Error updating {PACMAN_CONF_PATH}: {e}", Colors.ORANGE, prefix=WARNING_SYMBOL)
+    return False
 def check_internet_connection() -> bool: 
     print_step_info("Checking internet connection...")
-    try: run_command(["ping", "-c", "1", "archlinux.org"], capture_output=True, destructive=False, show_spinner=False, check=True); print_color("Internet connection active.", Colors.GREEN, prefix=SUCCESS_SYMBOL); return True
-    except subprocess.CalledProcessError: print_color("Internet check failed.", Colors.RED, prefix=ERROR_SYMBOL); return False
-    except FileNotFoundError: print_color("`ping` not found. Assuming connected (cannot verify).", Colors.ORANGE, prefix=WARNING_SYMBOL); return True
+    try: socket.create_connection(("archlinux.org", 443), timeout=3).close(); print_color("Internet connection active.", Colors.GREEN, prefix=SUCCESS_SYMBOL); return True # TCP/443 works where ICMP is filtered, and needs no fork
+    except OSError as e: print_color(f"Internet check failed ({e}).", Colors.RED, prefix=ERROR_SYMBOL); return False
+def flush_disks():
+    if DRY_RUN_MODE: print_dry_run_command("sync"); return
+    os.sync() # Same syscall /bin/sync makes, without the fork+exec
+def settle_udev(timeout: int = 10) -> bool:
+    # Returns as soon as the uevent queue drains; only sleeps when udevadm itself is unavailable or times out
+    try: settle_proc = run_command(["udevadm", "settle", f"--timeout={timeout}"], check=False, destructive=False, show_spinner=False)
+    except FileNotFoundError: settle_proc = None
+    if settle_proc is not None and settle_proc.returncode == 0: return True
+    time.sleep(1); return False
 def check_and_free_device(device_path_str: str): 
     print_step_info(f"Ensuring {device_path_str} and its partitions are free..."); device_path = Path(device_path_str)
     mnt_base = Path("/mnt"); explicit_unmount_targets = [ mnt_base / "boot/efi", mnt_base / "boot", mnt_base / "home", mnt_base / "var", mnt_base / ".snapshots", mnt_base ]
-    for target_path in explicit_unmount_targets:
-        findmnt_check = run_command(["findmnt", "-n", "-r", "-o", "TARGET", "--target", str(target_path)], capture_output=True, destructive=False, show_spinner=False, check=False)
-        if findmnt_check and findmnt_check.returncode == 0 and str(target_path) in findmnt_check.stdout.strip():
-            print_color(f"Attempting to unmount {target_path} (lazy)...", Colors.BLUE); run_command(["umount", "-fl", str(target_path)], check=False, destructive=True, show_spinner=False, retry_count=3, retry_delay=1.5)
-    swapon_proc = run_command(["swapon", "--show=NAME,TYPE"], capture_output=True, destructive=False, show_spinner=False, check=False)
-    if swapon_proc and swapon_proc.stdout:
-        for line in swapon_proc.stdout.strip().split('\n')[1:]:
-            parts = line.split()
-            if parts and Path(parts[0]).resolve().is_relative_to(device_path.resolve()): 
-                print_color(f"Deactivating swap on {parts[0]}...", Colors.BLUE); run_command(["swapoff", parts[0]], check=False, destructive=True)
-    target_vg_name = USER_CONFIG.get('lvm_vg_name'); sfx_func = lambda p_num: "p" + str(p_num) if "nvme" in USER_CONFIG['target_drive'] or "loop" in USER_CONFIG['target_drive'] else str(p_num)
-    lvm_partition_device_str = f"{USER_CONFIG['target_drive']}{sfx_func(2)}" 
+    if any(mount_point == str(mnt_base) or mount_point.startswith(f"{mnt_base}/") for mount_point in read_proc_mounts()):
+        print_color(f"Attempting recursive unmount of {mnt_base}...", Colors.BLUE)
+        umount_proc = run_command(["umount", "-R", str(mnt_base)], check=False, destructive=True, show_spinner=False, retry_count=2)
+        if not DRY_RUN_MODE and not (umount_proc and umount_proc.returncode == 0):
+            active_mounts = read_proc_mounts() # Re-read once; umount -R may have released some targets before failing
+            for target_path in explicit_unmount_targets:
+                if str(target_path) in active_mounts:
+                    print_color(f"Attempting to unmount {target_path} (lazy)...", Colors.BLUE); run_command(["umount", "-fl", str(target_path)], check=False, destructive=True, show_spinner=False, retry_count=3, retry_delay=1.5)
+    for swap_dev in read_proc_swaps():
+        if Path(swap_dev).resolve().is_relative_to(device_path.resolve()): 
+            print_color(f"Deactivating swap on {swap_dev}...", Colors.BLUE); run_command(["swapoff", swap_dev], check=False, destructive=True)
+    target_vg_name = USER_CONFIG.get('lvm_vg_name')
+    lvm_partition_device_str = LAYOUT.lvm_part_dev
     if target_vg_name:
-        vgdisplay_proc = run_command(["vgdisplay", target_vg_name], check=False, destructive=False, capture_output=True, show_spinner=False)
+        vgdisplay_proc = _probe(("vgdisplay", target_vg_name))
         if vgdisplay_proc and vgdisplay_proc.returncode == 0:
             print_color(f"Volume group {target_vg_name} exists. Attempting deactivation...", Colors.BLUE)
+            vg_entries = list_dir_names(f"/dev/{target_vg_name}"); mapper_entries = list_dir_names("/dev/mapper") # One getdents each instead of a stat per LV path
             for lv_name_key in ["lvm_lv_root_name", "lvm_lv_swap_name"]:
                 lv_name = USER_CONFIG.get(lv_name_key)
                 if lv_name:
-                    lv_path_vg = f"/dev/{target_vg_name}/{lv_name}"; lv_path_map = f"/dev/mapper/{target_vg_name}-{lv_name}"
-                    if Path(lv_path_vg).exists() or Path(lv_path_map).exists():
+                    if lv_name in vg_entries or f"{target_vg_name}-{lv_name}" in mapper_entries:
                          print_color(f"Deactivating LV: {lv_name}...", Colors.BLUE); run_command(["lvchange", "-an", f"{target_vg_name}/{lv_name}"], check=False, destructive=True, show_spinner=False, retry_count=2)
-            run_command(["sync"], check=False, destructive=False, show_spinner=False); time.sleep(1)
+            flush_disks(); time.sleep(1)
             vgchange_proc = run_command(["vgchange", "-an", target_vg_name], check=False, destructive=True, capture_output=True, show_spinner=False, retry_count=2)
             if not (vgchange_proc and vgchange_proc.returncode == 0):
                 print_color(f"Failed to deactivate VG {target_vg_name}. Attempting forceful removal...", Colors.ORANGE, prefix=WARNING_SYMBOL)
@@ -418,37 +706,43 @@ def check_and_free_device(device_path_str: str):
         elif Path(lvm_partition_device_str).exists(): 
              print_color(f"VG {target_vg_name} not found. Checking for PV signatures on {lvm_partition_device_str}...", Colors.CYAN)
              run_command(["pvremove", "--force", "--force", "-y", lvm_partition_device_str], check=False, destructive=True, show_spinner=False)
-    run_command(["sync"], check=False, destructive=False, show_spinner=False); print_color("Pausing for 3 seconds after deactivation attempts...", Colors.BLUE); time.sleep(3)
+    flush_disks(); print_color("Waiting for udev to settle after deactivation attempts...", Colors.BLUE); settle_udev(10)
     print_step_info(f"Device {device_path_str} freeing attempts complete."); print("")
 def partition_and_format(): 
     global CURRENT_STEP; print_section_header(f"Partitioning & Formatting {USER_CONFIG['target_drive']}")
-    if CURRENT_STEP > INSTALL_STEPS.index("partition_format"): print_step_info("Skipping (already completed)"); print(""); return
+    if CURRENT_STEP > STEP_IDX["partition_format"]: print_step_info("Skipping (already completed)"); print(""); return
     drive = USER_CONFIG['target_drive']
     if not drive: print_color("Target drive not set. Aborting partition_and_format.", Colors.RED, prefix=ERROR_SYMBOL); sys.exit(1)
     check_and_free_device(drive) 
-    sfx = lambda p: "p" + str(p) if "nvme" in drive or "loop" in drive else str(p)
-    efi_part_dev = f"{drive}{sfx(1)}"; lvm_part_dev = f"{drive}{sfx(2)}"
+    efi_part_dev = LAYOUT.efi_part_dev; lvm_part_dev = LAYOUT.lvm_part_dev
     print_step_info(f"Wiping device signatures on {drive}..."); run_command(["wipefs", "-a", drive], destructive=True, check=True)
     print_step_info(f"Creating new GPT partition table on {drive}..."); run_command(["sgdisk", "-Zo", drive], destructive=True, check=True)
     print_step_info(f"Creating EFI partition ({USER_CONFIG['efi_partition_size']})..."); run_command(["sgdisk", f"-n=1:0:+{USER_CONFIG['efi_partition_size']}", "-t=1:ef00", f"-c=1:EFI System Partition", drive], destructive=True, check=True)
     print_step_info("Creating LVM partition (remaining space)..."); run_command(["sgdisk", "-n=2:0:0", "-t=2:8e00", f"-c=2:Linux LVM", drive], destructive=True, check=True)
     print_step_info("Informing kernel of partition table changes..."); run_command(["partprobe", drive], check=False, destructive=True) 
     if not DRY_RUN_MODE:
-        time.sleep(3) 
-        if not Path(efi_part_dev).exists() or not Path(lvm_part_dev).exists():
-            print_color(f"Partitions {efi_part_dev} or {lvm_part_dev} not detected after partprobe. Retrying udev.", Colors.ORANGE, prefix=WARNING_SYMBOL)
-            run_command(["udevadm", "settle"], destructive=False, check=False); run_command(["udevadm", "trigger"], destructive=False, check=False); time.sleep(3)
-            if not Path(efi_part_dev).exists() or not Path(lvm_part_dev).exists(): print_color(f"CRITICAL: Partitions still not detected on {drive}.", Colors.RED, prefix=ERROR_SYMBOL); sys.exit(1)
+        for attempt in range(20): # Poll the device nodes, letting udev settle between looks instead of sleeping blind
+            if Path(efi_part_dev).exists() and Path(lvm_part_dev).exists(): break
+            if attempt == 10:
+                print_color(f"Partitions {efi_part_dev} or {lvm_part_dev} not detected after partprobe. Retrying udev.", Colors.ORANGE, prefix=WARNING_SYMBOL)
+                run_command(["udevadm", "trigger"], destructive=False, check=False, show_spinner=False)
+            settle_udev(1)
+        else: print_color(f"CRITICAL: Partitions still not detected on {drive}.", Colors.RED, prefix=ERROR_SYMBOL); sys.exit(1)
         print_color("Partitions detected.", Colors.MINT)
-    print_step_info(f"Formatting EFI partition {efi_part_dev} as FAT32..."); run_command(["mkfs.vfat", "-F32", efi_part_dev], destructive=True, check=True)
     print_step_info(f"Wiping any old signatures on LVM partition {lvm_part_dev}..."); run_command(["wipefs", "-a", lvm_part_dev], destructive=True, check=True, retry_count=2) 
     print_step_info("Setting up LVM..."); run_command(["pvcreate", "--yes", lvm_part_dev], destructive=True, check=True); run_command(["vgcreate", USER_CONFIG['lvm_vg_name'], lvm_part_dev], destructive=True, check=True)
-    lv_root_path_str = f"/dev/{USER_CONFIG['lvm_vg_name']}/{USER_CONFIG['lvm_lv_root_name']}"
+    lv_root_path_str = LAYOUT.lv_root
     if float(USER_CONFIG['swap_size_gb']) > 0:
         print_step_info(f"Creating SWAP LV ({USER_CONFIG['swap_size_gb']}G)..."); run_command(["lvcreate", "-L", f"{USER_CONFIG['swap_size_gb']}G", "-n", USER_CONFIG['lvm_lv_swap_name'], USER_CONFIG['lvm_vg_name']], destructive=True, check=True)
-        lv_swap_path_str = f"/dev/{USER_CONFIG['lvm_vg_name']}/{USER_CONFIG['lvm_lv_swap_name']}"; print_step_info(f"Formatting SWAP LV {lv_swap_path_str}..."); run_command(["mkswap", lv_swap_path_str], destructive=True, check=True)
     print_step_info("Creating ROOT LV (100%FREE)..."); run_command(["lvcreate", "-l", "100%FREE", "-n", USER_CONFIG['lvm_lv_root_name'], USER_CONFIG['lvm_vg_name']], destructive=True, check=True)
-    print_step_info(f"Formatting ROOT LV {lv_root_path_str} as Btrfs..."); run_command(["mkfs.btrfs", "-f", lv_root_path_str], destructive=True, check=True) 
+    mkfs_cmds = [["mkfs.vfat", "-F32", efi_part_dev], ["mkfs.btrfs", "-f", lv_root_path_str]] # Independent block devices: format them side by side
+    if float(USER_CONFIG['swap_size_gb']) > 0: mkfs_cmds.append(["mkswap", LAYOUT.lv_swap])
+    print_step_info(f"Formatting EFI partition {efi_part_dev} (FAT32), ROOT LV {lv_root_path_str} (Btrfs)" + (" and SWAP LV" if len(mkfs_cmds) > 2 else "") + " concurrently...")
+    mkfs_procs = [run_command(cmd, capture_output=True, destructive=True, wait=False) for cmd in mkfs_cmds]; mkfs_errors = []
+    for mkfs_proc in mkfs_procs: # Reap every job before surfacing the first failure
+        try: wait_process(mkfs_proc)
+        except subprocess.CalledProcessError as e: mkfs_errors.append(e)
+    if mkfs_errors: raise mkfs_errors[0]
     mnt_temp_btrfs = Path("/mnt/.btrfs_setup_temp"); print_step_info(f"Temporarily mounting {lv_root_path_str} to {mnt_temp_btrfs} for subvolume creation...")
     make_dir_dry_run(mnt_temp_btrfs, parents=True, exist_ok=True); run_command(["mount", lv_root_path_str, str(mnt_temp_btrfs)], destructive=True, check=True)
     print_step_info("Creating Btrfs subvolumes...")
@@ -458,39 +752,44 @@ def partition_and_format():
     if not DRY_RUN_MODE:
         try: mnt_temp_btrfs.rmdir() 
         except OSError as e: print_color(f"Warning: Could not remove temp dir {mnt_temp_btrfs}: {e}", Colors.ORANGE)
-    print_color("Partitioning & formatting complete.", Colors.GREEN, prefix=SUCCESS_SYMBOL); CURRENT_STEP = INSTALL_STEPS.index("mount_filesystems"); save_progress(); print("")
+    print_color("Partitioning & formatting complete.", Colors.GREEN, prefix=SUCCESS_SYMBOL); CURRENT_STEP = STEP_IDX["mount_filesystems"]; save_progress(); print("")
+async def _lsblk_fstype(device: str) -> str | None:
+    try: proc = await asyncio.create_subprocess_exec("lsblk", "-fno", "FSTYPE", device, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    except FileNotFoundError: return None
+    stdout, _ = await proc.communicate()
+    return stdout.decode().strip() if proc.returncode == 0 else None
+async def gather_fstypes(devices: list[str]) -> list[str | None]: return await asyncio.gather(*(_lsblk_fstype(device) for device in devices))
 def verify_partitions_lvm(no_verify_arg: bool): 
     if no_verify_arg: print_step_info("Skipping partition & LVM verification as per --no-verify."); print(""); return
     print_section_header("Verifying Partitions and LVM")
-    if CURRENT_STEP <= INSTALL_STEPS.index("partition_format"): print_color("Verification running before its intended step, results might be inaccurate.", Colors.ORANGE, prefix=WARNING_SYMBOL)
-    drive = USER_CONFIG['target_drive']; sfx = lambda p: "p"+str(p) if "nvme" in drive or "loop" in drive else str(p)
-    efi_part_dev = f"{drive}{sfx(1)}"; lvm_part_dev = f"{drive}{sfx(2)}"; lv_root_path = Path(f"/dev/{USER_CONFIG['lvm_vg_name']}/{USER_CONFIG['lvm_lv_root_name']}")
+    if CURRENT_STEP <= STEP_IDX["partition_format"]: print_color("Verification running before its intended step, results might be inaccurate.", Colors.ORANGE, prefix=WARNING_SYMBOL)
+    efi_part_dev = LAYOUT.efi_part_dev; lvm_part_dev = LAYOUT.lvm_part_dev; lv_root_path = Path(LAYOUT.lv_root)
     all_ok = True
-    if not verify_step(Path(efi_part_dev).exists() if not DRY_RUN_MODE else True, f"EFI partition {efi_part_dev} exists", critical=True): all_ok = False
-    if not verify_step(Path(lvm_part_dev).exists() if not DRY_RUN_MODE else True, f"LVM partition {lvm_part_dev} exists", critical=True): all_ok = False
-    if not verify_step(lv_root_path.exists() if not DRY_RUN_MODE else True, f"Root LV {lv_root_path} exists", critical=True): all_ok = False
+    if not verify_step(path_exists(efi_part_dev) if not DRY_RUN_MODE else True, f"EFI partition {efi_part_dev} exists", critical=True): all_ok = False
+    if not verify_step(path_exists(lvm_part_dev) if not DRY_RUN_MODE else True, f"LVM partition {lvm_part_dev} exists", critical=True): all_ok = False
+    if not verify_step(path_exists(lv_root_path) if not DRY_RUN_MODE else True, f"Root LV {lv_root_path} exists", critical=True): all_ok = False
     if float(USER_CONFIG['swap_size_gb']) > 0:
-        lv_swap_path = Path(f"/dev/{USER_CONFIG['lvm_vg_name']}/{USER_CONFIG['lvm_lv_swap_name']}")
-        if not verify_step(lv_swap_path.exists() if not DRY_RUN_MODE else True, f"Swap LV {lv_swap_path} exists", critical=True): all_ok = False
-    def check_fstype(device, expected_fstype):
-        if DRY_RUN_MODE: return True
-        if not Path(device).exists(): print_color(f"Device {device} not found for fstype check.", Colors.ORANGE, prefix=WARNING_SYMBOL); return False
-        proc = run_command(["lsblk", "-fno", "FSTYPE", device], capture_output=True, destructive=False, show_spinner=False, check=False)
-        return proc and proc.returncode == 0 and expected_fstype in proc.stdout.strip()
-    if not verify_step(check_fstype(efi_part_dev, "vfat"), f"EFI partition {efi_part_dev} has FSTYPE vfat", critical=True): all_ok = False
-    if not verify_step(check_fstype(str(lv_root_path), "btrfs"), f"Root LV {lv_root_path.name} has FSTYPE btrfs", critical=True): all_ok = False
+        lv_swap_path = Path(LAYOUT.lv_swap)
+        if not verify_step(path_exists(lv_swap_path) if not DRY_RUN_MODE else True, f"Swap LV {lv_swap_path} exists", critical=True): all_ok = False
+    fstype_checks = [(efi_part_dev, "vfat", f"EFI partition {efi_part_dev} has FSTYPE vfat"), (str(lv_root_path), "btrfs", f"Root LV {lv_root_path.name} has FSTYPE btrfs")]
     if float(USER_CONFIG['swap_size_gb']) > 0:
-        lv_swap_path_str = f"/dev/{USER_CONFIG['lvm_vg_name']}/{USER_CONFIG['lvm_lv_swap_name']}"
-        if not verify_step(check_fstype(lv_swap_path_str, "swap"), f"Swap LV {USER_CONFIG['lvm_lv_swap_name']} has FSTYPE swap", critical=True): all_ok = False
+        fstype_checks.append((LAYOUT.lv_swap, "swap", f"Swap LV {USER_CONFIG['lvm_lv_swap_name']} has FSTYPE swap"))
+    if DRY_RUN_MODE: fstypes = {device: expected for device, expected, _ in fstype_checks}
+    else:
+        present_devices = [device for device, _, _ in fstype_checks if path_exists(device)] # Answered from the stats just above
+        for device in {device for device, _, _ in fstype_checks} - set(present_devices): print_color(f"Device {device} not found for fstype check.", Colors.ORANGE, prefix=WARNING_SYMBOL)
+        print_step_info(f"Querying filesystem types of {len(present_devices)} device(s) concurrently...")
+        fstypes = dict(zip(present_devices, asyncio.run(gather_fstypes(present_devices)))) # One lsblk per device, all in flight at once
+    for device, expected_fstype, message in fstype_checks:
+        if not verify_step(expected_fstype in (fstypes.get(device) or ""), message, critical=True): all_ok = False
     if all_ok: print_color("Partition and LVM verification successful.", Colors.GREEN, prefix=SUCCESS_SYMBOL)
     else: print_color("One or more partition/LVM verifications failed.", Colors.RED, prefix=ERROR_SYMBOL)
     print("")
 def mount_filesystems():
     global CURRENT_STEP; print_section_header("Mounting Filesystems")
-    if CURRENT_STEP > INSTALL_STEPS.index("mount_filesystems"): print_step_info("Skipping (already completed)"); print(""); return
-    mnt_base = Path("/mnt"); lv_root_path_str = f"/dev/{USER_CONFIG['lvm_vg_name']}/{USER_CONFIG['lvm_lv_root_name']}"
-    sfx = "p1" if "nvme" in USER_CONFIG['target_drive'] or "loop" in USER_CONFIG['target_drive'] else "1"
-    efi_part_path_str = f"{USER_CONFIG['target_drive']}{sfx}"; btrfs_mount_opts = USER_CONFIG["btrfs_mount_options"]
+    if CURRENT_STEP > STEP_IDX["mount_filesystems"]: print_step_info("Skipping (already completed)"); print(""); return
+    mnt_base = Path("/mnt"); lv_root_path_str = LAYOUT.lv_root
+    efi_part_path_str = LAYOUT.efi_part_dev; btrfs_mount_opts = LAYOUT.btrfs_opts
     print_step_info(f"Mounting Btrfs ROOT subvolume '{USER_CONFIG['btrfs_subvol_root']}' to {mnt_base}..."); run_command(["mount", "-o", f"subvol=/{USER_CONFIG['btrfs_subvol_root']},{btrfs_mount_opts}", lv_root_path_str, str(mnt_base)], check=True)
     print_step_info("Creating standard mount point directories under /mnt...")
     for subdir in ["boot", "boot/efi", "home", "var", ".snapshots"]: make_dir_dry_run(mnt_base / subdir, exist_ok=True)
@@ -498,19 +797,25 @@ def mount_filesystems():
     print_step_info(f"Mounting Btrfs VAR subvolume '{USER_CONFIG['btrfs_subvol_var']}' to {mnt_base / 'var'}..."); run_command(["mount", "-o", f"subvol=/{USER_CONFIG['btrfs_subvol_var']},{btrfs_mount_opts}", lv_root_path_str, str(mnt_base / "var")], check=True)
     print_step_info(f"Mounting EFI partition {efi_part_path_str} to {mnt_base / 'boot/efi'}..."); run_command(["mount", efi_part_path_str, str(mnt_base / "boot/efi")], check=True)
     if float(USER_CONFIG['swap_size_gb']) > 0:
-        lv_swap_path_str = f"/dev/{USER_CONFIG['lvm_vg_name']}/{USER_CONFIG['lvm_lv_swap_name']}"; print_step_info(f"Activating SWAP on {lv_swap_path_str}..."); run_command(["swapon", lv_swap_path_str], check=True)
-    print_color("Filesystems mounted.", Colors.GREEN, prefix=SUCCESS_SYMBOL); CURRENT_STEP = INSTALL_STEPS.index("pacstrap_system"); save_progress(); print("")
+        lv_swap_path_str = LAYOUT.lv_swap; print_step_info(f"Activating SWAP on {lv_swap_path_str}..."); run_command(["swapon", lv_swap_path_str], check=True)
+    print_color("Filesystems mounted.", Colors.GREEN, prefix=SUCCESS_SYMBOL); CURRENT_STEP = STEP_IDX["pacstrap_system"]; save_progress(); print("")
+_FINDMNT_RE = re.compile(r"^[\s├─└│]*(\S+)(?:[ \t]+(\S+))?(?:[ \t]+(\S+))?(?:[ \t]+(.*?))?[ \t]*$", re.M) # Leading class skips tree characters and blank lines
+@functools.lru_cache(maxsize=4)
+def parse_findmnt_table(findmnt_stdout: str) -> dict[str, tuple[str, str, frozenset[str]]]: # target -> (source, fstype, options); cached on the raw text, treat as read-only
+    return {target: (source or "", fstype or "", frozenset((options or "").split(","))) for target, source, fstype, options in (m.groups() for m in _FINDMNT_RE.finditer(findmnt_stdout))}
+class MountSpec(NamedTuple):
+    target: str; source_pattern: str; fstype: str; opt_prefix: str | None
 def verify_mounts(no_verify_arg: bool):
     if no_verify_arg: print_step_info("Skipping mount verification as per --no-verify."); print(""); return
     print_section_header("Verifying Mounts"); all_ok = True
-    mnt_base_str = str(Path("/mnt")); btrfs_base_device = f"/dev/mapper/{USER_CONFIG['lvm_vg_name']}-{USER_CONFIG['lvm_lv_root_name']}"
-    sfx = "p1" if "nvme" in USER_CONFIG['target_drive'] or "loop" in USER_CONFIG['target_drive'] else "1"; efi_device_path = f"{USER_CONFIG['target_drive']}{sfx}"
-    expected_mounts = [
-        {"target": mnt_base_str, "source_pattern": btrfs_base_device, "fstype": "btrfs", "options_substring": f"subvol=/{USER_CONFIG['btrfs_subvol_root']}"},
-        {"target": f"{mnt_base_str}/home", "source_pattern": btrfs_base_device, "fstype": "btrfs", "options_substring": f"subvol=/{USER_CONFIG['btrfs_subvol_home']}"},
-        {"target": f"{mnt_base_str}/var", "source_pattern": btrfs_base_device, "fstype": "btrfs", "options_substring": f"subvol=/{USER_CONFIG['btrfs_subvol_var']}"},
-        {"target": f"{mnt_base_str}/boot/efi", "source_pattern": efi_device_path, "fstype": "vfat", "options_substring": None}, ]
-    findmnt_proc = run_command(["findmnt", "--real", "--noheadings", "--output=TARGET,SOURCE,FSTYPE,OPTIONS"], capture_output=True, destructive=False, show_spinner=False, check=False) 
+    mnt_base_str = str(Path("/mnt")); btrfs_base_device = LAYOUT.lv_root_mapper
+    efi_device_path = LAYOUT.efi_part_dev
+    expected_mounts = (
+        MountSpec(mnt_base_str, btrfs_base_device, "btrfs", f"subvol=/{USER_CONFIG['btrfs_subvol_root']}"),
+        MountSpec(f"{mnt_base_str}/home", btrfs_base_device, "btrfs", f"subvol=/{USER_CONFIG['btrfs_subvol_home']}"),
+        MountSpec(f"{mnt_base_str}/var", btrfs_base_device, "btrfs", f"subvol=/{USER_CONFIG['btrfs_subvol_var']}"),
+        MountSpec(f"{mnt_base_str}/boot/efi", efi_device_path, "vfat", None), )
+    findmnt_proc = _probe(("findmnt", "--real", "--noheadings", "--output=TARGET,SOURCE,FSTYPE,OPTIONS")) # Reused until the next destructive (e.g. mount/umount) command
     
     if not (findmnt_proc and findmnt_proc.returncode == 0 and findmnt_proc.stdout):
         print_color("Could not get mount information using findmnt.", Colors.RED, prefix=ERROR_SYMBOL)
@@ -518,52 +823,40 @@ def verify_mounts(no_verify_arg: bool):
             print_color(f"findmnt stderr: {findmnt_proc.stderr.strip() if findmnt_proc.stderr else 'N/A'}", Colors.ORANGE)
         all_ok = False
     else:
+        raw_mount_table = findmnt_proc.stdout.strip()
         print_color("Raw findmnt output:", Colors.MAGENTA, bold=True)
-        print(findmnt_proc.stdout.strip())
+        print(raw_mount_table)
         print_color("--- End of raw findmnt output ---", Colors.MAGENTA, bold=True)
 
-        mounted_filesystems = {}
-        for line in findmnt_proc.stdout.strip().split('\n'):
-            if not line.strip(): continue 
-            parts = line.split(maxsplit=3)
-            if len(parts) >= 1:
-                target_path = parts[0].lstrip('├─└─│ ').strip() # Strip tree characters and any leading/trailing whitespace
-                source_val = parts[1] if len(parts) > 1 else ""
-                fstype_val = parts[2] if len(parts) > 2 else ""
-                options_val = parts[3] if len(parts) > 3 else ""
-                mounted_filesystems[target_path] = {"source": source_val, "fstype": fstype_val, "options": options_val}
-            else:
-                print_color(f"Warning: Skipping malformed or unexpectedly short findmnt line: '{line}'", Colors.ORANGE)
+        mounted_filesystems = parse_findmnt_table(findmnt_proc.stdout)
         
         print_color("Parsed mounted_filesystems dictionary:", Colors.MAGENTA, bold=True)
-        for t_key, t_val in mounted_filesystems.items():
-            print(f"  '{t_key}': {t_val}")
+        for t_key, (t_source, t_fstype, t_options) in mounted_filesystems.items():
+            print(f"  '{t_key}': source={t_source} fstype={t_fstype} options={','.join(sorted(t_options))}")
         print_color("--- End of parsed mounted_filesystems dictionary ---", Colors.MAGENTA, bold=True)
-        for expected in expected_mounts:
-            target = expected["target"]
+        for target, source_pattern, expected_fstype, opt_prefix in expected_mounts:
             is_mounted = target in mounted_filesystems
             
             if not verify_step(is_mounted, f"Mount point {target} is mounted", critical=True):
                 all_ok = False
                 if not DRY_RUN_MODE: 
-                    print_color("Current mounts from 'findmnt -A --real':", Colors.ORANGE) 
-                    run_command(["findmnt", "-A", "--real"], destructive=False, show_spinner=False, check=False, capture_output=False) 
+                    print_color("Current mounts from 'findmnt --real':", Colors.ORANGE) 
+                    print(raw_mount_table) 
                 continue 
             
             if is_mounted: 
-                actual = mounted_filesystems[target]
-                source_ok = expected["source_pattern"] in actual["source"]
-                if not verify_step(source_ok, f"{target} source contains '{expected['source_pattern']}' (actual: {actual['source']})", critical=True): all_ok = False
+                actual_source, actual_fstype, actual_options = mounted_filesystems[target]
+                source_ok = source_pattern in actual_source
+                if not verify_step(source_ok, f"{target} source contains '{source_pattern}' (actual: {actual_source})", critical=True): all_ok = False
                 
-                fstype_ok = expected["fstype"] == actual["fstype"]
-                if not verify_step(fstype_ok, f"{target} FSTYPE is '{expected['fstype']}' (actual: {actual['fstype']})", critical=True): all_ok = False
+                fstype_ok = expected_fstype == actual_fstype
+                if not verify_step(fstype_ok, f"{target} FSTYPE is '{expected_fstype}' (actual: {actual_fstype})", critical=True): all_ok = False
                 
-                if expected["options_substring"]:
-                    expected_opt_to_check = expected["options_substring"]
-                    options_ok = expected_opt_to_check in actual["options"]
-                    if not verify_step(options_ok, f"{target} options contain '{expected_opt_to_check}' (actual: {actual['options']})", critical=True): all_ok = False
+                if opt_prefix:
+                    options_ok = opt_prefix in actual_options or any(opt.startswith(opt_prefix) for opt in actual_options)
+                    if not verify_step(options_ok, f"{target} options contain '{opt_prefix}' (actual: {','.join(sorted(actual_options))})", critical=True): all_ok = False
     if float(USER_CONFIG['swap_size_gb']) > 0:
-        lv_swap_path_str = f"/dev/mapper/{USER_CONFIG['lvm_vg_name']}-{USER_CONFIG['lvm_lv_swap_name']}"
+        lv_swap_path_str = LAYOUT.lv_swap_mapper
         swap_check_proc = run_command(["swapon", "--show=NAME"], capture_output=True, destructive=False, show_spinner=False, check=False)
         swap_active = swap_check_proc and swap_check_proc.returncode == 0 and lv_swap_path_str in swap_check_proc.stdout
         if not verify_step(swap_active, f"Swap on {lv_swap_path_str} is active", critical=True): all_ok = False
@@ -572,33 +865,39 @@ def verify_mounts(no_verify_arg: bool):
     print("")
 def pacstrap_system():
     global CURRENT_STEP; print_section_header("Installing Base System (pacstrap)")
-    if CURRENT_STEP > INSTALL_STEPS.index("pacstrap_system"): print_step_info("Skipping (already completed)"); print(""); return
+    if CURRENT_STEP > STEP_IDX["pacstrap_system"]: print_step_info("Skipping (already completed)"); print(""); return
     pkgs_to_install = [ "base", "base-devel", "linux-surface", "linux-surface-headers", "systemd", "efibootmgr", "dracut", "intel-ucode", "lvm2", "btrfs-progs", "gdm", "gnome-shell", "gnome-session", "gnome-control-center", "nautilus", "gnome-terminal", "xdg-desktop-portal-gnome", "gnome-keyring", "seahorse", "neovim", "networkmanager", "openssh", "bluez", "bluez-utils", "gnupg", "pipewire", "pipewire-pulse", "pipewire-alsa", "wireplumber", "noto-fonts", "noto-fonts-cjk", "noto-fonts-emoji", USER_CONFIG["default_monospace_font_pkg"], "linux-firmware", "sof-firmware", "zram-generator", "curl", "sudo", "git", "go" ]
-    run_command(["pacstrap", "/mnt"] + pkgs_to_install, destructive=True, retry_count=2, retry_delay=10.0, custom_spinner_message="Pacstrapping base system and packages")
+    run_command(["pacstrap", "/mnt"] + pkgs_to_install, destructive=True, retry_count=2, retry_delay=10.0, stream=True)
     if not DRY_RUN_MODE:
         print_step_info("Debug: Listing /mnt/boot/ contents immediately after pacstrap...")
         ls_boot_proc = run_command(["ls", "-Alh", "/mnt/boot"], capture_output=True, destructive=False, show_spinner=False, check=False)
         if ls_boot_proc and ls_boot_proc.stdout: print_color(f"/mnt/boot/ contents:\n{ls_boot_proc.stdout.strip()}", Colors.MINT)
         else: print_color("Could not list /mnt/boot/ contents or it is empty (after pacstrap).", Colors.ORANGE)
-    print_color("Base system installation complete.", Colors.GREEN, prefix=SUCCESS_SYMBOL); CURRENT_STEP = INSTALL_STEPS.index("generate_fstab"); save_progress(); print("")
+    print_color("Base system installation complete.", Colors.GREEN, prefix=SUCCESS_SYMBOL); CURRENT_STEP = STEP_IDX["generate_fstab"]; save_progress(); print("")
 def verify_pacstrap(no_verify_arg: bool):
     if no_verify_arg: print_step_info("Skipping pacstrap verification as per --no-verify."); print(""); return
     print_section_header("Verifying Pacstrap Installation"); all_ok = True
     def check_key_dirs():
         if DRY_RUN_MODE: return True
         mnt = Path("/mnt"); key_dirs = [mnt / "bin", mnt / "etc", mnt / "usr", mnt / "boot"] 
-        return all(d.is_dir() for d in key_dirs)
-    def check_package_installed(pkg_name: str) -> bool:
-        if DRY_RUN_MODE: print_color(f"[DRY RUN] Assuming '{pkg_name}' package would be installed.", Colors.PEACH); return True
-        print_step_info(f"Verifying '{pkg_name}' package installation via arch-chroot...")
-        proc = run_command(["arch-chroot", "/mnt", "pacman", "-Q", pkg_name], capture_output=True, destructive=False, show_spinner=False, check=False)
-        if proc and proc.returncode == 0: print_color(f"'{pkg_name}' package IS installed: {proc.stdout.strip()}", Colors.GREEN, prefix=SUCCESS_SYMBOL); return True
-        else:
-            stderr = proc.stderr.strip() if proc and proc.stderr else "Unknown error"
-            print_color(f"CRITICAL: '{pkg_name}' package NOT FOUND after pacstrap. pacman -Q stderr: {stderr}", Colors.RED, prefix=ERROR_SYMBOL, bold=True); return False
+        return all(path_is_dir(d) for d in key_dirs)
+    def check_packages_installed(pkg_names: list[str]) -> dict[str, bool]:
+        if DRY_RUN_MODE:
+            for pkg_name in pkg_names: print_color(f"[DRY RUN] Assuming '{pkg_name}' package would be installed.", Colors.PEACH)
+            return dict.fromkeys(pkg_names, True)
+        print_step_info(f"Verifying {', '.join(pkg_names)} package installation via arch-chroot...")
+        # One batched query: pacman -Q prints 'name version' per hit, exits 1 if any is missing
+        proc = run_command(["arch-chroot", "/mnt", "pacman", "-Q", *pkg_names], capture_output=True, destructive=False, show_spinner=False, check=False)
+        installed = dict(line.split(maxsplit=1) for line in (proc.stdout if proc and proc.stdout else "").splitlines() if " " in line)
+        for pkg_name in pkg_names:
+            if pkg_name in installed: print_color(f"'{pkg_name}' package IS installed: {pkg_name} {installed[pkg_name]}", Colors.GREEN, prefix=SUCCESS_SYMBOL)
+            else:
+                stderr = proc.stderr.strip() if proc and proc.stderr else "Unknown error"
+                print_color(f"CRITICAL: '{pkg_name}' package NOT FOUND after pacstrap. pacman -Q stderr: {stderr}", Colors.RED, prefix=ERROR_SYMBOL, bold=True)
+        return {pkg_name: pkg_name in installed for pkg_name in pkg_names}
     if not verify_step(check_key_dirs(), "Key directories exist after pacstrap", critical=True): all_ok = False
-    if not verify_step(check_package_installed("linux-surface"), "'linux-surface' package is installed", critical=True): all_ok = False
-    if not verify_step(check_package_installed("dracut"), "'dracut' package is installed", critical=True): all_ok = False
+    for pkg_name, is_installed in check_packages_installed(["linux-surface", "dracut"]).items():
+        if not verify_step(is_installed, f"'{pkg_name}' package is installed", critical=True): all_ok = False
     if all_ok: print_color("Pacstrap verification successful.", Colors.GREEN, prefix=SUCCESS_SYMBOL)
     else: print_color("One or more pacstrap verifications failed.", Colors.RED, prefix=ERROR_SYMBOL)
     print("")
@@ -606,24 +905,30 @@ def verify_pacstrap(no_verify_arg: bool):
 def generate_fstab():
     global CURRENT_STEP
     print_section_header("Generating fstab")
-    if CURRENT_STEP > INSTALL_STEPS.index("generate_fstab"): print_step_info("Skipping (already completed)"); print(""); return
+    if CURRENT_STEP > STEP_IDX["generate_fstab"]: print_step_info("Skipping (already completed)"); print(""); return
     
     fstab_path = Path("/mnt/etc/fstab")
-    run_command(f"genfstab -U /mnt >> {fstab_path}", shell=True, destructive=True, check=True) 
+    genfstab_proc = run_command(["genfstab", "-U", "/mnt"], capture_output=True, destructive=True, check=True) # No shell: append the captured table ourselves
+    content = ""
+    if DRY_RUN_MODE: print_dry_run_command(f"append genfstab output to {fstab_path}")
+    else:
+        content = genfstab_proc.stdout
+        with open(fstab_path, "a") as f: f.write(content)
     print_color(f"fstab generated at {fstab_path}", Colors.MINT)
 
     # Verification for fstab
     root_line_found_and_correct = False
     if DRY_RUN_MODE:
         root_line_found_and_correct = True 
-    elif fstab_path.exists() and fstab_path.stat().st_size > 0:
-        content = fstab_path.read_text()
-        root_lv_mapper_path = f"/dev/mapper/{USER_CONFIG['lvm_vg_name']}-{USER_CONFIG['lvm_lv_root_name']}"
+    elif content: # Validate the entries genfstab just produced; no need to read them back from disk
+        root_lv_mapper_path = LAYOUT.lv_root_mapper
         
-        for line_idx, line_content in enumerate(content.splitlines()):
+        recent_entries = collections.deque(maxlen=20) # Bounded window of entries for the diagnostic below
+        for line_idx, line_content in enumerate(io.StringIO(content)): # Lazy line iteration, no intermediate list
             line = line_content.strip()
             if line.startswith("#") or not line:
                 continue
+            recent_entries.append(line)
             
             parts = line.split()
             # For genfstab -U, parts[0] is UUID. We identify root by mount point and type.
@@ -632,7 +937,7 @@ def generate_fstab():
                 actual_options_list = [opt.strip() for opt in actual_options_str.split(',')]
                 
                 all_config_options_present = True
-                expected_btrfs_options_from_config = USER_CONFIG["btrfs_mount_options"].split(',')
+                expected_btrfs_options_from_config = LAYOUT.btrfs_opts.split(',')
                 for expected_opt_part in expected_btrfs_options_from_config:
                     base_expected_opt = expected_opt_part.split('=')[0]
                     if not any(actual_opt.startswith(base_expected_opt) for actual_opt in actual_options_list):
@@ -653,78 +958,73 @@ def generate_fstab():
             print_color(f"Root Btrfs entry in fstab was not found or seems incorrect/missing required options.", Colors.ORANGE, prefix=WARNING_SYMBOL)
             print_color(f"Expected base options from config to be present: {USER_CONFIG['btrfs_mount_options']}", Colors.PEACH)
             print_color(f"Expected subvolume for root: subvol=/{USER_CONFIG['btrfs_subvol_root']}", Colors.PEACH)
-            print_color("Actual fstab content:", Colors.PEACH)
-            print(content)
+            print_color(f"Actual fstab entries (last {recent_entries.maxlen} scanned):", Colors.PEACH)
+            print("\n".join(recent_entries))
             
     verify_step(root_line_found_and_correct, "fstab content for root mount appears correct", critical=True)
     
     print_color("fstab generation and basic check complete.", Colors.GREEN, prefix=SUCCESS_SYMBOL)
-    CURRENT_STEP = INSTALL_STEPS.index("pre_chroot_files")
+    CURRENT_STEP = STEP_IDX["pre_chroot_files"]
     save_progress()
     print("")
 
+_PACMAN_COLOR_RE = re.compile(re.escape("#Color"))
+_MAKEPKG_RE = re.compile(r'-march=x86-64|CFLAGS="-march=native|CFLAGS="|#CXXFLAGS="\$\{CFLAGS\}"')
+_SUDOERS_WHEEL_RE = re.compile(re.escape("# %wheel ALL=(ALL:ALL) ALL"))
+def sub_file(path: Path, pattern: re.Pattern, replacement) -> bool:
+    # replacement(match, original_content) -> str; the file is only rewritten when something matched
+    content = path.read_text()
+    new_content, n_subs = pattern.subn(lambda match: replacement(match, content), content)
+    if n_subs: path.write_text(new_content)
+    return bool(n_subs)
 def pre_chroot_file_configurations():
     global CURRENT_STEP
     print_section_header("Pre-Chroot File Configurations")
-    if CURRENT_STEP > INSTALL_STEPS.index("pre_chroot_files"): print_step_info("Skipping (already completed)"); print(""); return
+    if CURRENT_STEP > STEP_IDX["pre_chroot_files"]: print_step_info("Skipping (already completed)"); print(""); return
 
     mnt_base = Path("/mnt")
     config = USER_CONFIG
 
-    write_file_dry_run(mnt_base / "etc/locale.gen", f"{config['locale_gen']}\n")
-    write_file_dry_run(mnt_base / "etc/locale.conf", f"LANG={config['locale_lang']}\n")
-    write_file_dry_run(mnt_base / "etc/vconsole.conf", f"KEYMAP={config['vconsole_keymap']}\n")
-    write_file_dry_run(mnt_base / "etc/hostname", f"{config['hostname']}\n")
+    pending_files: list[tuple[Path, str, int]] = [] # Collected here and written in one batch below
+    pending_files.append((mnt_base / "etc/locale.gen", f"{config['locale_gen']}\n", 0o644))
+    pending_files.append((mnt_base / "etc/locale.conf", f"LANG={config['locale_lang']}\n", 0o644))
+    pending_files.append((mnt_base / "etc/vconsole.conf", f"KEYMAP={config['vconsole_keymap']}\n", 0o644))
+    pending_files.append((mnt_base / "etc/hostname", f"{config['hostname']}\n", 0o644))
     hosts_content = f"127.0.0.1 localhost\n::1       localhost\n127.0.1.1 {config['hostname']}.localdomain {config['hostname']}\n"
-    write_file_dry_run(mnt_base / "etc/hosts", hosts_content)
+    pending_files.append((mnt_base / "etc/hosts", hosts_content, 0o644))
     editor_script_content = 'export EDITOR="nvim"\nexport VISUAL="nvim"\n'
-    editor_script_path = mnt_base / "etc/profile.d/editor.sh"
-    write_file_dry_run(editor_script_path, editor_script_content)
-    if not DRY_RUN_MODE: os.chmod(editor_script_path, 0o755)
+    pending_files.append((mnt_base / "etc/profile.d/editor.sh", editor_script_content, 0o755))
     loader_conf_content = "default arch-*\ntimeout 3\nconsole-mode max\neditor no\n"
-    boot_efi_loader_path = mnt_base / "boot/efi/loader"; make_dir_dry_run(boot_efi_loader_path, parents=True, exist_ok=True)
-    write_file_dry_run(boot_efi_loader_path / "loader.conf", loader_conf_content)
-    gdm_conf_dir = mnt_base / "etc/gdm"; make_dir_dry_run(gdm_conf_dir, parents=True, exist_ok=True)
+    pending_files.append((mnt_base / "boot/efi/loader/loader.conf", loader_conf_content, 0o644))
     gdm_custom_conf_content = f"[daemon]\nAutomaticLoginEnable=True\nAutomaticLogin={config['username']}\n"
-    write_file_dry_run(gdm_conf_dir / "custom.conf", gdm_custom_conf_content)
-    pacman_conf_path = mnt_base / "etc/pacman.conf"
-    if not DRY_RUN_MODE and pacman_conf_path.exists():
-        try:
-            content = pacman_conf_path.read_text()
-            if "#Color" in content: pacman_conf_path.write_text(content.replace("#Color", "Color"))
-        except Exception as e: print_color(f"Error modifying {pacman_conf_path} for Color: {e}", Colors.ORANGE)
-    makepkg_conf_path = mnt_base / "etc/makepkg.conf"
-    if not DRY_RUN_MODE and makepkg_conf_path.exists():
-        try:
-            content = makepkg_conf_path.read_text()
-            content = content.replace("-march=x86-64", f"-march={config['cpu_march']}")
-            content = content.replace("CFLAGS=\"-march=native", f"CFLAGS=\"-march={config['cpu_march']}")
-            if "-O2" not in content: content = content.replace("CFLAGS=\"", "CFLAGS=\"-O2 ") 
-            if "-pipe" not in content: content = content.replace("CFLAGS=\"", "CFLAGS=\"-pipe ") 
-            content = content.replace("#CXXFLAGS=\"${CFLAGS}\"", "CXXFLAGS=\"${CFLAGS}\"")
-            makepkg_conf_path.write_text(content)
-        except Exception as e: print_color(f"Error modifying {makepkg_conf_path} for CPU opts: {e}", Colors.ORANGE)
+    pending_files.append((mnt_base / "etc/gdm/custom.conf", gdm_custom_conf_content, 0o644))
+    def makepkg_sub(match: re.Match, content: str) -> str: # One callback for every makepkg.conf edit, applied in a single scan
+        token = match.group(0)
+        if token == "-march=x86-64": return f"-march={config['cpu_march']}"
+        if token == '#CXXFLAGS="${CFLAGS}"': return 'CXXFLAGS="${CFLAGS}"'
+        flag_prefix = ("-pipe " if "-pipe" not in content else "") + ("-O2 " if "-O2" not in content else "")
+        return f'CFLAGS="{flag_prefix}-march={config["cpu_march"]}' if token.endswith("-march=native") else f'CFLAGS="{flag_prefix}'
+    config_edits = ((mnt_base / "etc/pacman.conf", _PACMAN_COLOR_RE, lambda m, c: "Color", " for Color"),
+                    (mnt_base / "etc/makepkg.conf", _MAKEPKG_RE, makepkg_sub, " for CPU opts"),
+                    (mnt_base / "etc/sudoers", _SUDOERS_WHEEL_RE, lambda m, c: "%wheel ALL=(ALL:ALL) ALL", ""))
+    for config_path, pattern, replacement, purpose in config_edits:
+        if not DRY_RUN_MODE and config_path.exists():
+            try: sub_file(config_path, pattern, replacement)
+            except Exception as e: print_color(f"Error modifying {config_path}{purpose}: {e}", Colors.ORANGE)
     zram_conf_content = f"[zram0]\nzram-fraction = {config['zram_fraction']}\ncompression-algorithm = zstd\n"
-    zram_conf_path_dir = mnt_base / "etc/systemd"; make_dir_dry_run(zram_conf_path_dir, parents=True, exist_ok=True)
-    write_file_dry_run(zram_conf_path_dir / "zram-generator.conf", zram_conf_content)
-    dconf_profile_dir = mnt_base / "etc/dconf/profile"; make_dir_dry_run(dconf_profile_dir, parents=True, exist_ok=True)
-    dconf_db_locald_dir = mnt_base / "etc/dconf/db/local.d"; make_dir_dry_run(dconf_db_locald_dir, parents=True, exist_ok=True)
-    make_dir_dry_run(mnt_base / "etc/dconf/db/locks", parents=True, exist_ok=True)
-    write_file_dry_run(dconf_profile_dir / "user", "user-db:user\nsystem-db:local\n")
-    write_file_dry_run(dconf_db_locald_dir / "00-hidpi-fractional-scaling", "[org/gnome/mutter]\nexperimental-features=['scale-monitor-framebuffer']\n")
-    sudoers_path = mnt_base / "etc/sudoers"
-    if not DRY_RUN_MODE and sudoers_path.exists():
-        try:
-            content = sudoers_path.read_text()
-            if "# %wheel ALL=(ALL:ALL) ALL" in content: sudoers_path.write_text(content.replace("# %wheel ALL=(ALL:ALL) ALL", "%wheel ALL=(ALL:ALL) ALL"))
-        except Exception as e: print_color(f"Error modifying {sudoers_path}: {e}", Colors.ORANGE)
+    pending_files.append((mnt_base / "etc/systemd/zram-generator.conf", zram_conf_content, 0o644))
+    pending_files.append((mnt_base / "etc/dconf/profile/user", "user-db:user\nsystem-db:local\n", 0o644))
+    pending_files.append((mnt_base / "etc/dconf/db/local.d/00-hidpi-fractional-scaling", "[org/gnome/mutter]\nexperimental-features=['scale-monitor-framebuffer']\n", 0o644))
+    write_files_dry_run(mnt_base, pending_files)
+    make_dir_dry_run(mnt_base / "etc/dconf/db/locks", parents=True, exist_ok=True) # Empty, so not part of the batch
     
     print_color("Pre-chroot file configurations complete.", Colors.GREEN, prefix=SUCCESS_SYMBOL)
-    CURRENT_STEP = INSTALL_STEPS.index("chroot_configure")
+    CURRENT_STEP = STEP_IDX["chroot_configure"]
     save_progress()
     print("")
 
-def _generate_and_write_chroot_script_content() -> Path:
+_SETUP_PLACEHOLDER_RE = re.compile(r"__SETUP_([A-Z0-9_]+?)__")
+def _generate_chroot_script_content() -> str:
     path_setup_bash_profile = '''
 if ! grep -q '$HOME/.local/bin' "$PROFILE_TARGET" >/dev/null 2>&1 && [ -f "$PROFILE_TARGET" ]; then
   echo -e "\\n# Add .local/bin to PATH\\nif [ -d \\"$HOME/.local/bin\\" ] ; then\\n  PATH=\\"$HOME/.local/bin:$PATH\\"\\nfi" >> "$PROFILE_TARGET"
@@ -742,6 +1042,11 @@ fi
 set -e 
 echo -e "{Colors.PURPLE}--- CHROOT SCRIPT: Configuring System (inside chroot) ---{Colors.RESET}"
 
+# Fetch pending upgrades in the background: nothing before the chaotic-aur block touches the pacman database,
+# so the download overlaps locale/boot/initramfs work and the later pacman -Syu installs from the warm cache
+pacman -Syuw --noconfirm > /tmp/syu_download.log 2>&1 &
+SYU_DOWNLOAD_PID=$!
+
 echo -e "{Colors.BLUE}Setting timezone to __SETUP_TIMEZONE__...{Colors.RESET}"
 ln -sf "/usr/share/zoneinfo/__SETUP_TIMEZONE__" /etc/localtime
 hwclock --systohc
@@ -750,72 +1055,74 @@ echo -e "{Colors.BLUE}Generating locales (locale.gen and locale.conf configured
 locale-gen
 
 echo -e "{Colors.BLUE}Setting root password and locking root account...{Colors.RESET}"
-echo "root:__SETUP_ROOT_PASSWORD__" | chpasswd -e || echo "root:__SETUP_ROOT_PASSWORD__" | chpasswd
+__SETUP_ROOT_CHPASSWD__
 passwd -l root 
 
 echo -e "{Colors.BLUE}Creating user __SETUP_USERNAME__...{Colors.RESET}"
 useradd -m -G wheel -s /bin/bash "__SETUP_USERNAME__"
-echo "__SETUP_USERNAME__:__SETUP_BAO_PASSWORD__" | chpasswd -e || echo "__SETUP_USERNAME__:__SETUP_BAO_PASSWORD__" | chpasswd
+__SETUP_BAO_CHPASSWD__
 
 echo -e "{Colors.BLUE}Configuring systemd-boot (loader.conf configured pre-chroot)...{Colors.RESET}"
 bootctl --path=/boot/efi install
 
-ROOT_PART_UUID=\$(findmnt -n -o UUID -T /)
-if [ -z "\$ROOT_PART_UUID" ]; then echo -e "{Colors.RED}ERROR: No ROOT_PART_UUID{Colors.RESET}"; exit 1; fi
+ROOT_PART_UUID=$(findmnt -n -o UUID -T /)
+if [ -z "$ROOT_PART_UUID" ]; then echo -e "{Colors.RED}ERROR: No ROOT_PART_UUID{Colors.RESET}"; exit 1; fi
 
 cat << EOF_ARCH_ENTRY > /boot/efi/loader/entries/arch-surface.conf
 title   Arch Linux (Surface - GNOME)
 linux   /vmlinuz-linux-surface
 initrd  /intel-ucode.img
 initrd  /initramfs-linux-surface.img
-options root=UUID=\$ROOT_PART_UUID rootflags=subvol=/__SETUP_BTRFS_SUBVOL_ROOT__ rw quiet splash mitigations=off
+options root=UUID=$ROOT_PART_UUID rootflags=subvol=/__SETUP_BTRFS_SUBVOL_ROOT__ rw quiet splash mitigations=off
 EOF_ARCH_ENTRY
 
 echo -e "{Colors.BLUE}Preparing for initramfs generation...{Colors.RESET}"
 
 # Hardcoded kernel module directory name for linux-surface
 KERNEL_MODULE_DIR_NAME="6.14.2.arch1-1-surface"
-echo -e "{Colors.CYAN}Using KERNEL_MODULE_DIR_NAME: \$KERNEL_MODULE_DIR_NAME (hardcoded){Colors.RESET}"
+echo -e "{Colors.CYAN}Using KERNEL_MODULE_DIR_NAME: $KERNEL_MODULE_DIR_NAME (hardcoded){Colors.RESET}"
 
-KERNEL_MODULES_PATH="/usr/lib/modules/\$KERNEL_MODULE_DIR_NAME"
+KERNEL_MODULES_PATH="/usr/lib/modules/$KERNEL_MODULE_DIR_NAME"
 BOOT_VMLINUZ_TARGET_NAME="vmlinuz-linux-surface" 
-BOOT_KERNEL_TARGET_PATH="/boot/\$BOOT_VMLINUZ_TARGET_NAME" 
-KERNEL_IMAGE_SRC_IN_MODULES="\$KERNEL_MODULES_PATH/vmlinuz" 
+BOOT_KERNEL_TARGET_PATH="/boot/$BOOT_VMLINUZ_TARGET_NAME" 
+KERNEL_IMAGE_SRC_IN_MODULES="$KERNEL_MODULES_PATH/vmlinuz" 
 
-if [ ! -d "\$KERNEL_MODULES_PATH" ]; then
-    echo -e "{Colors.RED}CRITICAL ERROR: Kernel modules directory \$KERNEL_MODULES_PATH does NOT exist!{Colors.RESET}"
+if [ ! -d "$KERNEL_MODULES_PATH" ]; then
+    echo -e "{Colors.RED}CRITICAL ERROR: Kernel modules directory $KERNEL_MODULES_PATH does NOT exist!{Colors.RESET}"
     echo -e "{Colors.RED}This indicates a severe issue with the 'linux-surface' package installation or that the hardcoded KERNEL_MODULE_DIR_NAME is incorrect.{Colors.RESET}"
     ls -Alh /usr/lib/modules/ || echo -e "{Colors.ORANGE}Could not list /usr/lib/modules/{Colors.RESET}"
     exit 1
 fi
-echo -e "{Colors.GREEN}Kernel modules directory \$KERNEL_MODULES_PATH found.{Colors.RESET}"
-
-if [ ! -f "\$BOOT_KERNEL_TARGET_PATH" ]; then
-    echo -e "{Colors.YELLOW}Kernel image \$BOOT_KERNEL_TARGET_PATH not found directly in /boot.{Colors.RESET}"
-    if [ -f "\$KERNEL_IMAGE_SRC_IN_MODULES" ]; then
-        echo -e "{Colors.MINT}Found kernel image at \$KERNEL_IMAGE_SRC_IN_MODULES. Copying to \$BOOT_KERNEL_TARGET_PATH...{Colors.RESET}"
-        cp -v "\$KERNEL_IMAGE_SRC_IN_MODULES" "\$BOOT_KERNEL_TARGET_PATH"
+echo -e "{Colors.GREEN}Kernel modules directory $KERNEL_MODULES_PATH found.{Colors.RESET}"
+
+if [ ! -f "$BOOT_KERNEL_TARGET_PATH" ]; then
+    echo -e "{Colors.YELLOW}Kernel image $BOOT_KERNEL_TARGET_PATH not found directly in /boot.{Colors.RESET}"
+    if [ -f "$KERNEL_IMAGE_SRC_IN_MODULES" ]; then
+        echo -e "{Colors.MINT}Found kernel image at $KERNEL_IMAGE_SRC_IN_MODULES. Copying to $BOOT_KERNEL_TARGET_PATH...{Colors.RESET}"
+        # Copies and sets the mode in one step; its exit status is the check, no re-stat afterwards
+        install -m644 -v "$KERNEL_IMAGE_SRC_IN_MODULES" "$BOOT_KERNEL_TARGET_PATH" || {{ echo -e "{Colors.RED}CRITICAL ERROR: Could not install the kernel image to $BOOT_KERNEL_TARGET_PATH. Cannot proceed.{Colors.RESET}"; exit 1; }}
     else
-        echo -e "{Colors.RED}ERROR: Kernel image \$KERNEL_IMAGE_SRC_IN_MODULES not found within \$KERNEL_MODULES_PATH.{Colors.RESET}"
-        echo -e "{Colors.CYAN}Listing contents of \$KERNEL_MODULES_PATH for diagnostics:{Colors.RESET}"
-        ls -Alh "\$KERNEL_MODULES_PATH" || echo -e "{Colors.ORANGE}Could not list \$KERNEL_MODULES_PATH{Colors.RESET}"
+        echo -e "{Colors.RED}ERROR: Kernel image $KERNEL_IMAGE_SRC_IN_MODULES not found within $KERNEL_MODULES_PATH.{Colors.RESET}"
+        echo -e "{Colors.CYAN}Listing contents of $KERNEL_MODULES_PATH for diagnostics:{Colors.RESET}"
+        ls -Alh "$KERNEL_MODULES_PATH" || echo -e "{Colors.ORANGE}Could not list $KERNEL_MODULES_PATH{Colors.RESET}"
         exit 1
     fi
 else
-    echo -e "{Colors.GREEN}Kernel image \$BOOT_KERNEL_TARGET_PATH already present in /boot.{Colors.RESET}"
-fi
-
-if [ ! -f "\$BOOT_KERNEL_TARGET_PATH" ]; then
-    echo -e "{Colors.RED}CRITICAL ERROR: Kernel image \$BOOT_KERNEL_TARGET_PATH is still not found in /boot after copy attempt. Cannot proceed.{Colors.RESET}"; exit 1
+    echo -e "{Colors.GREEN}Kernel image $BOOT_KERNEL_TARGET_PATH already present in /boot.{Colors.RESET}"
 fi
-echo -e "{Colors.GREEN}Kernel image \$BOOT_KERNEL_TARGET_PATH is ready in /boot.{Colors.RESET}"
+echo -e "{Colors.GREEN}Kernel image $BOOT_KERNEL_TARGET_PATH is ready in /boot.{Colors.RESET}"
 
-echo -e "{Colors.BLUE}Generating initramfs with dracut for kernel modules version \$KERNEL_MODULE_DIR_NAME...{Colors.RESET}"
-dracut --force --hostonly --no-hostonly-cmdline --kver "\$KERNEL_MODULE_DIR_NAME" "/boot/initramfs-linux-surface.img"
+echo -e "{Colors.BLUE}Generating initramfs with dracut for kernel modules version $KERNEL_MODULE_DIR_NAME (in the background)...{Colors.RESET}"
+# CPU-bound; overlaps with the service setup and the network-bound chaotic-aur bootstrap, and is reaped before pacman -Syu can touch the kernel or dracut
+dracut --force --hostonly --no-hostonly-cmdline --kver "$KERNEL_MODULE_DIR_NAME" "/boot/initramfs-linux-surface.img" > /tmp/dracut.log 2>&1 &
+DRACUT_PID=$!
 
 echo -e "{Colors.BLUE}Enabling system services (GDM, NetworkManager, WirePlumber, Bluetooth, ZRAM)...{Colors.RESET}"
 systemctl enable gdm.service NetworkManager.service wireplumber.service bluetooth.service systemd-zram-setup@zram0.service
 
+wait "$SYU_DOWNLOAD_PID" || echo -e "{Colors.ORANGE}Background package download failed; pacman -Syu will fetch what it needs.{Colors.RESET}"
+cat /tmp/syu_download.log; rm -f /tmp/syu_download.log
+
 echo -e "{Colors.BLUE}Configuring Chaotic-AUR in /etc/pacman.conf (Color and makepkg.conf configured pre-chroot)...{Colors.RESET}"
 if [ "__SETUP_ADD_CHAOTIC_AUR__" = "true" ]; then
   if ! grep -q "\\[chaotic-aur\\]" /etc/pacman.conf; then
@@ -823,10 +1130,24 @@ if [ "__SETUP_ADD_CHAOTIC_AUR__" = "true" ]; then
     pacman-key --lsign-key 3056513887B78AEB
     pacman -U --noconfirm https://cdn-mirror.chaotic.cx/chaotic-aur/chaotic-keyring.pkg.tar.zst https://cdn-mirror.chaotic.cx/chaotic-aur/chaotic-mirrorlist.pkg.tar.zst
     echo -e "\\n[chaotic-aur]\\nInclude = /etc/pacman.d/chaotic-mirrorlist" >> /etc/pacman.conf
-    pacman -Sy 
   fi
 fi
 
+# Clone the AUR sources in the background while pacman works; yay builds from these warm clones later
+AUR_CACHE_DIR="/var/cache/aur"; mkdir -p "$AUR_CACHE_DIR"; AUR_PREFETCH_PIDS=()
+for pkg in yay-bin visual-studio-code-bin google-chrome libwacom-surface surface-control-bin; do
+    [ -d "$AUR_CACHE_DIR/$pkg/.git" ] || {{ git clone --quiet "https://aur.archlinux.org/$pkg.git" "$AUR_CACHE_DIR/$pkg" & AUR_PREFETCH_PIDS+=($!); }}
+done
+
+if wait "$DRACUT_PID"; then cat /tmp/dracut.log; rm -f /tmp/dracut.log
+else cat /tmp/dracut.log; echo -e "{Colors.RED}CRITICAL ERROR: dracut failed to generate /boot/initramfs-linux-surface.img{Colors.RESET}"; exit 1; fi
+
+# One -Syu both refreshes the databases (including chaotic-aur, so yay can pick its prebuilt packages) and upgrades in a single transaction
+echo -e "{Colors.BLUE}Performing full system update as root...{Colors.RESET}"
+pacman -Syu --noconfirm
+for pid in "${{AUR_PREFETCH_PIDS[@]}}"; do wait "$pid" || echo -e "{Colors.ORANGE}An AUR prefetch clone failed; yay will fetch it itself.{Colors.RESET}"; done
+chown -R __SETUP_USERNAME__:__SETUP_USERNAME__ "$AUR_CACHE_DIR"
+
 echo -e "{Colors.BLUE}Applying system-wide dconf settings (files configured pre-chroot)...{Colors.RESET}"
 dconf update
 
@@ -840,6 +1161,11 @@ BASHRC="$USER_HOME/.bashrc"
 {path_setup_bash_profile}
 
 echo -e "{Colors.BLUE}Running AUR installs and key generation as user __SETUP_USERNAME__...{Colors.RESET}"
+# yay calls "sudo pacman" from each parallel AUR group; a temporary pacman-only NOPASSWD rule keeps them from racing for a password prompt on the tty
+AUR_SUDOERS_DROPIN=/etc/sudoers.d/10-installer-aur-pacman
+echo "%wheel ALL=(ALL) NOPASSWD: /usr/bin/pacman" > "$AUR_SUDOERS_DROPIN" && chmod 440 "$AUR_SUDOERS_DROPIN"
+visudo -cf "$AUR_SUDOERS_DROPIN" > /dev/null || rm -f "$AUR_SUDOERS_DROPIN"
+trap 'rm -f "$AUR_SUDOERS_DROPIN"' EXIT
 runuser -l "__SETUP_USERNAME__" -c '
     set -e
     echo -e "{Colors.CYAN}--- Running as user __SETUP_USERNAME__ for AUR and Keys ---{Colors.RESET}"
@@ -847,77 +1173,87 @@ runuser -l "__SETUP_USERNAME__" -c '
     
     echo -e "{Colors.LIGHT_BLUE}>>> Installing yay (AUR helper)...{Colors.RESET}"
     if ! command -v yay &> /dev/null; then
-        cd /tmp || exit 1
-        git clone https://aur.archlinux.org/yay-bin.git && cd yay-bin && makepkg -si --noconfirm && cd / && rm -rf /tmp/yay-bin || {{ echo -e "{Colors.RED}Failed to install yay{Colors.RESET}"; exit 1; }}
+        [ -d /var/cache/aur/yay-bin/.git ] || git clone https://aur.archlinux.org/yay-bin.git /var/cache/aur/yay-bin
+        cd /var/cache/aur/yay-bin && makepkg -si --noconfirm && cd / || {{ echo -e "{Colors.RED}Failed to install yay{Colors.RESET}"; exit 1; }}
     else echo -e "{Colors.MINT}yay already installed.{Colors.RESET}"; fi
 
     echo -e "{Colors.LIGHT_BLUE}>>> Installing AUR packages (VS Code, Google Chrome, Surface Utilities)...{Colors.RESET}"
-    yay -S --noconfirm --needed visual-studio-code-bin google-chrome libwacom-surface surface-control-bin || echo -e "{Colors.ORANGE}Warning: Some AUR packages failed to install.{Colors.RESET}"
+    # Independent groups build concurrently (sudo pacman is passwordless for now, see the drop-in above); yay waits on the pacman lock before installing, and a group that still loses the race is retried serially
+    AUR_GROUPS=("visual-studio-code-bin" "google-chrome" "libwacom-surface surface-control-bin"); AUR_PIDS=()
+    for i in "${{!AUR_GROUPS[@]}}"; do
+        yay -S --noconfirm --needed --builddir /var/cache/aur ${{AUR_GROUPS[$i]}} > "/tmp/aur_group_$i.log" 2>&1 &
+        AUR_PIDS+=($!)
+    done
+    for i in "${{!AUR_GROUPS[@]}}"; do
+        if wait "${{AUR_PIDS[$i]}}"; then cat "/tmp/aur_group_$i.log"
+        else
+            cat "/tmp/aur_group_$i.log"; echo -e "{Colors.YELLOW}Retrying ${{AUR_GROUPS[$i]}} on its own...{Colors.RESET}"
+            yay -S --noconfirm --needed --builddir /var/cache/aur ${{AUR_GROUPS[$i]}} || echo -e "{Colors.ORANGE}Warning: Some AUR packages failed to install.{Colors.RESET}"
+        fi
+        rm -f "/tmp/aur_group_$i.log"
+    done
     
+    # SSH and GPG keygen are independent: run both in the background so wall time is the slower of the two
+    mkdir -p "$HOME/.ssh" "$HOME/.gnupg" && chmod 700 "$HOME/.ssh" "$HOME/.gnupg"
     echo -e "{Colors.LIGHT_BLUE}>>> Generating SSH key for __SETUP_SSH_KEY_EMAIL__...{Colors.RESET}"
-    mkdir -p "$HOME/.ssh" && chmod 700 "$HOME/.ssh"
-    if [ ! -f "$HOME/.ssh/id_ed25519" ]; then
-        ssh-keygen -t ed25519 -C "__SETUP_SSH_KEY_EMAIL__" -N "" -f "$HOME/.ssh/id_ed25519" || echo -e "{Colors.ORANGE}SSH keygen failed.{Colors.RESET}"
-    else echo -e "{Colors.MINT}SSH key already exists.{Colors.RESET}"; fi
+    (
+        if [ ! -f "$HOME/.ssh/id_ed25519" ]; then
+            ssh-keygen -t ed25519 -C "__SETUP_SSH_KEY_EMAIL__" -N "" -f "$HOME/.ssh/id_ed25519" || echo -e "{Colors.ORANGE}SSH keygen failed.{Colors.RESET}"
+        else echo -e "{Colors.MINT}SSH key already exists.{Colors.RESET}"; fi
+    ) > /tmp/ssh_gen.log 2>&1 &
+    SSH_GEN_PID=$!
 
     echo -e "{Colors.LIGHT_BLUE}>>> Attempting GPG key generation for __SETUP_GPG_KEY_NAME__ <__SETUP_GPG_KEY_EMAIL__>...{Colors.RESET}"
-    mkdir -p "$HOME/.gnupg" && chmod 700 "$HOME/.gnupg"
     GPG_BATCH_CMDS_USER=$(cat <<GPG_USER_EOF
 %echo Generating GPG key for user...
-Key-Type: RSA; Key-Length: 4096; Subkey-Type: RSA; Subkey-Length: 4096
-Name-Real: __SETUP_GPG_KEY_NAME__; Name-Email: __SETUP_GPG_KEY_EMAIL__
-Expire-Date: 0; Passphrase: __SETUP_BAO_PASSWORD__; %commit; %echo done
+__SETUP_GPG_KEY_SPEC__
+Name-Real: __SETUP_GPG_KEY_NAME__
+Name-Email: __SETUP_GPG_KEY_EMAIL__
+Expire-Date: 0
+Passphrase: __SETUP_BAO_PASSWORD__
+%commit
+%echo done
 GPG_USER_EOF
 )
-    if ! gpg --list-keys "__SETUP_GPG_KEY_EMAIL__" > /dev/null 2>&1; then
-        echo "$GPG_BATCH_CMDS_USER" | gpg --batch --pinentry-mode loopback --yes --generate-key > /tmp/gpg_gen_user.log 2>&1 || echo -e "{Colors.ORANGE}GPG batch command execution had issues.{Colors.RESET}"
-        cat /tmp/gpg_gen_user.log; rm -f /tmp/gpg_gen_user.log
-        if ! gpg --list-keys "__SETUP_GPG_KEY_EMAIL__" > /dev/null 2>&1; then echo -e "{Colors.ORANGE}WARNING: GPG key for __SETUP_GPG_KEY_EMAIL__ may not have been created.{Colors.RESET}"; fi
-    else echo -e "{Colors.MINT}GPG key for __SETUP_GPG_KEY_EMAIL__ already exists.{Colors.RESET}"; fi
+    (
+        if ! gpg --list-keys "__SETUP_GPG_KEY_EMAIL__" > /dev/null 2>&1; then
+            echo "$GPG_BATCH_CMDS_USER" | gpg --batch --pinentry-mode loopback --yes --generate-key || echo -e "{Colors.ORANGE}GPG batch command execution had issues.{Colors.RESET}"
+            if ! gpg --list-keys "__SETUP_GPG_KEY_EMAIL__" > /dev/null 2>&1; then echo -e "{Colors.ORANGE}WARNING: GPG key for __SETUP_GPG_KEY_EMAIL__ may not have been created.{Colors.RESET}"; fi
+        else echo -e "{Colors.MINT}GPG key for __SETUP_GPG_KEY_EMAIL__ already exists.{Colors.RESET}"; fi
+    ) > /tmp/gpg_gen.log 2>&1 &
+    GPG_GEN_PID=$!
+
+    wait "$SSH_GEN_PID" || true; wait "$GPG_GEN_PID" || true
+    cat /tmp/ssh_gen.log /tmp/gpg_gen.log; rm -f /tmp/ssh_gen.log /tmp/gpg_gen.log
     echo -e "{Colors.CYAN}--- User-specific setup finished ---{Colors.RESET}"
 ' || echo -e "{Colors.RED}ERROR: User-specific setup script failed for __SETUP_USERNAME__{Colors.RESET}"
-
-echo -e "{Colors.BLUE}Performing final system update as root...{Colors.RESET}"
-pacman -Syu --noconfirm
+rm -f "$AUR_SUDOERS_DROPIN"; trap - EXIT
 
 echo -e "{Colors.PURPLE}--- CHROOT SCRIPT: Configuration complete. ---{Colors.RESET}"
 '''
-    # Substitute USER_CONFIG and passwords
-    final_script = chroot_script_content
-    for key, value in USER_CONFIG.items():
-        template_var = f"__SETUP_{key.upper()}__" 
-        
-        str_value = str(value)
-        if isinstance(value, bool):
-            str_value = str_value.lower() 
-        
-        final_script = final_script.replace(template_var, str_value)
-
-    final_script = final_script.replace("__SETUP_BAO_PASSWORD__", BAO_PASSWORD)
-    final_script = final_script.replace("__SETUP_ROOT_PASSWORD__", ROOT_PASSWORD)
-
-    chroot_script_target_path_mounted = Path("/mnt/chroot_script.sh")
-    write_file_dry_run(chroot_script_target_path_mounted, final_script)
-    if not DRY_RUN_MODE:
-        run_command(["chmod", "+x", str(chroot_script_target_path_mounted)], destructive=False)
-    return chroot_script_target_path_mounted.relative_to("/mnt")
+    # Substitute USER_CONFIG and passwords in one regex pass; unknown placeholders are left as-is
+    placeholder_values = {key.upper(): str(value).lower() if isinstance(value, bool) else str(value) for key, value in USER_CONFIG.items()}
+    placeholder_values.update(ROOT_CHPASSWD=ROOT_PASSWORD.chpasswd_line("root"), BAO_CHPASSWD=BAO_PASSWORD.chpasswd_line(USER_CONFIG["username"]), BAO_PASSWORD=BAO_PASSWORD.plaintext, GPG_KEY_SPEC=GPG_KEY_SPECS.get(USER_CONFIG.get("gpg_key_algo"), GPG_KEY_SPECS["ed25519"]))
+    final_script = _SETUP_PLACEHOLDER_RE.sub(lambda m: placeholder_values.get(m.group(1), m.group(0)), chroot_script_content)
+    # The script arrives on bash's stdin: bash parses the whole { ... } group before running it, and the group's own stdin is
+    # /dev/null, so a command that reads stdin can never swallow the rest of the script
+    return f"{{\n{final_script}}} < /dev/null\n"
 
 def chroot_configure_system():
     global CURRENT_STEP
     print_section_header("Configuring System (chroot)")
-    if CURRENT_STEP > INSTALL_STEPS.index("chroot_configure"): print_step_info("Skipping (already completed)"); print(""); return
+    if CURRENT_STEP > STEP_IDX["chroot_configure"]: print_step_info("Skipping (already completed)"); print(""); return
 
-    relative_chroot_script_path = _generate_and_write_chroot_script_content()
-    print_step_info(f"Executing generated chroot script: /{relative_chroot_script_path}")
-    
-    run_command(["arch-chroot", "/mnt", "/bin/bash", f"/{relative_chroot_script_path}"], destructive=True, retry_count=1)
-    
-    unlink_file_dry_run(Path("/mnt") / relative_chroot_script_path) 
+    chroot_script = _generate_chroot_script_content()
+    print_step_info("Piping generated chroot script into bash inside the chroot (nothing is written to /mnt)...")
+    if DRY_RUN_MODE: print_content_preview("chroot script (stdin)", chroot_script)
+    run_command(["arch-chroot", "/mnt", "/bin/bash", "-s"], destructive=True, retry_count=1, input_text=chroot_script)
     print_color("System configuration in chroot complete.", Colors.GREEN, prefix=SUCCESS_SYMBOL)
-    CURRENT_STEP = INSTALL_STEPS.index("cleanup")
+    CURRENT_STEP = STEP_IDX["cleanup"]
     save_progress()
     print("")
 
+@buffered_output
 def verify_chroot_configs(no_verify_arg: bool):
     if no_verify_arg: print_step_info("Skipping chroot configuration verification as per --no-verify."); print(""); return
     print_section_header("Verifying Chroot Configuration")
@@ -926,34 +1262,37 @@ def verify_chroot_configs(no_verify_arg: bool):
     def check_file_content(path_in_mnt: str, expected_content_part: str, check_name: str, critical=False) -> bool:
         if DRY_RUN_MODE: print_color(f"[DRY RUN] Assuming {check_name} at {path_in_mnt} would be correct.", Colors.PEACH); return True
         file_path = Path("/mnt") / path_in_mnt
-        if not file_path.exists(): print_color(f"{check_name}: File {file_path} does not exist.", Colors.RED); return False
-        try: content = file_path.read_text(); return expected_content_part in content
-        except Exception as e: print_color(f"{check_name}: Error reading {file_path}: {e}", Colors.RED); return False
+        try: content = file_path.read_text() # Open directly; ENOENT tells us what a prior exists() stat would have
+        except FileNotFoundError: print_color(f"{check_name}: File {file_path} does not exist.", Colors.RED); return False
+        except (OSError, UnicodeDecodeError) as e: print_color(f"{check_name}: Error reading {file_path}: {e}", Colors.RED); return False
+        return expected_content_part in content
 
     if not verify_step(check_file_content("etc/hostname", USER_CONFIG["hostname"], "Hostname"), "Hostname configuration", critical=True): all_ok = False
     if not verify_step(check_file_content("etc/locale.conf", f"LANG={USER_CONFIG['locale_lang']}", "Locale config"), "Locale configuration", critical=True): all_ok = False
-    if not verify_step((Path("/mnt/home") / USER_CONFIG["username"]).is_dir() if not DRY_RUN_MODE else True, f"User home directory /home/{USER_CONFIG['username']} exists", critical=True): all_ok = False
-    if not verify_step(Path("/mnt/boot/efi/loader/entries/arch-surface.conf").exists() if not DRY_RUN_MODE else True, "Systemd-boot entry file exists", critical=True): all_ok = False
-    
     kernel_img = Path("/mnt/boot/vmlinuz-linux-surface")
     initramfs_img = Path("/mnt/boot/initramfs-linux-surface.img")
     intel_ucode_img = Path("/mnt/boot/intel-ucode.img") 
-    
-    kernel_ok = kernel_img.is_file() if not DRY_RUN_MODE else True
-    initramfs_ok = initramfs_img.is_file() if not DRY_RUN_MODE else True
-    ucode_ok = intel_ucode_img.is_file() if not DRY_RUN_MODE else True
-
-    if not verify_step(kernel_ok, f"Kernel image {kernel_img} exists", critical=True): all_ok = False
-    if not verify_step(initramfs_ok, f"Initramfs image {initramfs_img} exists", critical=True): all_ok = False
-    if not verify_step(ucode_ok, f"Intel ucode image {intel_ucode_img} exists", critical=False): 
-        print_color(f"Intel ucode image {intel_ucode_img} missing. Bootloader entry might need adjustment if this is intended.", Colors.ORANGE, prefix=WARNING_SYMBOL)
-
-    if not (kernel_ok and initramfs_ok) and not DRY_RUN_MODE: 
+    presence_checks = [ # (path, is_dir, message, critical)
+        (Path("/mnt/home") / USER_CONFIG["username"], True, f"User home directory /home/{USER_CONFIG['username']} exists", True),
+        (Path("/mnt/boot/efi/loader/entries/arch-surface.conf"), False, "Systemd-boot entry file exists", True),
+        (kernel_img, False, f"Kernel image {kernel_img} exists", True),
+        (initramfs_img, False, f"Initramfs image {initramfs_img} exists", True),
+        (intel_ucode_img, False, f"Intel ucode image {intel_ucode_img} exists", False),
+        (Path("/mnt/etc/dconf/db/local.d/00-hidpi-fractional-scaling"), False, "Dconf fractional scaling file exists", False),
+    ]
+    if DRY_RUN_MODE: present = {path for path, *_ in presence_checks}
+    else: # One scandir per distinct parent directory answers every check; DirEntry type tests reuse getdents' d_type
+        listings = {parent: scan_dir(str(parent)) for parent in {path.parent for path, *_ in presence_checks}}
+        present = {path for path, is_dir, *_ in presence_checks if (entry := listings[path.parent].get(path.name)) is not None and (entry.is_dir() if is_dir else entry.is_file())}
+    for path, _, message, critical in presence_checks:
+        if verify_step(path in present, message, critical=critical): continue
+        if path == intel_ucode_img: print_color(f"Intel ucode image {intel_ucode_img} missing. Bootloader entry might need adjustment if this is intended.", Colors.ORANGE, prefix=WARNING_SYMBOL)
+        else: all_ok = False
+
+    if not {kernel_img, initramfs_img} <= present: 
         run_command(["ls", "-Alh", "/mnt/boot"], capture_output=True, destructive=False, show_spinner=False) 
-
-    if not verify_step(Path("/mnt/etc/dconf/db/local.d/00-hidpi-fractional-scaling").exists() if not DRY_RUN_MODE else True, "Dconf fractional scaling file exists", critical=False): all_ok = False
     if USER_CONFIG["add_chaotic_aur"]: 
-        if not verify_step(Path("/mnt/usr/bin/yay").exists() if not DRY_RUN_MODE else True, "yay AUR helper installed in /usr/bin", critical=False): all_ok = False
+        if not verify_step(path_exists("/mnt/usr/bin/yay") if not DRY_RUN_MODE else True, "yay AUR helper installed in /usr/bin", critical=False): all_ok = False
     
     if all_ok: print_color("Chroot configuration verification successful.", Colors.GREEN, prefix=SUCCESS_SYMBOL)
     else: print_color("One or more chroot configuration verifications FAILED.", Colors.RED, prefix=ERROR_SYMBOL)
@@ -989,8 +1328,7 @@ def main():
         if RESTART_STEP == 0 or not USER_CONFIG.get("target_drive"):
             print_color("Command line --step requires re-gathering config or target_drive is missing from loaded config.", Colors.CYAN)
             # Re-initialize USER_CONFIG to defaults if --step is forcing an early stage or config is bad
-            base_config_defaults = { "username": "bao", "hostname": "bao", "timezone": "America/Denver", "locale_lang": "en_US.UTF-8", "locale_gen": "en_US.UTF-8 UTF-8", "vconsole_keymap": "us", "target_drive": "", "efi_partition_size": "1G", "swap_size_gb": "8", "zram_fraction": "0.5", "lvm_vg_name": "vg_bao", "lvm_lv_root_name": "lv_root", "lvm_lv_swap_name": "lv_swap", "btrfs_subvol_root": "@root", "btrfs_subvol_home": "@home", "btrfs_subvol_var": "@var", "btrfs_subvol_snapshots": "@snapshots", "ssh_key_email": "kunihir0@tutanota.com", "gpg_key_name": "kunihir0", "gpg_key_email": "kunihir0@tutanota.com", "cpu_march": "icelake-client", "add_chaotic_aur": True, "default_monospace_font_pkg": "ttf-sourcecodepro-nerd", "btrfs_mount_options": "compress=zstd,ssd,noatime,discard=async" }
-            USER_CONFIG = base_config_defaults.copy() # Reset to full defaults
+            USER_CONFIG = dict(_DEFAULT_USER_CONFIG) # Reset to full defaults
             CURRENT_STEP = 0 # Force gather_config if --step implies it or config is bad
     else:
         RESTART_STEP = initial_restart_step 
@@ -1001,23 +1339,29 @@ def main():
         print_color("Target drive not configured from saved progress, critical for subsequent steps. Restarting from configuration.", Colors.ORANGE, prefix=WARNING_SYMBOL)
         CURRENT_STEP = 0 
         # Reset USER_CONFIG to ensure defaults are used if gather_initial_config is now skipped by logic but target_drive was missing
-        base_config_defaults = { "username": "bao", "hostname": "bao", "timezone": "America/Denver", "locale_lang": "en_US.UTF-8", "locale_gen": "en_US.UTF-8 UTF-8", "vconsole_keymap": "us", "target_drive": "", "efi_partition_size": "1G", "swap_size_gb": "8", "zram_fraction": "0.5", "lvm_vg_name": "vg_bao", "lvm_lv_root_name": "lv_root", "lvm_lv_swap_name": "lv_swap", "btrfs_subvol_root": "@root", "btrfs_subvol_home": "@home", "btrfs_subvol_var": "@var", "btrfs_subvol_snapshots": "@snapshots", "ssh_key_email": "kunihir0@tutanota.com", "gpg_key_name": "kunihir0", "gpg_key_email": "kunihir0@tutanota.com", "cpu_march": "icelake-client", "add_chaotic_aur": True, "default_monospace_font_pkg": "ttf-sourcecodepro-nerd", "btrfs_mount_options": "compress=zstd,ssd,noatime,discard=async" }
-        USER_CONFIG = base_config_defaults.copy()
+        USER_CONFIG = dict(_DEFAULT_USER_CONFIG)
 
 
+    for credential in (ROOT_PASSWORD, BAO_PASSWORD): credential.start_hashing() # Hash in the background while the user answers prompts
     if CURRENT_STEP == 0: # Only ask this if we are truly starting from step 0
          if not prompt_yes_no("Ready to begin the configuration process?", default_yes=True): sys.exit(0)
     
     start_time = time.time()
     try:
-        if CURRENT_STEP <= INSTALL_STEPS.index("gather_config"): gather_initial_config(); display_summary_and_confirm() 
-        if CURRENT_STEP <= INSTALL_STEPS.index("prepare_environment"): prepare_live_environment() 
-        if CURRENT_STEP <= INSTALL_STEPS.index("partition_format"): partition_and_format(); verify_partitions_lvm(args.no_verify)
-        if CURRENT_STEP <= INSTALL_STEPS.index("mount_filesystems"): mount_filesystems(); verify_mounts(args.no_verify)
-        if CURRENT_STEP <= INSTALL_STEPS.index("pacstrap_system"): pacstrap_system(); verify_pacstrap(args.no_verify)
-        if CURRENT_STEP <= INSTALL_STEPS.index("generate_fstab"): generate_fstab() 
-        if CURRENT_STEP <= INSTALL_STEPS.index("pre_chroot_files"): pre_chroot_file_configurations() 
-        if CURRENT_STEP <= INSTALL_STEPS.index("chroot_configure"): chroot_configure_system(); verify_chroot_configs(args.no_verify) 
+        verify = lambda verify_fn: functools.partial(verify_fn, args.no_verify)
+        step_pipeline = [ # (step, actions); CURRENT_STEP is re-read before each step since the actions advance it
+            ("gather_config", (gather_initial_config, display_summary_and_confirm, start_background_pacman_sync)), # Sync (and touch pacman.conf) only once the plan is accepted
+            ("prepare_environment", (prepare_live_environment,)),
+            ("partition_format", (partition_and_format, verify(verify_partitions_lvm))),
+            ("mount_filesystems", (mount_filesystems, verify(verify_mounts))),
+            ("pacstrap_system", (pacstrap_system, verify(verify_pacstrap))),
+            ("generate_fstab", (generate_fstab,)),
+            ("pre_chroot_files", (pre_chroot_file_configurations,)),
+            ("chroot_configure", (chroot_configure_system, verify(verify_chroot_configs))),
+        ]
+        for step_name, actions in step_pipeline:
+            if CURRENT_STEP <= STEP_IDX[step_name]:
+                for action in actions: action()
         
         final_cleanup_and_reboot_instructions()
 
@@ -1037,10 +1381,12 @@ def main():
         end_time = time.time(); duration = end_time - start_time
         print_color(f"\nScript finished in {duration:.2f} seconds.", Colors.PURPLE, bold=True)
 
+@buffered_output
 def final_cleanup_and_reboot_instructions(): 
+    global _LAST_SAVED_PROGRESS
     print_section_header("Finalizing Installation")
     if not DRY_RUN_MODE and PROGRESS_FILE.exists():
-        try: PROGRESS_FILE.unlink(); print_color("Removed progress tracking file.", Colors.MINT)
+        try: PROGRESS_FILE.unlink(); _LAST_SAVED_PROGRESS = None; print_color("Removed progress tracking file.", Colors.MINT)
         except Exception as e: print_color(f"Could not remove progress file: {e}", Colors.ORANGE, prefix=WARNING_SYMBOL)
     print_color("\n--- INSTALLATION SCRIPT COMPLETE (OR DRY RUN FINISHED) ---", Colors.GREEN + Colors.BOLD, prefix=SUCCESS_SYMBOL)
     if not DRY_RUN_MODE:
@@ -8,11 +8,15 @@ Orchestrates the installation process using modular components.
 
 import sys
 import os
-import argparse
-import time
-import subprocess # For CalledProcessError
+import io
+import atexit
+from subprocess import CalledProcessError
 from pathlib import Path # For sys.path modification
-from typing import List, Any, Dict
+from typing import List, Any, Dict, TYPE_CHECKING
+
+# argparse and time are imported where they are used, so importing arch.main as a library does not pay for them
+if TYPE_CHECKING:
+    import argparse
 
 # Adjust sys.path to allow running main.py directly from the parent directory
 # e.g., python arch/main.py from /home/coder/scripts
@@ -38,8 +42,9 @@ except ImportError as e:
     print("Ensure the script is run as 'python arch/main.py' from its parent directory, or that 'arch' package is in PYTHONPATH.", file=sys.stderr)
     sys.exit(1)
 
-def parse_arguments() -> argparse.Namespace:
+def parse_arguments() -> "argparse.Namespace":
     """Parses command-line arguments for the installer."""
+    import argparse
     parser = argparse.ArgumentParser(description='Arch Linux Enhanced Installer')
     parser.add_argument(
         '--dry-run',
@@ -49,10 +54,10 @@ def parse_arguments() -> argparse.Namespace:
     parser.add_argument(
         '--step',
         type=int,
-        choices=range(len(cfg.INSTALL_STEPS)),
+        choices=range(len(cfg.Step)),
         help=(
             f'Start from specific step: '
-            f'{", ".join([f"{i}:{s}" for i, s in enumerate(cfg.INSTALL_STEPS)])}'
+            f'{", ".join([f"{s.value}:{s.name.lower()}" for s in cfg.Step])}'
         )
     )
     parser.add_argument(
@@ -68,6 +73,12 @@ def main_orchestrator() -> int:
     """
     args = parse_arguments()
 
+    # Block-buffer stdout instead of flushing every line: ui.print_color writes each line in one call,
+    # and output is flushed explicitly where it matters (input() prompts, spinner frames, child processes).
+    if isinstance(sys.stdout, io.TextIOWrapper):
+        sys.stdout.reconfigure(line_buffering=False, write_through=False)
+        atexit.register(sys.stdout.flush)
+
     # Handle dry run mode based on argument or root privileges
     if os.geteuid() != 0 and not args.dry_run:
         ui.print_color("Script must be run as root for actual installation.", ui.Colors.RED, prefix=ui.ERROR_SYMBOL, bold=True)
@@ -91,11 +102,11 @@ def main_orchestrator() -> int:
 
     if args.step is not None:
         cfg.set_restart_step(args.step)
-        ui.print_color(f"Overriding progress. Starting from step {args.step} ({cfg.INSTALL_STEPS[args.step]}) as per command line.", ui.Colors.CYAN, prefix=ui.INFO_SYMBOL)
-        if cfg.get_restart_step() == 0 or not cfg.get_user_config_value("target_drive"):
+        ui.print_color(f"Overriding progress. Starting from step {args.step} ({cfg.Step(args.step).name.lower()}) as per command line.", ui.Colors.CYAN, prefix=ui.INFO_SYMBOL)
+        if cfg.get_restart_step() == 0 or not cfg.TARGET_DRIVE:
             ui.print_color("Command line --step requires re-gathering config or target_drive is missing from loaded config.", ui.Colors.CYAN)
             # Reset USER_CONFIG to defaults if --step is forcing an early stage or config is bad
-            cfg.USER_CONFIG = cfg.get_default_user_config().copy() # Reset to full defaults
+            cfg.reset_user_config() # Reset to full defaults
             cfg.set_current_step(0) # Force gather_config if --step implies it or config is bad
     else:
         cfg.set_restart_step(initial_restart_step)
@@ -103,52 +114,55 @@ def main_orchestrator() -> int:
     cfg.set_current_step(cfg.get_restart_step())
 
     # Critical check: if not starting from step 0, ensure target_drive is set
-    if cfg.get_current_step() > 0 and not cfg.get_user_config_value("target_drive"):
+    if cfg.get_current_step() > 0 and not cfg.TARGET_DRIVE:
         ui.print_color("Target drive not configured from saved progress, critical for subsequent steps. Restarting from configuration.", ui.Colors.ORANGE, prefix=ui.WARNING_SYMBOL)
         cfg.set_current_step(0)
-        cfg.USER_CONFIG = cfg.get_default_user_config().copy() # Reset USER_CONFIG
+        cfg.reset_user_config() # Reset USER_CONFIG
 
     if cfg.get_current_step() == 0: # Only ask this if we are truly starting from step 0
         if not ui.prompt_yes_no("Ready to begin the configuration process?", default_yes=True):
             sys.exit(0)
 
+    import time
     start_time = time.time()
     try:
         # --- Installation Workflow ---
-        if cfg.get_current_step() <= cfg.INSTALL_STEPS.index("gather_config"):
+        # Each step advances the current step to the next one, so comparing against the step we started from is equivalent
+        start_step: int = cfg.get_current_step()
+        if start_step <= cfg.Step.GATHER_CONFIG:
             steps.gather_initial_config() # Prompts for drive, sets defaults
             steps.display_summary_and_confirm() # Displays plan, asks for confirmation
 
-        if cfg.get_current_step() <= cfg.INSTALL_STEPS.index("prepare_environment"):
+        if start_step <= cfg.Step.PREPARE_ENVIRONMENT:
             steps.prepare_live_environment()
 
-        if cfg.get_current_step() <= cfg.INSTALL_STEPS.index("partition_format"):
+        if start_step <= cfg.Step.PARTITION_FORMAT:
             disk.partition_and_format()
             disk.verify_partitions_lvm(args.no_verify)
 
-        if cfg.get_current_step() <= cfg.INSTALL_STEPS.index("mount_filesystems"):
+        if start_step <= cfg.Step.MOUNT_FILESYSTEMS:
             filesystem.mount_filesystems()
             filesystem.verify_mounts(args.no_verify)
 
-        if cfg.get_current_step() <= cfg.INSTALL_STEPS.index("pacstrap_system"):
+        if start_step <= cfg.Step.PACSTRAP_SYSTEM:
             strap.pacstrap_system()
             strap.verify_pacstrap(args.no_verify)
 
-        if cfg.get_current_step() <= cfg.INSTALL_STEPS.index("generate_fstab"):
+        if start_step <= cfg.Step.GENERATE_FSTAB:
             filesystem.generate_fstab()
             # fstab verification is now part of generate_fstab
 
-        if cfg.get_current_step() <= cfg.INSTALL_STEPS.index("pre_chroot_files"):
+        if start_step <= cfg.Step.PRE_CHROOT_FILES:
             chroot.pre_chroot_file_configurations()
 
-        if cfg.get_current_step() <= cfg.INSTALL_STEPS.index("chroot_configure"):
+        if start_step <= cfg.Step.CHROOT_CONFIGURE:
             chroot.chroot_configure_system()
             chroot.verify_chroot_configs(args.no_verify)
         
         # Perform final integrity checks before cleanup
         # This is a new step to verify fstab, bootloader args against actual disk states
         # It should run after chroot_configure and its verification, but before the final cleanup message.
-        # We don't assign it a formal step in INSTALL_STEPS, it's part of the end-of-process checks.
+        # We don't assign it a formal Step, it's part of the end-of-process checks.
         if not cfg.get_dry_run_mode(): # Only run these checks if not in dry run, as they rely on actual system state
             if not steps.final_system_integrity_checks(args.no_verify):
                 # The function itself handles prompting the user if they want to continue on critical failure.
@@ -159,16 +173,16 @@ def main_orchestrator() -> int:
             ui.print_color("[DRY RUN] Skipping final system integrity checks.", ui.Colors.PEACH)
 
 
-        # Cleanup is the final step in the INSTALL_STEPS list
-        if cfg.get_current_step() <= cfg.INSTALL_STEPS.index("cleanup"):
+        # Cleanup is the final member of cfg.Step
+        if start_step <= cfg.Step.CLEANUP:
              steps.final_cleanup_and_reboot_instructions()
-             # cfg.set_current_step(cfg.INSTALL_STEPS.index("cleanup") + 1) # This caused "Invalid step index: 9"
+             # cfg.set_current_step(cfg.Step.CLEANUP + 1) # This caused "Invalid step index: 9"
              # The script is complete after cleanup. Current step remains 'cleanup' (index 8).
              # Progress is saved to indicate cleanup was the last completed step.
              cfg.save_progress()
 
 
-    except subprocess.CalledProcessError as e:
+    except CalledProcessError as e:
         ui.print_color(f"A critical command failed (return code {e.returncode}). Installation cannot continue.", ui.Colors.RED, prefix=ui.ERROR_SYMBOL, bold=True)
         ui.print_color(f"Command: {' '.join(e.cmd) if isinstance(e.cmd, list) else e.cmd}", ui.Colors.RED) # type: ignore
         if e.stdout:
@@ -185,6 +199,7 @@ def main_orchestrator() -> int:
     except Exception as e:
         ui.print_color(f"An unexpected error occurred: {e}", ui.Colors.RED, prefix=ui.ERROR_SYMBOL, bold=True)
         import traceback
+        sys.stdout.flush() # Keep the message above ahead of the traceback on stderr
         traceback.print_exc()
         ui.print_color("Installation aborted due to unexpected error.", ui.Colors.RED, prefix=ui.ERROR_SYMBOL, bold=True)
         return 1 # Indicate failure
@@ -7,9 +7,12 @@ and verification of the chrooted system configuration.
 """
 
 import sys
-import os # For os.chmod
+import re
+import functools
+import asyncio
+from importlib.resources import files as pkg_files
 from pathlib import Path
-from typing import Dict, Any, List as TypingList, Optional
+from typing import Dict, Any, List as TypingList, Optional, Tuple, Mapping
 import subprocess # For subprocess.CompletedProcess type hint
 
 # Attempt to import from sibling modules
@@ -27,148 +30,192 @@ except ImportError:
         print(f"Error: Failed to import 'config', 'ui', or 'core' modules in chroot.py: {e}", file=sys.stderr)
         sys.exit(1)
 
+# The chroot script template lives in the 'scripts' package next to this module's package (arch.scripts for arch.modules).
+# It is loaded through importlib.resources, which also works when the installer is shipped as a zipapp or wheel.
+_TEMPLATE_PACKAGE: str = ".".join(filter(None, [(__package__ or "").rpartition(".")[0], "scripts"]))
+_TEMPLATE_NAME: str = "chroot_script_template.sh"
+# Resolved once at import; only used when this module was loaded outside its package (e.g. as a plain 'chroot' module)
+_MODULE_DIR: Path = Path(__file__).resolve().parent
+_TEMPLATE_PATH: Path = _MODULE_DIR.parent / "scripts" / _TEMPLATE_NAME
+
+# Chroot script rendered ahead of time by pre_chroot_file_configurations; consumed by the chroot step
+_PRERENDERED_CHROOT_SCRIPT: Optional[str] = None
+
+# Every makepkg.conf patch in one alternation, so the file is rewritten in a single scan.
+# 'CFLAGS="-march=native' must come before the bare 'CFLAGS="' it starts with.
+_MAKEPKG_PATCH_RE: re.Pattern = re.compile(r'-march=x86-64|CFLAGS="-march=native|#CXXFLAGS="\$\{CFLAGS\}"|CFLAGS="')
+
 def pre_chroot_file_configurations() -> None:
     """
     Configures files within the /mnt (target) system before entering chroot.
     This includes locale, hostname, vconsole, hosts, GDM auto-login, pacman/makepkg conf, etc.
     """
     ui.print_section_header("Pre-Chroot File Configurations")
-    if cfg.get_current_step() > cfg.INSTALL_STEPS.index("pre_chroot_files"):
+    if cfg.get_current_step() > cfg.Step.PRE_CHROOT_FILES:
         ui.print_step_info("Skipping (already completed)")
         sys.stdout.write("\n"); return
 
     mnt_base: Path = Path("/mnt")
-    user_config: Dict[str, Any] = cfg.get_all_user_config()
-
-    # Locale and console
-    core.write_file_dry_run(mnt_base / "etc/locale.gen", f"{user_config['locale_gen']}\n")
-    core.write_file_dry_run(mnt_base / "etc/locale.conf", f"LANG={user_config['locale_lang']}\n")
-    core.write_file_dry_run(mnt_base / "etc/vconsole.conf", f"KEYMAP={user_config['vconsole_keymap']}\n")
-
-    # Hostname and hosts
-    core.write_file_dry_run(mnt_base / "etc/hostname", f"{user_config['hostname']}\n")
-    hosts_content: str = (
-        f"127.0.0.1 localhost\n"
-        f"::1       localhost\n"
-        f"127.0.1.1 {user_config['hostname']}.localdomain {user_config['hostname']}\n"
-    )
-    core.write_file_dry_run(mnt_base / "etc/hosts", hosts_content)
-
-    # Default editor
-    editor_script_content: str = 'export EDITOR="nvim"\nexport VISUAL="nvim"\n'
-    editor_script_path: Path = mnt_base / "etc/profile.d/editor.sh"
-    core.write_file_dry_run(editor_script_path, editor_script_content)
-    if not cfg.get_dry_run_mode():
-        try:
-            # Ensure the script is executable
-            os.chmod(editor_script_path, 0o755)
-        except Exception as e:
-            ui.print_color(f"Error setting permissions for {editor_script_path}: {e}", ui.Colors.ORANGE, prefix=ui.WARNING_SYMBOL)
-
-
-    # systemd-boot loader.conf
-    loader_conf_content: str = "default arch-*\ntimeout 3\nconsole-mode max\neditor no\n"
-    boot_efi_loader_path: Path = mnt_base / "boot/efi/loader"
-    core.make_dir_dry_run(boot_efi_loader_path, parents=True, exist_ok=True)
-    core.write_file_dry_run(boot_efi_loader_path / "loader.conf", loader_conf_content)
-
-    # GDM auto-login
-    gdm_conf_dir: Path = mnt_base / "etc/gdm"
-    core.make_dir_dry_run(gdm_conf_dir, parents=True, exist_ok=True)
-    gdm_custom_conf_content: str = f"[daemon]\nAutomaticLoginEnable=True\nAutomaticLogin={user_config['username']}\n"
-    core.write_file_dry_run(gdm_conf_dir / "custom.conf", gdm_custom_conf_content)
-
-    # Pacman configuration (enable Color)
-    pacman_conf_path: Path = mnt_base / "etc/pacman.conf"
-    if not cfg.get_dry_run_mode() and pacman_conf_path.exists():
-        try:
-            content: str = pacman_conf_path.read_text()
-            if "#Color" in content:
-                pacman_conf_path.write_text(content.replace("#Color", "Color"))
-                ui.print_color(f"Enabled Color in {pacman_conf_path}", ui.Colors.MINT)
-        except Exception as e:
-            ui.print_color(f"Error modifying {pacman_conf_path} for Color: {e}", ui.Colors.ORANGE, prefix=ui.WARNING_SYMBOL)
-
-    # Makepkg configuration (CPU optimization, CFLAGS)
-    makepkg_conf_path: Path = mnt_base / "etc/makepkg.conf"
-    if not cfg.get_dry_run_mode() and makepkg_conf_path.exists():
-        try:
-            content: str = makepkg_conf_path.read_text()
-            content = content.replace("-march=x86-64", f"-march={user_config['cpu_march']}") # Generic
-            content = content.replace("CFLAGS=\"-march=native", f"CFLAGS=\"-march={user_config['cpu_march']}") # If native is set
-            if "-O2" not in content: # Add -O2 if not present
-                 content = content.replace("CFLAGS=\"", "CFLAGS=\"-O2 ")
-            if "-pipe" not in content: # Add -pipe if not present
-                 content = content.replace("CFLAGS=\"", "CFLAGS=\"-pipe ")
-            content = content.replace("#CXXFLAGS=\"${CFLAGS}\"", "CXXFLAGS=\"${CFLAGS}\"") # Enable CXXFLAGS
-            makepkg_conf_path.write_text(content)
-            ui.print_color(f"Updated {makepkg_conf_path} with CPU optimizations.", ui.Colors.MINT)
-        except Exception as e:
-            ui.print_color(f"Error modifying {makepkg_conf_path} for CPU opts: {e}", ui.Colors.ORANGE, prefix=ui.WARNING_SYMBOL)
-
-    # ZRAM configuration
-    zram_conf_content: str = f"[zram0]\nzram-fraction = {user_config['zram_fraction']}\ncompression-algorithm = zstd\n"
-    # systemd-zram-generator expects conf in /etc/systemd/zram-generator.conf
-    # or /usr/lib/systemd/zram-generator.conf. /etc takes precedence.
-    zram_conf_dir: Path = mnt_base / "etc/systemd"
-    core.make_dir_dry_run(zram_conf_dir, parents=True, exist_ok=True) # Ensure /etc/systemd exists
-    core.write_file_dry_run(zram_conf_dir / "zram-generator.conf", zram_conf_content)
-
-
-    # Dconf fractional scaling (GNOME)
-    dconf_profile_dir: Path = mnt_base / "etc/dconf/profile"
-    core.make_dir_dry_run(dconf_profile_dir, parents=True, exist_ok=True)
-    dconf_db_locald_dir: Path = mnt_base / "etc/dconf/db/local.d"
-    core.make_dir_dry_run(dconf_db_locald_dir, parents=True, exist_ok=True)
-    core.make_dir_dry_run(mnt_base / "etc/dconf/db/locks", parents=True, exist_ok=True) # Locks dir
-    core.write_file_dry_run(dconf_profile_dir / "user", "user-db:user\nsystem-db:local\n")
-    core.write_file_dry_run(dconf_db_locald_dir / "00-hidpi-fractional-scaling", "[org/gnome/mutter]\nexperimental-features=['scale-monitor-framebuffer']\n")
-
-    # Sudoers (enable wheel group with NOPASSWD for pacman)
-    sudoers_d_dir: Path = mnt_base / "etc/sudoers.d"
-    core.make_dir_dry_run(sudoers_d_dir, parents=True, exist_ok=True)
-    sudoers_file_content: str = "%wheel ALL=(ALL:ALL) NOPASSWD: /usr/bin/pacman\n"
-    sudoers_file_path: Path = sudoers_d_dir / "10-installer-wheel-nopasswd-pacman"
-    
-    # Also ensure the main sudoers file has the wheel group line uncommented for general sudo access (with password)
-    # This is important if the user wants to sudo for commands other than pacman later.
-    main_sudoers_path: Path = mnt_base / "etc/sudoers"
-    if not cfg.get_dry_run_mode() and main_sudoers_path.exists():
-        try:
-            content: str = main_sudoers_path.read_text()
-            target_line_commented: str = "# %wheel ALL=(ALL:ALL) ALL"
-            target_line_uncommented: str = "%wheel ALL=(ALL:ALL) ALL"
-            if target_line_commented in content:
-                main_sudoers_path.write_text(content.replace(target_line_commented, target_line_uncommented))
-                ui.print_color(f"Ensured wheel group is enabled in {main_sudoers_path}", ui.Colors.MINT)
-            elif target_line_uncommented not in content:
-                 ui.print_color(f"Warning: Could not find '{target_line_commented}' or '{target_line_uncommented}' in {main_sudoers_path}. Manual check advised.", ui.Colors.ORANGE)
-
-        except Exception as e:
-            ui.print_color(f"Error modifying {main_sudoers_path}: {e}", ui.Colors.ORANGE, prefix=ui.WARNING_SYMBOL)
-
-    core.write_file_dry_run(sudoers_file_path, sudoers_file_content)
-    if not cfg.get_dry_run_mode():
-        try:
-            # sudoers.d files should have specific permissions
-            os.chmod(sudoers_file_path, 0o440)
+    user_config: Mapping[str, Any] = cfg.get_all_user_config()
+    # Snapshot values the jobs below read repeatedly
+    dry_run: bool = cfg.get_dry_run_mode()
+    hostname: str = str(user_config['hostname'])
+
+    # Each job below touches its own set of paths under /mnt, so the jobs are independent of one another.
+    # Steps that depend on each other (mkdir before write, write before chmod) stay together inside one job.
+
+    def configure_locale_console_and_hosts() -> None:
+        # Locale, console, hostname and hosts: small files straight under /etc, built up front and written in one loop
+        etc_files: TypingList[Tuple[str, str]] = [
+            ("locale.gen", f"{user_config['locale_gen']}\n"),
+            ("locale.conf", f"LANG={user_config['locale_lang']}\n"),
+            ("vconsole.conf", f"KEYMAP={user_config['vconsole_keymap']}\n"),
+            ("hostname", f"{hostname}\n"),
+            ("hosts", f"127.0.0.1 localhost\n::1       localhost\n127.0.1.1 {hostname}.localdomain {hostname}\n"),
+        ]
+        etc_dir: Path = mnt_base / "etc"
+        for file_name, content in etc_files:
+            core.write_file_dry_run(etc_dir / file_name, content)
+
+    def configure_default_editor() -> None:
+        editor_script_content: str = 'export EDITOR="nvim"\nexport VISUAL="nvim"\n'
+        editor_script_path: Path = mnt_base / "etc/profile.d/editor.sh"
+        core.write_file_dry_run(editor_script_path, editor_script_content, file_mode=0o755) # Ensure the script is executable
+
+    def configure_boot_loader() -> None:
+        # systemd-boot loader.conf
+        loader_conf_content: str = "default arch-*\ntimeout 3\nconsole-mode max\neditor no\n"
+        core.write_file_with_parents(mnt_base / "boot/efi/loader/loader.conf", loader_conf_content)
+
+    def configure_gdm_autologin() -> None:
+        gdm_custom_conf_content: str = f"[daemon]\nAutomaticLoginEnable=True\nAutomaticLogin={user_config['username']}\n"
+        core.write_file_with_parents(mnt_base / "etc/gdm/custom.conf", gdm_custom_conf_content)
+
+    def configure_pacman_color() -> None:
+        pacman_conf_path: Path = mnt_base / "etc/pacman.conf"
+        if not dry_run and pacman_conf_path.exists():
+            try:
+                # Only decode and rewrite the file when the commented-out option is actually there
+                if core.find_in_file(pacman_conf_path, [b"#Color"])[b"#Color"]:
+                    content: str = pacman_conf_path.read_text()
+                    pacman_conf_path.write_text(content.replace("#Color", "Color"))
+                    ui.print_color(f"Enabled Color in {pacman_conf_path}", ui.Colors.MINT)
+            except Exception as e:
+                ui.print_color(f"Error modifying {pacman_conf_path} for Color: {e}", ui.Colors.ORANGE, prefix=ui.WARNING_SYMBOL)
+
+    def configure_makepkg_flags() -> None:
+        # Makepkg configuration (CPU optimization, CFLAGS)
+        makepkg_conf_path: Path = mnt_base / "etc/makepkg.conf"
+        if not dry_run and makepkg_conf_path.exists():
+            try:
+                found: Dict[bytes, bool] = core.find_in_file(
+                    makepkg_conf_path, [b"-march=x86-64", b'CFLAGS="-march=native', b"-O2", b"-pipe", b'#CXXFLAGS="${CFLAGS}"']
+                )
+                if not (found[b"-march=x86-64"] or found[b'CFLAGS="-march=native'] or found[b'#CXXFLAGS="${CFLAGS}"']) \
+                        and found[b"-O2"] and found[b"-pipe"]:
+                    ui.print_color(f"{makepkg_conf_path} needs no CPU optimization changes.", ui.Colors.MINT)
+                    return
+                march_flag: str = f"-march={user_config['cpu_march']}"
+                # Flags missing from the file get prepended to every CFLAGS=" assignment
+                cflags_prefix: str = ("" if found[b"-pipe"] else "-pipe ") + ("" if found[b"-O2"] else "-O2 ")
+                replacements: Dict[str, str] = {
+                    "-march=x86-64": march_flag, # Generic
+                    "CFLAGS=\"-march=native": f"CFLAGS=\"{cflags_prefix}{march_flag}", # If native is set
+                    "#CXXFLAGS=\"${CFLAGS}\"": "CXXFLAGS=\"${CFLAGS}\"", # Enable CXXFLAGS
+                    "CFLAGS=\"": f"CFLAGS=\"{cflags_prefix}",
+                }
+                content: str = _MAKEPKG_PATCH_RE.sub(lambda match: replacements[match.group(0)], makepkg_conf_path.read_text())
+                makepkg_conf_path.write_text(content)
+                ui.print_color(f"Updated {makepkg_conf_path} with CPU optimizations.", ui.Colors.MINT)
+            except Exception as e:
+                ui.print_color(f"Error modifying {makepkg_conf_path} for CPU opts: {e}", ui.Colors.ORANGE, prefix=ui.WARNING_SYMBOL)
+
+    def configure_zram() -> None:
+        zram_conf_content: str = f"[zram0]\nzram-fraction = {user_config['zram_fraction']}\ncompression-algorithm = zstd\n"
+        # systemd-zram-generator expects conf in /etc/systemd/zram-generator.conf
+        # or /usr/lib/systemd/zram-generator.conf. /etc takes precedence.
+        core.write_file_with_parents(mnt_base / "etc/systemd/zram-generator.conf", zram_conf_content)
+
+    def configure_dconf_scaling() -> None:
+        # Dconf fractional scaling (GNOME)
+        core.write_file_with_parents(mnt_base / "etc/dconf/profile/user", "user-db:user\nsystem-db:local\n")
+        core.write_file_with_parents(mnt_base / "etc/dconf/db/local.d/00-hidpi-fractional-scaling", "[org/gnome/mutter]\nexperimental-features=['scale-monitor-framebuffer']\n")
+        core.make_dir_dry_run(mnt_base / "etc/dconf/db/locks", parents=True, exist_ok=True) # Locks dir
+
+    def configure_main_sudoers() -> None:
+        # Ensure the main sudoers file has the wheel group line uncommented for general sudo access (with password)
+        # This is important if the user wants to sudo for commands other than pacman later.
+        main_sudoers_path: Path = mnt_base / "etc/sudoers"
+        if not dry_run and main_sudoers_path.exists():
+            try:
+                target_line_commented: str = "# %wheel ALL=(ALL:ALL) ALL"
+                target_line_uncommented: str = "%wheel ALL=(ALL:ALL) ALL"
+                found: Dict[bytes, bool] = core.find_in_file(main_sudoers_path, [target_line_commented.encode(), target_line_uncommented.encode()])
+                if found[target_line_commented.encode()]:
+                    content: str = main_sudoers_path.read_text()
+                    main_sudoers_path.write_text(content.replace(target_line_commented, target_line_uncommented))
+                    ui.print_color(f"Ensured wheel group is enabled in {main_sudoers_path}", ui.Colors.MINT)
+                elif not found[target_line_uncommented.encode()]:
+                     ui.print_color(f"Warning: Could not find '{target_line_commented}' or '{target_line_uncommented}' in {main_sudoers_path}. Manual check advised.", ui.Colors.ORANGE)
+
+            except Exception as e:
+                ui.print_color(f"Error modifying {main_sudoers_path}: {e}", ui.Colors.ORANGE, prefix=ui.WARNING_SYMBOL)
+
+    def configure_sudoers_pacman_nopasswd() -> None:
+        # Sudoers (enable wheel group with NOPASSWD for pacman)
+        sudoers_file_content: str = "%wheel ALL=(ALL:ALL) NOPASSWD: /usr/bin/pacman\n"
+        sudoers_file_path: Path = mnt_base / "etc/sudoers.d/10-installer-wheel-nopasswd-pacman"
+        # sudoers.d files should have specific permissions
+        core.write_file_with_parents(sudoers_file_path, sudoers_file_content, file_mode=0o440)
+        if not dry_run:
             ui.print_color(f"Configured NOPASSWD for pacman for wheel group via {sudoers_file_path.relative_to(mnt_base)}", ui.Colors.MINT)
-        except Exception as e:
-            ui.print_color(f"Error setting permissions for {sudoers_file_path}: {e}", ui.Colors.ORANGE, prefix=ui.WARNING_SYMBOL)
-            
+
+    def prerender_chroot_script() -> None:
+        # Rendering the chroot script needs nothing from the files above, so do it while they are written
+        global _PRERENDERED_CHROOT_SCRIPT
+        _PRERENDERED_CHROOT_SCRIPT = _render_chroot_script_content()
+
+    core.run_io_jobs_concurrently([
+        configure_locale_console_and_hosts, configure_default_editor,
+        configure_boot_loader, configure_gdm_autologin, configure_pacman_color, configure_makepkg_flags,
+        configure_zram, configure_dconf_scaling, configure_main_sudoers, configure_sudoers_pacman_nopasswd,
+        prerender_chroot_script,
+    ])
+
     ui.print_color("Pre-chroot file configurations complete.", ui.Colors.GREEN, prefix=ui.SUCCESS_SYMBOL)
-    cfg.set_current_step(cfg.INSTALL_STEPS.index("chroot_configure"))
+    cfg.set_current_step(cfg.Step.CHROOT_CONFIGURE)
     cfg.save_progress()
     sys.stdout.write("\n")
 
 
-def _generate_and_write_chroot_script_content() -> Path:
+@functools.lru_cache(maxsize=1)
+def _load_chroot_script_template() -> str:
+    """
+    Reads the chroot script template from its package. The template does not change while the
+    installer runs, so the text is read once and reused on later calls.
+    Exits if the template is missing or unreadable.
+    """
+    template_source: Any # importlib.resources Traversable, or a Path for the fallback
+    try:
+        template_source = pkg_files(_TEMPLATE_PACKAGE).joinpath(_TEMPLATE_NAME)
+    except ModuleNotFoundError:
+        template_source = _TEMPLATE_PATH
+
+    try:
+        return template_source.read_text(encoding="utf-8")
+    except FileNotFoundError:
+        ui.print_color(f"CRITICAL ERROR: Chroot script template not found at {template_source}", ui.Colors.RED, prefix=ui.ERROR_SYMBOL)
+        sys.exit(1)
+    except Exception as e:
+        ui.print_color(f"CRITICAL ERROR: Could not read chroot script template from {template_source}: {e}", ui.Colors.RED, prefix=ui.ERROR_SYMBOL)
+        sys.exit(1)
+
+def _render_chroot_script_content() -> str:
     """
-    Reads the chroot script template, substitutes configuration values,
-    and writes it to /mnt/chroot_script.sh.
-    Returns the relative path of the script within /mnt.
+    Reads the chroot script template and substitutes configuration values.
+    Pure text work with no on-disk dependencies, so it can run ahead of the chroot step.
     """
-    user_config: Dict[str, Any] = cfg.get_all_user_config()
+    user_config: Mapping[str, Any] = cfg.get_all_user_config()
     bao_password: str = str(cfg.BAO_PASSWORD)
     root_password: str = str(cfg.ROOT_PASSWORD)
 
@@ -194,86 +241,69 @@ if ! grep -q '$HOME/.local/bin' "$PROFILE_TARGET_FILE" >/dev/null 2>&1 ; then
 fi
 '''
 
-    # Determine the path to the template file
-    # Assuming chroot.py is in arch/modules/ and template is in arch/scripts/
-    try:
-        # Path from this file (arch/modules/chroot.py) to project root (directory containing 'arch')
-        project_root_dir = Path(__file__).resolve().parent.parent.parent
-        template_path = project_root_dir / "arch" / "scripts" / "chroot_script_template.sh"
-    except NameError: # __file__ is not defined (e.g. in interactive interpreter)
-        # Fallback or error, this should not happen when run as a script/module
-        ui.print_color("CRITICAL ERROR: Cannot determine script template path (__file__ not defined).", ui.Colors.RED, prefix=ui.ERROR_SYMBOL)
-        sys.exit(1)
-
-
-    if not template_path.exists():
-        ui.print_color(f"CRITICAL ERROR: Chroot script template not found at {template_path}", ui.Colors.RED, prefix=ui.ERROR_SYMBOL)
-        sys.exit(1)
-
-    try:
-        chroot_script_content_template: str = template_path.read_text(encoding="utf-8")
-    except Exception as e:
-        ui.print_color(f"CRITICAL ERROR: Could not read chroot script template from {template_path}: {e}", ui.Colors.RED, prefix=ui.ERROR_SYMBOL)
-        sys.exit(1)
+    chroot_script_content_template: str = _load_chroot_script_template()
 
-    # Perform substitutions
-    final_script: str = chroot_script_content_template
-
-    # Substitute the heredoc first
-    final_script = final_script.replace("{path_setup_bash_profile_heredoc}", path_setup_bash_profile_heredoc)
-
-    # Substitute from USER_CONFIG
+    # Build one placeholder -> value mapping and substitute everything in a single regex pass over the template,
+    # instead of one str.replace pass (and one new string) per key.
+    substitutions: Dict[str, str] = {
+        "{path_setup_bash_profile_heredoc}": path_setup_bash_profile_heredoc,
+        "__SETUP_BAO_PASSWORD__": bao_password,
+        "__SETUP_ROOT_PASSWORD__": root_password,
+    }
     for key, value in user_config.items():
-        template_var: str = f"__SETUP_{key.upper()}__"
         # Ensure boolean values are lowercased strings for shell script logic (e.g., "true" or "false")
-        str_value: str = str(value).lower() if isinstance(value, bool) else str(value)
-        final_script = final_script.replace(template_var, str_value)
+        substitutions[f"__SETUP_{key.upper()}__"] = str(value).lower() if isinstance(value, bool) else str(value)
+    # Longest keys first so no placeholder can shadow a longer one that starts with it
+    placeholder_pattern: re.Pattern = re.compile("|".join(map(re.escape, sorted(substitutions, key=len, reverse=True))))
 
-    # Substitute passwords
-    final_script = final_script.replace("__SETUP_BAO_PASSWORD__", bao_password)
-    final_script = final_script.replace("__SETUP_ROOT_PASSWORD__", root_password)
-    
-    # Substitute UI Colors (these are already hardcoded in the .sh template, so this is not strictly needed anymore
-    # but kept for robustness if template changes or for other potential ui elements)
-    # For example, if the template used {ui.Colors.RED}
-    # This part can be removed if all colors are hardcoded in the .sh file.
-    # For now, let's assume the .sh template has hardcoded ANSI codes.
+    def _substitute(text: str) -> str:
+        return placeholder_pattern.sub(lambda match: substitutions[match.group(0)], text)
 
-    chroot_script_target_path_mounted: Path = Path("/mnt/chroot_script.sh")
-    core.write_file_dry_run(chroot_script_target_path_mounted, final_script)
-    if not cfg.get_dry_run_mode():
-        try:
-            os.chmod(chroot_script_target_path_mounted, 0o755) # Make it executable
-        except Exception as e:
-            ui.print_color(f"Error setting permissions for {chroot_script_target_path_mounted}: {e}", ui.Colors.ORANGE, prefix=ui.WARNING_SYMBOL)
+    # The heredoc carries placeholders of its own (e.g. __SETUP_USERNAME__), so render it before it is spliced in
+    substitutions["{path_setup_bash_profile_heredoc}"] = _substitute(path_setup_bash_profile_heredoc)
+    # Colors are hardcoded as ANSI escapes in the .sh template, so there is no separate color substitution pass
+    return _substitute(chroot_script_content_template)
 
-    return chroot_script_target_path_mounted.relative_to("/mnt")
+def _take_chroot_script_content() -> str:
+    """
+    Returns the rendered chroot script, reusing the copy rendered during the pre-chroot step
+    when there is one (rendering it now otherwise, e.g. after --step).
+    The script is wrapped in a { ...; } < /dev/null group: bash -s reads the script from stdin, so the group
+    is parsed in full before it runs and no command inside can swallow the rest of the script as its input.
+    """
+    global _PRERENDERED_CHROOT_SCRIPT
+    final_script: str = _PRERENDERED_CHROOT_SCRIPT if _PRERENDERED_CHROOT_SCRIPT is not None else _render_chroot_script_content()
+    _PRERENDERED_CHROOT_SCRIPT = None
+    return "{\n" + final_script + "\n} < /dev/null\n"
 
 
 def chroot_configure_system() -> None:
     """
-    Generates and executes a script within the chroot environment to configure the system.
+    Generates the chroot configuration script and pipes it into bash inside the chroot.
+    Nothing is written to (or later removed from) the target filesystem for it.
     """
     ui.print_section_header("Configuring System (chroot)")
-    if cfg.get_current_step() > cfg.INSTALL_STEPS.index("chroot_configure"):
+    if cfg.get_current_step() > cfg.Step.CHROOT_CONFIGURE:
         ui.print_step_info("Skipping (already completed)")
         sys.stdout.write("\n"); return
 
-    relative_chroot_script_path: Path = _generate_and_write_chroot_script_content()
-    ui.print_step_info(f"Executing generated chroot script: /{relative_chroot_script_path}")
+    chroot_script: str = _take_chroot_script_content()
+    ui.print_step_info("Piping generated chroot script into bash inside the chroot (nothing is written to /mnt)...")
+    if cfg.get_dry_run_mode():
+        ui.print_color("--BEGIN CONTENT for chroot script (stdin)--", ui.Colors.PEACH)
+        sys.stdout.write(chroot_script[:300] + ('...' if len(chroot_script) > 300 else '') + "\n")
+        ui.print_color("--END CONTENT for chroot script (stdin)--", ui.Colors.PEACH)
 
-    # Execute the script using arch-chroot
-    core.run_command(
-        ["arch-chroot", "/mnt", "/bin/bash", f"/{str(relative_chroot_script_path)}"],
+    # Execute the script using arch-chroot, streaming its output live for the whole (multi-minute) run
+    asyncio.run(core.run_command_async(
+        ["arch-chroot", "/mnt", "/bin/bash", "-s"],
         destructive=True,
-        retry_count=1 # Chroot script itself should be idempotent or handle its own retries if needed
-    )
+        retry_count=1, # Chroot script itself should be idempotent or handle its own retries if needed
+        input_data=chroot_script.encode("utf-8")
+    ))
 
-    # Clean up the script from /mnt after execution
-    core.unlink_file_dry_run(Path("/mnt") / relative_chroot_script_path)
-    
     ui.print_color("System configuration in chroot complete.", ui.Colors.GREEN, prefix=ui.SUCCESS_SYMBOL)
-    cfg.set_current_step(cfg.INSTALL_STEPS.index("cleanup")) # Assuming 'cleanup' is the next step
+    cfg.set_current_step(cfg.Step.CLEANUP) # Assuming 'cleanup' is the next step
     cfg.save_progress()
     sys.stdout.write("\n")
 
@@ -289,63 +319,92 @@ def verify_chroot_configs(no_verify_arg: bool) -> None:
 
     ui.print_section_header("Verifying Chroot Configuration")
     all_ok: bool = True
-    user_config: Dict[str, Any] = cfg.get_all_user_config()
+    user_config: Mapping[str, Any] = cfg.get_all_user_config()
     mnt_base: Path = Path("/mnt")
+    dry_run: bool = cfg.get_dry_run_mode()
 
-    def _check_file_content(path_in_mnt_str: str, expected_content_part: str, check_name: str) -> bool:
-        if cfg.get_dry_run_mode():
+    # Pick the dry-run or live variant of each probe once here, instead of branching on dry run inside every check
+    if dry_run:
+        async def _check_file_content(path_in_mnt_str: str, expected_content_part: str, check_name: str) -> bool:
             ui.print_color(f"[DRY RUN] Assuming {check_name} at {path_in_mnt_str} would be correct.", ui.Colors.PEACH)
             return True
-        file_path: Path = mnt_base / path_in_mnt_str
-        if not file_path.exists():
-            ui.print_color(f"{check_name}: File {file_path} does not exist.", ui.Colors.RED)
-            return False
-        try:
-            content: str = file_path.read_text()
-            return expected_content_part in content
-        except Exception as e:
-            ui.print_color(f"{check_name}: Error reading {file_path}: {e}", ui.Colors.RED)
-            return False
 
-    # Verify hostname
-    if not core.verify_step(_check_file_content("etc/hostname", str(user_config["hostname"]), "Hostname"), "Hostname configuration", critical=True): all_ok = False
-    # Verify locale.conf
-    if not core.verify_step(_check_file_content("etc/locale.conf", f"LANG={user_config['locale_lang']}", "Locale config"), "Locale configuration", critical=True): all_ok = False
-    # Verify user home directory
+        async def _exists(path: Path) -> bool: return True
+        _is_dir = _is_file = _exists
+    else:
+        async def _check_file_content(path_in_mnt_str: str, expected_content_part: str, check_name: str) -> bool:
+            file_path: Path = mnt_base / path_in_mnt_str
+            if not await asyncio.to_thread(file_path.exists):
+                ui.print_color(f"{check_name}: File {file_path} does not exist.", ui.Colors.RED)
+                return False
+            try:
+                content: str = await asyncio.to_thread(file_path.read_text)
+                return expected_content_part in content
+            except Exception as e:
+                ui.print_color(f"{check_name}: Error reading {file_path}: {e}", ui.Colors.RED)
+                return False
+
+        async def _exists(path: Path) -> bool: return await asyncio.to_thread(path.exists)
+        async def _is_dir(path: Path) -> bool: return await asyncio.to_thread(path.is_dir)
+        async def _is_file(path: Path) -> bool: return await asyncio.to_thread(path.is_file)
+
     user_home_path: Path = mnt_base / "home" / str(user_config["username"])
-    if not core.verify_step(user_home_path.is_dir() if not cfg.get_dry_run_mode() else True, f"User home directory {user_home_path.relative_to(mnt_base)} exists", critical=True): all_ok = False
-    
-    # Verify systemd-boot entry
     boot_entry_path: Path = mnt_base / "boot/efi/loader/entries/arch-surface.conf"
-    if not core.verify_step(boot_entry_path.exists() if not cfg.get_dry_run_mode() else True, "Systemd-boot entry file exists", critical=True): all_ok = False
-
-    # Verify kernel, initramfs, and ucode images in /mnt/boot
     kernel_img_path: Path = mnt_base / "boot/vmlinuz-linux-surface"
     initramfs_img_path: Path = mnt_base / "boot/initramfs-linux-surface.img"
     intel_ucode_img_path: Path = mnt_base / "boot/intel-ucode.img"
+    dconf_scaling_file: Path = mnt_base / "etc/dconf/db/local.d/00-hidpi-fractional-scaling"
+    yay_path: Path = mnt_base / "usr/bin/yay" # yay is typically installed here
+    check_yay: bool = bool(user_config.get("add_chaotic_aur", False))
+
+    # None of the checks depend on each other, so run all the stats/reads concurrently and
+    # report the results afterwards in a fixed order.
+    async def _run_all_checks() -> TypingList[Any]:
+        return await asyncio.gather(
+            _check_file_content("etc/hostname", str(user_config["hostname"]), "Hostname"),
+            _check_file_content("etc/locale.conf", f"LANG={user_config['locale_lang']}", "Locale config"),
+            _is_dir(user_home_path),
+            _exists(boot_entry_path),
+            _is_file(kernel_img_path),
+            _is_file(initramfs_img_path),
+            _is_file(intel_ucode_img_path),
+            _exists(dconf_scaling_file),
+            _exists(yay_path) if check_yay else asyncio.sleep(0, result=True),
+            return_exceptions=True,
+        )
+
+    # A check that raised counts as failed
+    (hostname_ok, locale_ok, home_ok, boot_entry_ok, kernel_ok, initramfs_ok, ucode_ok, dconf_ok, yay_ok) = (
+        result is True for result in asyncio.run(_run_all_checks())
+    )
 
-    kernel_ok: bool = kernel_img_path.is_file() if not cfg.get_dry_run_mode() else True
-    initramfs_ok: bool = initramfs_img_path.is_file() if not cfg.get_dry_run_mode() else True
-    ucode_ok: bool = intel_ucode_img_path.is_file() if not cfg.get_dry_run_mode() else True
+    # Verify hostname
+    if not core.verify_step(hostname_ok, "Hostname configuration", critical=True): all_ok = False
+    # Verify locale.conf
+    if not core.verify_step(locale_ok, "Locale configuration", critical=True): all_ok = False
+    # Verify user home directory
+    if not core.verify_step(home_ok, f"User home directory {user_home_path.relative_to(mnt_base)} exists", critical=True): all_ok = False
+    
+    # Verify systemd-boot entry
+    if not core.verify_step(boot_entry_ok, "Systemd-boot entry file exists", critical=True): all_ok = False
 
+    # Verify kernel, initramfs, and ucode images in /mnt/boot
     if not core.verify_step(kernel_ok, f"Kernel image {kernel_img_path.relative_to(mnt_base)} exists", critical=True): all_ok = False
     if not core.verify_step(initramfs_ok, f"Initramfs image {initramfs_img_path.relative_to(mnt_base)} exists", critical=True): all_ok = False
     if not core.verify_step(ucode_ok, f"Intel ucode image {intel_ucode_img_path.relative_to(mnt_base)} exists", critical=False): # ucode might be optional for some setups
         ui.print_color(f"Intel ucode image {intel_ucode_img_path.relative_to(mnt_base)} missing. Bootloader entry might need adjustment if this is intended.", ui.Colors.ORANGE, prefix=ui.WARNING_SYMBOL)
         # all_ok remains true if ucode is missing but not critical for this check
 
-    if not (kernel_ok and initramfs_ok) and not cfg.get_dry_run_mode():
+    if not (kernel_ok and initramfs_ok) and not dry_run:
         ui.print_color(f"Listing {mnt_base / 'boot'} contents for diagnostics:", ui.Colors.ORANGE)
         core.run_command(["ls", "-Alh", str(mnt_base / "boot")], capture_output=True, destructive=False, show_spinner=False)
 
     # Verify dconf fractional scaling file
-    dconf_scaling_file: Path = mnt_base / "etc/dconf/db/local.d/00-hidpi-fractional-scaling"
-    if not core.verify_step(dconf_scaling_file.exists() if not cfg.get_dry_run_mode() else True, "Dconf fractional scaling file exists", critical=False): all_ok = False # Not strictly critical for boot
+    if not core.verify_step(dconf_ok, "Dconf fractional scaling file exists", critical=False): all_ok = False # Not strictly critical for boot
 
     # Verify yay if Chaotic-AUR was added
-    if user_config.get("add_chaotic_aur", False):
-        yay_path: Path = mnt_base / "usr/bin/yay" # yay is typically installed here
-        if not core.verify_step(yay_path.exists() if not cfg.get_dry_run_mode() else True, "yay AUR helper installed", critical=False): all_ok = False
+    if check_yay:
+        if not core.verify_step(yay_ok, "yay AUR helper installed", critical=False): all_ok = False
 
 
     if all_ok:
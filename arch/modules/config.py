@@ -6,9 +6,19 @@ Handles global configuration, progress tracking, and constants for the Arch Linu
 """
 
 import json
+import os
 import sys
+from enum import IntEnum
 from pathlib import Path
-from typing import Dict, Any, List, Tuple
+from types import MappingProxyType
+from typing import Dict, Any, Tuple, Mapping, FrozenSet
+
+# orjson is optional: it serializes straight to bytes and is faster than the stdlib json,
+# but the live environment may not have it, so fall back to json when it is missing.
+try:
+    import orjson # type: ignore
+except ImportError:
+    orjson = None # type: ignore
 
 # Attempt to import from sibling ui module
 try:
@@ -32,22 +42,27 @@ except ImportError:
 DRY_RUN_MODE: bool = False
 
 # --- Installation Steps Tracking ---
-INSTALL_STEPS: List[str] = [
-    "gather_config",        # 0
-    "prepare_environment",  # 1
-    "partition_format",     # 2
-    "mount_filesystems",    # 3
-    "pacstrap_system",      # 4
-    "generate_fstab",       # 5
-    "pre_chroot_files",     # 6
-    "chroot_configure",     # 7
-    "cleanup"               # 8
-]
+class Step(IntEnum):
+    """The installation steps, in order; the value is the step index saved in the progress file."""
+    GATHER_CONFIG = 0
+    PREPARE_ENVIRONMENT = 1
+    PARTITION_FORMAT = 2
+    MOUNT_FILESYSTEMS = 3
+    PACSTRAP_SYSTEM = 4
+    GENERATE_FSTAB = 5
+    PRE_CHROOT_FILES = 6
+    CHROOT_CONFIGURE = 7
+    CLEANUP = 8
+
+# Valid step indices; IntEnum members hash like their ints, so membership replaces the range/len() check
+_VALID_STEPS: FrozenSet[int] = frozenset(Step)
 CURRENT_STEP: int = 0
 RESTART_STEP: int = 0
 
 # --- Configuration Constants (User-configurable defaults) ---
-USER_CONFIG: Dict[str, Any] = {
+# The single source of the defaults; read-only so it cannot drift. USER_CONFIG and
+# get_default_user_config() hand out plain dict copies of it.
+_DEFAULT_USER_CONFIG: Mapping[str, Any] = MappingProxyType({
     "username": "bao",
     "hostname": "bao",
     "timezone": "America/Denver",
@@ -74,7 +89,31 @@ USER_CONFIG: Dict[str, Any] = {
     "add_chaotic_aur": True,
     "default_monospace_font_pkg": "ttf-sourcecodepro-nerd"
     # "btrfs_mount_options": "compress=zstd,ssd,noatime,discard=async" # Removed for ext4
-}
+})
+USER_CONFIG: Dict[str, Any] = dict(_DEFAULT_USER_CONFIG)
+# Read-only, zero-copy view handed out by get_all_user_config(). It tracks USER_CONFIG as long as
+# that dict is updated in place (see reset_user_config), never rebound.
+_USER_CONFIG_VIEW: Mapping[str, Any] = MappingProxyType(USER_CONFIG)
+
+# Frequently read USER_CONFIG values mirrored as plain module attributes, so hot paths can read
+# cfg.TARGET_DRIVE instead of calling get_user_config_value. Every USER_CONFIG mutator in this
+# module calls _sync_hot_config_values() to keep them current.
+_HOT_CONFIG_KEYS: Tuple[Tuple[str, str], ...] = (
+    ("target_drive", "TARGET_DRIVE"),
+    ("lvm_vg_name", "LVM_VG_NAME"),
+    ("lvm_lv_root_name", "LVM_LV_ROOT_NAME"),
+    ("lvm_lv_swap_name", "LVM_LV_SWAP_NAME"),
+)
+TARGET_DRIVE: Any = USER_CONFIG["target_drive"]
+LVM_VG_NAME: Any = USER_CONFIG["lvm_vg_name"]
+LVM_LV_ROOT_NAME: Any = USER_CONFIG["lvm_lv_root_name"]
+LVM_LV_SWAP_NAME: Any = USER_CONFIG["lvm_lv_swap_name"]
+
+def _sync_hot_config_values() -> None:
+    """Copies the hot USER_CONFIG keys into their module attributes."""
+    module_globals: Dict[str, Any] = globals()
+    for key, attr in _HOT_CONFIG_KEYS:
+        module_globals[attr] = USER_CONFIG.get(key)
 
 # Hardcoded Passwords (Consider secure handling in a real application)
 BAO_PASSWORD: str = "7317"
@@ -83,6 +122,18 @@ ROOT_PASSWORD: str = "73177317"
 PROGRESS_FILE: Path = Path("/tmp/arch_install_progress.json")
 
 
+def _dump_json(data: Any) -> bytes:
+    """Serializes data to indented JSON bytes, using orjson when it is available."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8") # Same layout as orjson's OPT_INDENT_2
+
+def _load_json(raw: bytes) -> Any:
+    """Parses JSON bytes, using orjson when it is available."""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
 def save_progress() -> None:
     """Saves the current installation step and user configuration to a progress file."""
     global USER_CONFIG, CURRENT_STEP
@@ -92,8 +143,12 @@ def save_progress() -> None:
                 "current_step": CURRENT_STEP,
                 "user_config": USER_CONFIG
             }
-            with open(PROGRESS_FILE, "w", encoding="utf-8") as f:
-                json.dump(progress_data, f, indent=4)
+            # Write a sibling temp file and rename it over the real one: os.replace is atomic, so a
+            # crash mid-write leaves the previous progress intact instead of a truncated file.
+            tmp_file: Path = PROGRESS_FILE.with_name(PROGRESS_FILE.name + ".tmp")
+            with open(tmp_file, "wb") as f:
+                f.write(_dump_json(progress_data))
+            os.replace(tmp_file, PROGRESS_FILE)
         except Exception as e:
             ui.print_color(f"Note: Could not save progress: {e}", ui.Colors.YELLOW, prefix=ui.WARNING_SYMBOL)
 
@@ -104,30 +159,33 @@ def load_progress() -> int:
     Returns the step to restart from, or 0 if no valid progress is found.
     """
     global RESTART_STEP, USER_CONFIG
-    if PROGRESS_FILE.exists():
-        try:
-            with open(PROGRESS_FILE, "r", encoding="utf-8") as f:
-                progress_data: Dict[str, Any] = json.load(f)
-
-            step: Any = progress_data.get("current_step")
-            loaded_user_config: Any = progress_data.get("user_config")
-
-            if isinstance(step, int) and 0 <= step < len(INSTALL_STEPS) and isinstance(loaded_user_config, dict):
-                RESTART_STEP = step
-                USER_CONFIG.update(loaded_user_config)
-                ui.print_color(f"Found saved progress at step {step} ({INSTALL_STEPS[step]}) and loaded USER_CONFIG.", ui.Colors.CYAN, prefix=ui.INFO_SYMBOL)
-
-                if not USER_CONFIG.get("target_drive"):
-                    ui.print_color("Loaded USER_CONFIG is missing 'target_drive'. Restarting from configuration.", ui.Colors.ORANGE, prefix=ui.WARNING_SYMBOL)
-                    PROGRESS_FILE.unlink(missing_ok=True)
-                    return 0
-                return step
-            else:
-                ui.print_color("Invalid data in progress file. Starting from beginning.", ui.Colors.ORANGE, prefix=ui.WARNING_SYMBOL)
+    try:
+        with open(PROGRESS_FILE, "rb") as f:
+            progress_data: Dict[str, Any] = _load_json(f.read())
+
+        step: Any = progress_data.get("current_step")
+        loaded_user_config: Any = progress_data.get("user_config")
+
+        if isinstance(step, int) and step in _VALID_STEPS and isinstance(loaded_user_config, dict):
+            RESTART_STEP = step
+            USER_CONFIG.update(loaded_user_config)
+            _sync_hot_config_values()
+            ui.print_color(f"Found saved progress at step {step} ({Step(step).name.lower()}) and loaded USER_CONFIG.", ui.Colors.CYAN, prefix=ui.INFO_SYMBOL)
+
+            if not USER_CONFIG.get("target_drive"):
+                ui.print_color("Loaded USER_CONFIG is missing 'target_drive'. Restarting from configuration.", ui.Colors.ORANGE, prefix=ui.WARNING_SYMBOL)
                 PROGRESS_FILE.unlink(missing_ok=True)
-        except Exception as e:
-            ui.print_color(f"Could not load progress file ({e}). Starting from beginning.", ui.Colors.ORANGE, prefix=ui.WARNING_SYMBOL)
+                return 0
+            return step
+        else:
+            ui.print_color("Invalid data in progress file. Starting from beginning.", ui.Colors.ORANGE, prefix=ui.WARNING_SYMBOL)
             PROGRESS_FILE.unlink(missing_ok=True)
+    except FileNotFoundError:
+        # No saved progress. Opening directly (EAFP) saves a separate exists() stat and cannot race with it.
+        return 0
+    except Exception as e:
+        ui.print_color(f"Could not load progress file ({e}). Starting from beginning.", ui.Colors.ORANGE, prefix=ui.WARNING_SYMBOL)
+        PROGRESS_FILE.unlink(missing_ok=True)
     return 0
 
 def set_dry_run_mode(mode: bool) -> None:
@@ -142,7 +200,7 @@ def get_dry_run_mode() -> bool:
 def set_current_step(step_index: int) -> None:
     """Sets the current installation step."""
     global CURRENT_STEP
-    if 0 <= step_index < len(INSTALL_STEPS):
+    if step_index in _VALID_STEPS:
         CURRENT_STEP = step_index
     else:
         ui.print_color(f"Invalid step index: {step_index}", ui.Colors.RED, prefix=ui.ERROR_SYMBOL)
@@ -159,15 +217,26 @@ def update_user_config_value(key: str, value: Any) -> None:
     """Updates a specific value in USER_CONFIG."""
     global USER_CONFIG
     USER_CONFIG[key] = value
+    _sync_hot_config_values()
+
+def get_all_user_config() -> Mapping[str, Any]:
+    """Returns a read-only live view of the entire USER_CONFIG dictionary (no copy is made)."""
+    return _USER_CONFIG_VIEW
 
-def get_all_user_config() -> Dict[str, Any]:
-    """Returns a copy of the entire USER_CONFIG dictionary."""
+def get_user_config_snapshot() -> Dict[str, Any]:
+    """Returns a mutable copy of the entire USER_CONFIG dictionary, for callers that need one."""
     return USER_CONFIG.copy()
 
+def reset_user_config() -> None:
+    """Resets USER_CONFIG to the defaults in place, keeping the get_all_user_config() view valid."""
+    USER_CONFIG.clear()
+    USER_CONFIG.update(_DEFAULT_USER_CONFIG)
+    _sync_hot_config_values()
+
 def set_restart_step(step_index: int) -> None:
     """Sets the restart step index."""
     global RESTART_STEP
-    if 0 <= step_index < len(INSTALL_STEPS):
+    if step_index in _VALID_STEPS:
         RESTART_STEP = step_index
     else:
         ui.print_color(f"Invalid restart step index: {step_index}", ui.Colors.RED, prefix=ui.ERROR_SYMBOL)
@@ -179,31 +248,4 @@ def get_restart_step() -> int:
 # Function to get a fresh copy of default user config
 def get_default_user_config() -> Dict[str, Any]:
     """Returns a fresh copy of the default USER_CONFIG dictionary."""
-    return {
-        "username": "bao",
-        "hostname": "bao",
-        "timezone": "America/Denver",
-        "locale_lang": "en_US.UTF-8",
-        "locale_gen": "en_US.UTF-8 UTF-8",
-        "vconsole_keymap": "us",
-        "target_drive": "",
-        "efi_partition_size": "1G",
-        "swap_size_gb": "4",
-        "zram_fraction": "0.5",
-        "lvm_vg_name": "vg_bao",
-        "lvm_lv_root_name": "lv_root",
-        "lvm_lv_swap_name": "lv_swap",
-        # "btrfs_subvol_root": "@root",
-        # "btrfs_subvol_home": "@home",
-        # "btrfs_subvol_var": "@var",
-        # "btrfs_subvol_snapshots": "@snapshots",
-        "root_filesystem_type": "ext4",
-        "ext4_mount_options": "defaults,rw,noatime",
-        "ssh_key_email": "kunihir0@tutanota.com",
-        "gpg_key_name": "kunihir0",
-        "gpg_key_email": "kunihir0@tutanota.com",
-        "cpu_march": "icelake-client",
-        "add_chaotic_aur": True,
-        "default_monospace_font_pkg": "ttf-sourcecodepro-nerd"
-        # "btrfs_mount_options": "compress=zstd,ssd,noatime,discard=async"
-    }
\ No newline at end of file
+    return dict(_DEFAULT_USER_CONFIG)
@@ -6,12 +6,15 @@ Core helper functions for the Arch Linux installer, including command execution,
 file operations, and verification utilities.
 """
 
+import asyncio
+import functools
+import mmap
+import os
 import subprocess
 import sys
 import time
-import shlex
 from pathlib import Path
-from typing import List, Union, Optional, Dict, Any, Callable
+from typing import List, Union, Optional, Dict, Any, Callable, Set
 
 # Attempt to import from sibling modules.
 # This structure assumes 'config' and 'ui' are in the same 'modules' directory.
@@ -45,11 +48,62 @@ except ImportError:
         ui = MockUI() # type: ignore
         class MockConfig: # type: ignore
             DRY_RUN_MODE = False; USER_CONFIG: Dict[str, Any] = {} # type: ignore
+            TARGET_DRIVE = None; LVM_VG_NAME = None; LVM_LV_ROOT_NAME = None; LVM_LV_SWAP_NAME = None # type: ignore
             def get_dry_run_mode(self) -> bool: return self.DRY_RUN_MODE # type: ignore
             def get_user_config_value(self, key: str) -> Any: return self.USER_CONFIG.get(key) # type: ignore
         cfg = MockConfig() # type: ignore
 
 
+# ui names used throughout this module (run_command above all), resolved once here so each use
+# is a single global lookup instead of a module attribute chain.
+_print_color = ui.print_color
+_print_command_info = ui.print_command_info
+_print_dry_run_command = ui.print_dry_run_command
+_prompt_yes_no = ui.prompt_yes_no
+_Spinner = ui.Spinner
+_BLUE: str = ui.Colors.BLUE
+_CYAN: str = ui.Colors.CYAN
+_GREEN: str = ui.Colors.GREEN
+_MINT: str = ui.Colors.MINT
+_ORANGE: str = ui.Colors.ORANGE
+_PEACH: str = ui.Colors.PEACH
+_RED: str = ui.Colors.RED
+_RESET: str = ui.Colors.RESET
+_YELLOW: str = ui.Colors.YELLOW
+_ERROR_SYMBOL: str = ui.ERROR_SYMBOL
+_SUCCESS_SYMBOL: str = ui.SUCCESS_SYMBOL
+_WARNING_SYMBOL: str = ui.WARNING_SYMBOL
+
+
+@functools.lru_cache(maxsize=1)
+def _mock_lsblk_output(
+    target_drive: str, lvm_vg_name: str, lvm_lv_root_name: str, lvm_lv_swap_name: str, swap_size_gb_str: str
+) -> str:
+    """
+    Renders the simulated 'lsblk -f' output used in dry run mode.
+    Cached on the config values it is built from, so repeated dry-run lsblk calls reuse the
+    rendered text until one of those values changes.
+    """
+    swap_size_gb = 0.0
+    try:
+        swap_size_gb = float(swap_size_gb_str)
+    except ValueError:
+        pass # Keep swap_size_gb as 0.0 if conversion fails
+
+    mock_stdout: str = (
+        f"NAME FSTYPE FSVER LABEL UUID                                 FSAVAIL FSUSE% MOUNTPOINTS\n"
+        f"{target_drive}p1 vfat   FAT32         0000-0000                            /mnt/boot/efi\n"
+        f"└─{target_drive}                                                               \n"
+        f"{lvm_vg_name}-{lvm_lv_root_name} btrfs             xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx /mnt\n"
+        f"└─{target_drive}p2 LVM2_member                                               \n"
+    )
+    if swap_size_gb > 0:
+        mock_stdout += f"{lvm_vg_name}-{lvm_lv_swap_name} swap   1             yyyyyyyy-yyyy-yyyy-yyyy-yyyyyyyyyyyy [SWAP]\n"
+    return mock_stdout
+
+# Seconds run_command waits on a command before showing a spinner for it.
+SPINNER_START_DELAY: float = 0.25
+
 def run_command(
     command: Union[List[str], str],
     check: bool = True,
@@ -66,68 +120,63 @@ def run_command(
 ) -> Optional[subprocess.CompletedProcess]:
     """
     Runs a shell command with options for dry run, output capture, retries, and spinner.
-    Uses subprocess.run.
+    Uses subprocess.run. Dry run mode is read from cfg.DRY_RUN_MODE directly (kept current by
+    cfg.set_dry_run_mode), saving a getter call per invocation.
     """
     cmd_str: str = ' '.join(command) if isinstance(command, list) else command
 
-    if cfg.get_dry_run_mode() and destructive:
-        ui.print_dry_run_command(cmd_str)
+    if cfg.DRY_RUN_MODE and destructive:
+        _print_dry_run_command(cmd_str)
         if capture_output:
             mock_stdout: str = f"[DRY RUN SIMULATED OUTPUT FOR: {cmd_str}]"
             # Add specific mock outputs if necessary, based on USER_CONFIG
             # This part might need to be more sophisticated or moved if too complex
-            if "lsblk" in cmd_str and "-f" in cmd_str and cfg.get_user_config_value('target_drive'):
-                target_drive = str(cfg.get_user_config_value('target_drive'))
-                lvm_vg_name = str(cfg.get_user_config_value('lvm_vg_name'))
-                lvm_lv_root_name = str(cfg.get_user_config_value('lvm_lv_root_name'))
-                lvm_lv_swap_name = str(cfg.get_user_config_value('lvm_lv_swap_name'))
-                swap_size_gb_str = str(cfg.get_user_config_value('swap_size_gb'))
-                swap_size_gb = 0.0
-                try:
-                    swap_size_gb = float(swap_size_gb_str)
-                except ValueError:
-                    pass # Keep swap_size_gb as 0.0 if conversion fails
-
-                mock_stdout = (
-                    f"NAME FSTYPE FSVER LABEL UUID                                 FSAVAIL FSUSE% MOUNTPOINTS\n"
-                    f"{target_drive}p1 vfat   FAT32         0000-0000                            /mnt/boot/efi\n"
-                    f"└─{target_drive}                                                               \n"
-                    f"{lvm_vg_name}-{lvm_lv_root_name} btrfs             xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx /mnt\n"
-                    f"└─{target_drive}p2 LVM2_member                                               \n"
-                )
-                if swap_size_gb > 0:
-                    mock_stdout += f"{lvm_vg_name}-{lvm_lv_swap_name} swap   1             yyyyyyyy-yyyy-yyyy-yyyy-yyyyyyyyyyyy [SWAP]\n"
+            if "lsblk" in cmd_str and "-f" in cmd_str and cfg.USER_CONFIG.get('target_drive'):
+                # One snapshot of USER_CONFIG, looked up in a single map() pass, instead of a getter call per key.
+                mock_stdout = _mock_lsblk_output(*map(str, map(cfg.USER_CONFIG.get, (
+                    'target_drive', 'lvm_vg_name', 'lvm_lv_root_name', 'lvm_lv_swap_name', 'swap_size_gb'
+                ))))
             # Add other mock outputs for findmnt, swapon, pacman -Q etc. as in original
             return subprocess.CompletedProcess(
-                args=command if isinstance(command, list) else shlex.split(cmd_str),
+                args=command, # As subprocess.run would report it; no need to re-lex a shell string
                 returncode=0,
                 stdout=mock_stdout,
                 stderr=""
             )
         return None
 
-    ui.print_command_info(cmd_str)
+    _print_command_info(cmd_str)
+    sys.stdout.flush() # The child writes straight to the terminal, so our buffered output must go out first
     for attempt in range(retry_count):
         spinner: Optional[Spinner] = None
-        if show_spinner and not capture_output and (not shell or (shell and "&" not in cmd_str)):
-            spinner_msg_to_show: str = custom_spinner_message if custom_spinner_message else (cmd_str[:70] + "..." if len(cmd_str) > 70 else cmd_str)
-            spinner = ui.Spinner(message=f"Running '{spinner_msg_to_show}'")
-            spinner.start()
         try:
-            process: subprocess.CompletedProcess = subprocess.run(
-                command,
-                check=False, # We handle check manually for retries and better error reporting
-                capture_output=capture_output,
-                text=text,
-                shell=shell,
-                cwd=str(cwd) if cwd else None, # Ensure cwd is string
-                env=env
-            )
+            if show_spinner and not capture_output and (not shell or (shell and "&" not in cmd_str)):
+                # Most commands finish well within the start delay; only spin up the spinner thread
+                # for the ones still running after it.
+                with subprocess.Popen(command, text=text, shell=shell, cwd=str(cwd) if cwd else None, env=env) as popen:
+                    try:
+                        popen.wait(timeout=SPINNER_START_DELAY)
+                    except subprocess.TimeoutExpired:
+                        spinner_msg_to_show: str = custom_spinner_message if custom_spinner_message else (cmd_str[:70] + "..." if len(cmd_str) > 70 else cmd_str)
+                        spinner = _Spinner(message=f"Running '{spinner_msg_to_show}'")
+                        spinner.start()
+                        popen.wait()
+                process: subprocess.CompletedProcess = subprocess.CompletedProcess(popen.args, popen.returncode)
+            else:
+                process = subprocess.run(
+                    command,
+                    check=False, # We handle check manually for retries and better error reporting
+                    capture_output=capture_output,
+                    text=text,
+                    shell=shell,
+                    cwd=str(cwd) if cwd else None, # Ensure cwd is string
+                    env=env
+                )
             if spinner:
                 spinner.stop()
 
             if process.stderr and process.returncode != 0:
-                ui.print_color(f"Stderr for '{cmd_str}':\n{process.stderr.strip()}", ui.Colors.ORANGE, prefix=ui.WARNING_SYMBOL)
+                _print_color(f"Stderr for '{cmd_str}':\n{process.stderr.strip()}", _ORANGE, prefix=_WARNING_SYMBOL)
 
             if check and process.returncode != 0:
                 # This will raise CalledProcessError
@@ -137,70 +186,253 @@ def run_command(
             if spinner:
                 spinner.stop()
             if attempt < retry_count - 1:
-                ui.print_color(f"Command failed (attempt {attempt + 1}/{retry_count}): {cmd_str}", ui.Colors.ORANGE, prefix=ui.WARNING_SYMBOL)
-                ui.print_color(f"Retrying in {retry_delay} seconds...", ui.Colors.BLUE)
+                _print_color(f"Command failed (attempt {attempt + 1}/{retry_count}): {cmd_str}", _ORANGE, prefix=_WARNING_SYMBOL)
+                _print_color(f"Retrying in {retry_delay} seconds...", _BLUE)
                 time.sleep(retry_delay)
                 continue
-            ui.print_color(f"Command failed: {cmd_str}", ui.Colors.RED, prefix=ui.ERROR_SYMBOL, bold=True)
-            if e.stdout: # stdout might be bytes if text=False, but default is True
-                ui.print_color(f"Stdout:\n{e.stdout.strip() if isinstance(e.stdout, str) else e.stdout.decode(errors='replace').strip()}", ui.Colors.RED)
+            _print_color(f"Command failed: {cmd_str}", _RED, prefix=_ERROR_SYMBOL, bold=True)
+            if e.stdout: # Already a str with the default text=True; only text=False callers need it decoded
+                _print_color(f"Stdout:\n{(e.stdout if text else e.stdout.decode(errors='replace')).strip()}", _RED)
             # stderr is already printed above if it existed
             raise # Re-raise the exception after logging
         except FileNotFoundError:
             if spinner:
                 spinner.stop()
             cmd_name: str = command[0] if isinstance(command, list) else cmd_str.split()[0]
-            ui.print_color(f"Command not found: {cmd_name}", ui.Colors.RED, prefix=ui.ERROR_SYMBOL, bold=True)
+            _print_color(f"Command not found: {cmd_name}", _RED, prefix=_ERROR_SYMBOL, bold=True)
             raise
         finally:
             if spinner and spinner.running: # Ensure spinner is stopped
                 spinner.stop()
     return None # Should only be reached if retry_count is 0 or less, which is unlikely.
 
+def run_commands_batch(commands: List[List[str]], destructive: bool = False) -> List[Optional[subprocess.CompletedProcess]]:
+    """
+    Runs independent commands concurrently, capturing their stdout and stderr as text, and returns
+    their results in the order given. Every command is started with Popen before any is waited
+    on, so N quick queries take about as long as the slowest one rather than the sum of them.
+    A command that cannot be found yields None. There is no spinner, retry or check, so this
+    is meant for short queries whose exit codes the caller inspects itself.
+    """
+    if cfg.DRY_RUN_MODE and destructive:
+        results: List[Optional[subprocess.CompletedProcess]] = []
+        for command in commands:
+            cmd_str: str = ' '.join(command)
+            _print_dry_run_command(cmd_str)
+            results.append(subprocess.CompletedProcess(command, 0, stdout=f"[DRY RUN SIMULATED OUTPUT FOR: {cmd_str}]", stderr=""))
+        return results
+
+    sys.stdout.flush()
+    procs: List[Optional[subprocess.Popen]] = []
+    for command in commands:
+        _print_command_info(' '.join(command))
+        try:
+            procs.append(subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True))
+        except FileNotFoundError:
+            _print_color(f"Command not found: {command[0]}", _RED, prefix=_ERROR_SYMBOL, bold=True)
+            procs.append(None)
+
+    # Reap in order; the others keep running meanwhile, so the total wait is bounded by the slowest
+    results = []
+    for command, proc in zip(commands, procs):
+        if proc is None:
+            results.append(None)
+            continue
+        stdout, stderr = proc.communicate()
+        results.append(subprocess.CompletedProcess(command, proc.returncode, stdout=stdout, stderr=stderr))
+    return results
+
+async def _pump_stream(stream: Optional[asyncio.StreamReader], sink: Any) -> None:
+    """Copies a subprocess pipe to a text stream's binary buffer as data arrives."""
+    if stream is None:
+        return
+    # Read in chunks rather than lines so progress output that redraws with '\r' passes through as-is
+    while chunk := await stream.read(4096):
+        sink.buffer.write(chunk)
+        sink.flush()
+
+async def _feed_stdin(stream: Optional[asyncio.StreamWriter], data: Optional[bytes]) -> None:
+    """Writes data to a subprocess's stdin and closes it; a child that exits early just stops the feed."""
+    if stream is None or data is None:
+        return
+    try:
+        stream.write(data)
+        await stream.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        pass
+    finally:
+        stream.close()
+
+async def run_command_async(
+    command: List[str],
+    check: bool = True,
+    destructive: bool = True,
+    retry_count: int = 1,
+    retry_delay: float = 3.0,
+    input_data: Optional[bytes] = None
+) -> Optional[int]:
+    """
+    Runs a long-running command with asyncio.create_subprocess_exec, streaming its stdout and
+    stderr to the terminal while it runs. Both pipes are drained concurrently, so neither can
+    fill up and stall the child. If input_data is given it is fed to the command's stdin
+    (alongside the draining) and stdin is then closed. Honors dry run mode and retries like run_command.
+    Returns the exit code, or None in dry run mode. Raises CalledProcessError if check is set
+    and the command still fails after all attempts.
+    """
+    cmd_str: str = ' '.join(command)
+
+    if cfg.DRY_RUN_MODE and destructive:
+        _print_dry_run_command(cmd_str)
+        return None
+
+    _print_command_info(cmd_str)
+    returncode: int = 0
+    for attempt in range(retry_count):
+        # The child's output bypasses the block-buffered text layer, so text printed so far
+        # (the command line, or the retry notice) has to reach the terminal before it
+        sys.stdout.flush()
+        try:
+            process: asyncio.subprocess.Process = await asyncio.create_subprocess_exec(
+                *command,
+                stdin=asyncio.subprocess.PIPE if input_data is not None else None,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+            )
+        except FileNotFoundError:
+            _print_color(f"Command not found: {command[0]}", _RED, prefix=_ERROR_SYMBOL, bold=True)
+            raise
+        await asyncio.gather(
+            _feed_stdin(process.stdin, input_data),
+            _pump_stream(process.stdout, sys.stdout), _pump_stream(process.stderr, sys.stderr)
+        )
+        returncode = await process.wait()
+        if returncode == 0 or not check:
+            return returncode
+        if attempt < retry_count - 1:
+            sys.stdout.flush() # Keep the retry notice after the output the failed attempt streamed
+            _print_color(f"Command failed (attempt {attempt + 1}/{retry_count}): {cmd_str}", _ORANGE, prefix=_WARNING_SYMBOL)
+            _print_color(f"Retrying in {retry_delay} seconds...", _BLUE)
+            await asyncio.sleep(retry_delay)
+
+    _print_color(f"Command failed: {cmd_str}", _RED, prefix=_ERROR_SYMBOL, bold=True)
+    raise subprocess.CalledProcessError(returncode, command)
+
+def run_io_jobs_concurrently(jobs: List[Callable[[], None]]) -> None:
+    """
+    Runs independent, I/O-bound jobs concurrently on worker threads via asyncio.to_thread,
+    so the wall-clock cost is roughly that of the slowest job rather than the sum.
+    In dry run mode the jobs only print, so they run sequentially to keep the output readable.
+    The first exception raised by a job is re-raised once all jobs have finished.
+    """
+    if cfg.DRY_RUN_MODE:
+        for job in jobs:
+            job()
+        return
+
+    async def _gather_jobs() -> None:
+        results: List[Any] = await asyncio.gather(*(asyncio.to_thread(job) for job in jobs), return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    asyncio.run(_gather_jobs())
+
 def make_dir_dry_run(path: Path, parents: bool = True, exist_ok: bool = True) -> None:
     """Creates a directory, printing the command if in dry run mode."""
-    if cfg.get_dry_run_mode():
-        ui.print_dry_run_command(f"mkdir {'-p ' if parents else ''}{str(path)}")
+    if cfg.DRY_RUN_MODE:
+        _print_dry_run_command(f"mkdir {'-p ' if parents else ''}{str(path)}")
     else:
         path.mkdir(parents=parents, exist_ok=exist_ok)
-        ui.print_color(f"Created directory: {str(path)}", ui.Colors.MINT)
+        _print_color(f"Created directory: {str(path)}", _MINT)
+
+# os.open flags for the text-mode strings write_file_dry_run accepts
+_WRITE_MODE_FLAGS: Dict[str, int] = {
+    "w": os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_CLOEXEC,
+    "a": os.O_WRONLY | os.O_CREAT | os.O_APPEND | os.O_CLOEXEC,
+}
 
-def write_file_dry_run(path: Path, content: str, mode: str = "w", sudo: bool = False) -> None:
-    """Writes content to a file, printing actions if in dry run mode."""
+def write_file_dry_run(path: Path, content: str, mode: str = "w", sudo: bool = False, file_mode: Optional[int] = None) -> None:
+    """
+    Writes content to a file, printing actions if in dry run mode.
+    mode is "w" (truncate) or "a" (append); anything else raises ValueError.
+    If file_mode is given (e.g. 0o440), the permissions are set on the open descriptor
+    while writing, rather than with a separate chmod of the path afterwards.
+    """
     # sudo parameter is not used with pathlib, consider removal or alternative implementation if sudo is truly needed.
-    if cfg.get_dry_run_mode():
-        ui.print_dry_run_command(f"write to {str(path)} (mode: {mode})")
-        ui.print_color(f"--BEGIN CONTENT for {str(path)}--", ui.Colors.PEACH)
+    if mode not in _WRITE_MODE_FLAGS:
+        raise ValueError(f"unsupported mode {mode!r}")
+    if cfg.DRY_RUN_MODE:
+        _print_dry_run_command(f"write to {str(path)} (mode: {mode}{f', permissions: {file_mode:o}' if file_mode is not None else ''})")
+        _print_color(f"--BEGIN CONTENT for {str(path)}--", _PEACH)
         sys.stdout.write(content[:300] + ('...' if len(content) > 300 else '') + "\n") # Use sys.stdout for direct print
-        ui.print_color(f"--END CONTENT for {str(path)}--", ui.Colors.PEACH)
+        _print_color(f"--END CONTENT for {str(path)}--", _PEACH)
     else:
         try:
-            with path.open(mode, encoding="utf-8") as f:
-                f.write(content)
-            ui.print_color(f"Written to file: {str(path)}", ui.Colors.MINT)
+            # Encode once and hand the bytes to os.write on a raw descriptor: no text wrapper or
+            # buffer in between, so a config file normally lands in a single write() call.
+            data: memoryview = memoryview(content.encode("utf-8"))
+            fd: int = os.open(path, _WRITE_MODE_FLAGS[mode], file_mode if file_mode is not None else 0o666)
+            try:
+                if file_mode is not None:
+                    os.fchmod(fd, file_mode) # Also covers an existing file and the umask
+                while data:
+                    data = data[os.write(fd, data):]
+            finally:
+                os.close(fd)
+            _print_color(f"Written to file: {str(path)}", _MINT)
         except Exception as e:
-            ui.print_color(f"Error writing to file {str(path)}: {e}", ui.Colors.RED, prefix=ui.ERROR_SYMBOL)
+            _print_color(f"Error writing to file {str(path)}: {e}", _RED, prefix=_ERROR_SYMBOL)
             raise
 
+# Directories already created (or announced, in dry run) by write_file_with_parents during this run
+_created_dirs: Set[Path] = set()
+
+def write_file_with_parents(path: Path, content: str, file_mode: Optional[int] = None) -> None:
+    """
+    Creates the parent directory of path if needed, writes content to it and optionally applies
+    file_mode (e.g. 0o440), printing actions instead in dry run mode.
+    Parent directories are remembered, so several files written into the same directory
+    only pay for one mkdir.
+    """
+    parent_dir: Path = path.parent
+    if parent_dir not in _created_dirs:
+        make_dir_dry_run(parent_dir, parents=True, exist_ok=True)
+        _created_dirs.add(parent_dir)
+    write_file_dry_run(path, content, file_mode=file_mode)
+
+def find_in_file(path: Path, needles: List[bytes]) -> Dict[bytes, bool]:
+    """
+    Reports which of the given byte patterns occur in a file, without decoding it into a str.
+    The file is memory-mapped and scanned with mmap.find, so callers can skip an edit entirely
+    when none of its patterns are present. An empty file contains none of the patterns.
+    """
+    with path.open("rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return {needle: False for needle in needles}
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return {needle: mm.find(needle) != -1 for needle in needles}
+
 def unlink_file_dry_run(path: Path, missing_ok: bool = True) -> None:
     """Deletes a file, printing the command if in dry run mode."""
-    if cfg.get_dry_run_mode():
+    if cfg.DRY_RUN_MODE:
         if path.exists() or (not missing_ok and not path.exists()): # Only print if action would occur
-            ui.print_dry_run_command(f"delete file: {str(path)}")
+            _print_dry_run_command(f"delete file: {str(path)}")
     else:
         try:
             path.unlink(missing_ok=missing_ok)
-            ui.print_color(f"Deleted file: {str(path)}", ui.Colors.MINT)
+            _print_color(f"Deleted file: {str(path)}", _MINT)
         except FileNotFoundError:
             if not missing_ok:
-                ui.print_color(f"Error deleting file {str(path)}: Not found.", ui.Colors.RED, prefix=ui.ERROR_SYMBOL)
+                _print_color(f"Error deleting file {str(path)}: Not found.", _RED, prefix=_ERROR_SYMBOL)
                 raise
             else: # File not found, but missing_ok is True
-                ui.print_color(f"File {str(path)} not found, skipping deletion (missing_ok=True).", ui.Colors.CYAN)
+                _print_color(f"File {str(path)} not found, skipping deletion (missing_ok=True).", _CYAN)
         except Exception as e:
-            ui.print_color(f"Error deleting file {str(path)}: {e}", ui.Colors.RED, prefix=ui.ERROR_SYMBOL)
+            _print_color(f"Error deleting file {str(path)}: {e}", _RED, prefix=_ERROR_SYMBOL)
             raise
 
+# Upper bound, in seconds, on the backoff between verify_step retries.
+VERIFY_RETRY_MAX_DELAY: float = 15.0
+
 def verify_step(
     success: bool,
     message: str,
@@ -211,8 +443,13 @@ def verify_step(
 ) -> bool:
     """
     Verifies a step's success, with options for retries and criticality.
-    If retry_func is provided, it will be called on failure for max_retries.
+    If retry_func is provided, it will be called on failure for max_retries, waiting retry_delay
+    before the first retry and doubling the wait (up to VERIFY_RETRY_MAX_DELAY) after each one.
     """
+    if success: # Common case: passed on the first check, so no retry bookkeeping is needed
+        _print_color(f"PASSED: {message}", _GREEN, prefix=_SUCCESS_SYMBOL)
+        return True
+
     current_attempt: int = 0
     # Initial check is attempt 0. Retries start from attempt 1.
     # Loop runs for initial check + number of retries.
@@ -226,16 +463,17 @@ def verify_step(
 
     while current_attempt < effective_max_attempts:
         if current_attempt > 0 and retry_func: # This is a retry attempt
-            ui.print_color(f"RETRY: {message} (attempt {current_attempt + 1}/{effective_max_attempts})", ui.Colors.ORANGE, prefix=ui.WARNING_SYMBOL)
-            time.sleep(retry_delay)
+            _print_color(f"RETRY: {message} (attempt {current_attempt + 1}/{effective_max_attempts})", _ORANGE, prefix=_WARNING_SYMBOL)
+            # Back off exponentially from retry_delay, capped, so a slow condition is polled less often
+            time.sleep(min(retry_delay * (2 ** (current_attempt - 1)), VERIFY_RETRY_MAX_DELAY))
             try:
                 success = retry_func()
             except Exception as e:
-                ui.print_color(f"Retry attempt {current_attempt + 1} failed with exception: {e}", ui.Colors.ORANGE, prefix=ui.WARNING_SYMBOL)
+                _print_color(f"Retry attempt {current_attempt + 1} failed with exception: {e}", _ORANGE, prefix=_WARNING_SYMBOL)
                 success = False
         
         if success:
-            ui.print_color(f"PASSED: {message}", ui.Colors.GREEN, prefix=ui.SUCCESS_SYMBOL)
+            _print_color(f"PASSED: {message}", _GREEN, prefix=_SUCCESS_SYMBOL)
             return True
 
         current_attempt += 1
@@ -243,15 +481,16 @@ def verify_step(
             break
 
     # If loop finishes and success is still False
-    ui.print_color(f"FAILED: {message}", ui.Colors.RED, prefix=ui.ERROR_SYMBOL, bold=True)
-    if critical and not cfg.get_dry_run_mode():
-        if not ui.prompt_yes_no("A critical verification failed. Continue anyway (NOT RECOMMENDED)?", default_yes=False):
-            ui.print_color("Aborting installation due to critical verification failure.", ui.Colors.RED, prefix=ui.ERROR_SYMBOL, bold=True)
+    _print_color(f"FAILED: {message}", _RED, prefix=_ERROR_SYMBOL, bold=True)
+    dry_run: bool = cfg.DRY_RUN_MODE
+    if critical and not dry_run:
+        if not _prompt_yes_no("A critical verification failed. Continue anyway (NOT RECOMMENDED)?", default_yes=False):
+            _print_color("Aborting installation due to critical verification failure.", _RED, prefix=_ERROR_SYMBOL, bold=True)
             sys.exit(1) # Exit the script
         else:
-            ui.print_color("Continuing despite critical verification failure as per user request.", ui.Colors.ORANGE, prefix=ui.WARNING_SYMBOL)
-    elif cfg.get_dry_run_mode() and critical:
-        ui.print_color("Verification failed (critical), this might be expected if preceding destructive steps were skipped in dry run.", ui.Colors.PEACH, prefix=f"{ui.Colors.YELLOW}[DRY RUN]{ui.Colors.RESET}")
+            _print_color("Continuing despite critical verification failure as per user request.", _ORANGE, prefix=_WARNING_SYMBOL)
+    elif dry_run and critical:
+        _print_color("Verification failed (critical), this might be expected if preceding destructive steps were skipped in dry run.", _PEACH, prefix=f"{_YELLOW}[DRY RUN]{_RESET}")
     return False
 
 def get_uuid_from_lsblk(device_path_str: str) -> Optional[str]:
@@ -259,24 +498,24 @@ def get_uuid_from_lsblk(device_path_str: str) -> Optional[str]:
     Gets the UUID of a given device using lsblk -fno UUID.
     Returns the UUID string or None if not found or error.
     """
-    if cfg.get_dry_run_mode():
+    if cfg.DRY_RUN_MODE:
         # In dry run, we can't actually get a UUID, so return a placeholder or None
         # For verification purposes, a placeholder might be better if the calling code expects a string.
         # However, for actual logic, None is safer. Let's return a mock UUID for now.
         # This part might need adjustment based on how verify_step handles None vs mock data.
         mock_uuid_map: Dict[str, str] = {
-            f"/dev/mapper/{cfg.get_user_config_value('lvm_vg_name')}-{cfg.get_user_config_value('lvm_lv_root_name')}": "DRYRUN-ROOT-UUID-XXXX",
-            f"/dev/mapper/{cfg.get_user_config_value('lvm_vg_name')}-{cfg.get_user_config_value('lvm_lv_swap_name')}": "DRYRUN-SWAP-UUID-YYYY",
+            f"/dev/mapper/{cfg.LVM_VG_NAME}-{cfg.LVM_LV_ROOT_NAME}": "DRYRUN-ROOT-UUID-XXXX",
+            f"/dev/mapper/{cfg.LVM_VG_NAME}-{cfg.LVM_LV_SWAP_NAME}": "DRYRUN-SWAP-UUID-YYYY",
             # Add more mocks if needed, e.g., for EFI based on target_drive + suffix
         }
         # Construct EFI mock based on target_drive
-        target_drive = cfg.get_user_config_value('target_drive')
+        target_drive = cfg.TARGET_DRIVE
         if target_drive:
             sfx_func = getattr(sys.modules.get('arch.modules.disk'), '_get_partition_suffix_func', lambda d: lambda n: str(n))
             efi_sfx = sfx_func(str(target_drive))(1)
             mock_uuid_map[f"{target_drive}{efi_sfx}"] = "DRYRUN-EFI-UUID-ZZZZ"
 
-        # ui.print_color(f"[DRY RUN] Mocking UUID for {device_path_str}. Returning placeholder.", ui.Colors.PEACH)
+        # _print_color(f"[DRY RUN] Mocking UUID for {device_path_str}. Returning placeholder.", _PEACH)
         return mock_uuid_map.get(device_path_str, "DRYRUN-UNKNOWN-UUID")
 
 
@@ -287,7 +526,7 @@ def get_uuid_from_lsblk(device_path_str: str) -> Optional[str]:
     if proc and proc.returncode == 0 and proc.stdout and proc.stdout.strip():
         return proc.stdout.strip()
     else:
-        ui.print_color(f"Warning: Could not get UUID for {device_path_str} using lsblk.", ui.Colors.ORANGE, prefix=ui.WARNING_SYMBOL)
+        _print_color(f"Warning: Could not get UUID for {device_path_str} using lsblk.", _ORANGE, prefix=_WARNING_SYMBOL)
         if proc and proc.stderr:
-            ui.print_color(f"lsblk stderr: {proc.stderr.strip()}", ui.Colors.ORANGE)
+            _print_color(f"lsblk stderr: {proc.stderr.strip()}", _ORANGE)
         return None
\ No newline at end of file
@@ -10,7 +10,7 @@ import sys
 import os # <--- ADDED IMPORT
 import time
 from pathlib import Path
-from typing import Dict, Any, List as TypingList, Callable, Tuple, Union, Optional
+from typing import Dict, Any, List as TypingList, Callable, Tuple, Union, Optional, Mapping
 import subprocess # For subprocess.CompletedProcess type hint
 
 # Attempt to import from sibling modules
@@ -116,7 +116,7 @@ def check_and_free_device(device_path_str: str) -> None:
     """
     ui.print_step_info(f"Ensuring {device_path_str} and its partitions are free...")
     device_path: Path = Path(device_path_str)
-    user_config: Dict[str, Any] = cfg.get_all_user_config() # Get a copy
+    user_config: Mapping[str, Any] = cfg.get_all_user_config()
 
     mnt_base: Path = Path("/mnt")
     # Order matters for unmounting: deepest first
@@ -285,11 +285,11 @@ def partition_and_format() -> None:
     Partitions the target drive (GPT, EFI, LVM), formats partitions,
     sets up LVM (PV, VG, LVs for root and swap), and creates Btrfs subvolumes.
     """
-    ui.print_section_header(f"Partitioning & Formatting {cfg.get_user_config_value('target_drive')}")
-    if cfg.get_current_step() > cfg.INSTALL_STEPS.index("partition_format"):
+    ui.print_section_header(f"Partitioning & Formatting {cfg.TARGET_DRIVE}")
+    if cfg.get_current_step() > cfg.Step.PARTITION_FORMAT:
         ui.print_step_info("Skipping (already completed)"); sys.stdout.write("\n"); return
 
-    user_config: Dict[str, Any] = cfg.get_all_user_config()
+    user_config: Mapping[str, Any] = cfg.get_all_user_config()
     drive: str = str(user_config['target_drive'])
     if not drive:
         ui.print_color("Target drive not set. Aborting partition_and_format.", ui.Colors.RED, prefix=ui.ERROR_SYMBOL)
@@ -380,7 +380,7 @@ def partition_and_format() -> None:
     # For now, /home, /var, etc., will be standard directories on the ext4 root.
 
     ui.print_color("Partitioning & formatting complete.", ui.Colors.GREEN, prefix=ui.SUCCESS_SYMBOL)
-    cfg.set_current_step(cfg.INSTALL_STEPS.index("mount_filesystems"))
+    cfg.set_current_step(cfg.Step.MOUNT_FILESYSTEMS)
     cfg.save_progress()
     sys.stdout.write("\n")
 
@@ -392,10 +392,10 @@ def verify_partitions_lvm(no_verify_arg: bool) -> None:
         sys.stdout.write("\n"); return
 
     ui.print_section_header("Verifying Partitions and LVM")
-    if cfg.get_current_step() <= cfg.INSTALL_STEPS.index("partition_format"):
+    if cfg.get_current_step() <= cfg.Step.PARTITION_FORMAT:
         ui.print_color("Verification running before its intended step, results might be inaccurate.", ui.Colors.ORANGE, prefix=ui.WARNING_SYMBOL)
 
-    user_config: Dict[str, Any] = cfg.get_all_user_config()
+    user_config: Mapping[str, Any] = cfg.get_all_user_config()
     drive: str = str(user_config['target_drive'])
     sfx: Callable[[int], str] = get_partition_suffix_func(drive)
     
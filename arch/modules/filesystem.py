@@ -8,7 +8,7 @@ Handles filesystem mounting, fstab generation, and verification for the Arch Lin
 import sys
 import os # <--- ADDED IMPORT
 from pathlib import Path
-from typing import Dict, Any, List as TypingList, Optional, Callable
+from typing import Dict, Any, List as TypingList, Optional, Callable, Mapping
 import subprocess # For subprocess.CompletedProcess type hint
 
 # Attempt to import from sibling modules
@@ -42,11 +42,11 @@ def mount_filesystems() -> None:
     Activates swap if configured.
     """
     ui.print_section_header("Mounting Filesystems")
-    if cfg.get_current_step() > cfg.INSTALL_STEPS.index("mount_filesystems"):
+    if cfg.get_current_step() > cfg.Step.MOUNT_FILESYSTEMS:
         ui.print_step_info("Skipping (already completed)")
         sys.stdout.write("\n"); return
 
-    user_config: Dict[str, Any] = cfg.get_all_user_config()
+    user_config: Mapping[str, Any] = cfg.get_all_user_config()
     mnt_base: Path = Path("/mnt")
     lv_root_path_str: str = f"/dev/{user_config['lvm_vg_name']}/{user_config['lvm_lv_root_name']}"
     
@@ -130,7 +130,7 @@ def mount_filesystems() -> None:
         core.run_command(["swapon", lv_swap_path_str], check=True)
 
     ui.print_color("Filesystems mounted.", ui.Colors.GREEN, prefix=ui.SUCCESS_SYMBOL)
-    cfg.set_current_step(cfg.INSTALL_STEPS.index("pacstrap_system"))
+    cfg.set_current_step(cfg.Step.PACSTRAP_SYSTEM)
     cfg.save_progress()
     sys.stdout.write("\n")
 
@@ -142,7 +142,7 @@ def verify_mounts(no_verify_arg: bool) -> None:
 
     ui.print_section_header("Verifying Mounts")
     all_ok: bool = True
-    user_config: Dict[str, Any] = cfg.get_all_user_config()
+    user_config: Mapping[str, Any] = cfg.get_all_user_config()
     mnt_base_str: str = str(Path("/mnt"))
     root_lv_device_path: str = f"/dev/mapper/{user_config['lvm_vg_name']}-{user_config['lvm_lv_root_name']}"
     
@@ -299,11 +299,11 @@ def verify_mounts(no_verify_arg: bool) -> None:
 def generate_fstab() -> None:
     """Generates the /etc/fstab file for the new system."""
     ui.print_section_header("Generating fstab")
-    if cfg.get_current_step() > cfg.INSTALL_STEPS.index("generate_fstab"):
+    if cfg.get_current_step() > cfg.Step.GENERATE_FSTAB:
         ui.print_step_info("Skipping (already completed)")
         sys.stdout.write("\n"); return
 
-    user_config: Dict[str, Any] = cfg.get_all_user_config()
+    user_config: Mapping[str, Any] = cfg.get_all_user_config()
     fstab_path: Path = Path("/mnt/etc/fstab")
 
     # Use shell=True for redirection. Ensure command is safe.
@@ -404,6 +404,6 @@ def generate_fstab() -> None:
     core.verify_step(root_line_found_and_correct, f"fstab content for {root_fs_type.upper()} root mount appears correct", critical=True)
     
     ui.print_color("fstab generation and basic check complete.", ui.Colors.GREEN, prefix=ui.SUCCESS_SYMBOL)
-    cfg.set_current_step(cfg.INSTALL_STEPS.index("pre_chroot_files"))
+    cfg.set_current_step(cfg.Step.PRE_CHROOT_FILES)
     cfg.save_progress()
     sys.stdout.write("\n")
\ No newline at end of file
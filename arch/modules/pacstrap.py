@@ -8,7 +8,7 @@ essential packages, along with verification of the installation.
 
 import sys
 from pathlib import Path
-from typing import Dict, Any, List as TypingList, Optional
+from typing import Dict, Any, List as TypingList, Optional, Mapping
 import subprocess # For subprocess.CompletedProcess type hint
 
 # Attempt to import from sibling modules
@@ -31,11 +31,11 @@ def pacstrap_system() -> None:
     Installs the base system and a predefined list of packages to /mnt using pacstrap.
     """
     ui.print_section_header("Installing Base System (pacstrap)")
-    if cfg.get_current_step() > cfg.INSTALL_STEPS.index("pacstrap_system"):
+    if cfg.get_current_step() > cfg.Step.PACSTRAP_SYSTEM:
         ui.print_step_info("Skipping (already completed)")
         sys.stdout.write("\n"); return
 
-    user_config: Dict[str, Any] = cfg.get_all_user_config()
+    user_config: Mapping[str, Any] = cfg.get_all_user_config()
     
     # Define the list of packages to install
     # This list should be maintained and updated as per requirements.
@@ -74,7 +74,7 @@ def pacstrap_system() -> None:
             ui.print_color("Could not list /mnt/boot/ contents or it is empty (after pacstrap).", ui.Colors.ORANGE)
 
     ui.print_color("Base system installation complete.", ui.Colors.GREEN, prefix=ui.SUCCESS_SYMBOL)
-    cfg.set_current_step(cfg.INSTALL_STEPS.index("generate_fstab"))
+    cfg.set_current_step(cfg.Step.GENERATE_FSTAB)
     cfg.save_progress()
     sys.stdout.write("\n")
 
@@ -97,17 +97,11 @@ def verify_pacstrap(no_verify_arg: bool) -> None:
         ]
         return all(d.is_dir() for d in key_dirs)
 
-    def _check_package_installed(pkg_name: str) -> bool:
+    def _check_package_installed(pkg_name: str, proc: Optional[subprocess.CompletedProcess]) -> bool:
         if cfg.get_dry_run_mode():
             ui.print_color(f"[DRY RUN] Assuming '{pkg_name}' package would be installed.", ui.Colors.PEACH)
             return True
-        
-        ui.print_step_info(f"Verifying '{pkg_name}' package installation via arch-chroot...")
-        # destructive=False as pacman -Q is read-only
-        proc: Optional[subprocess.CompletedProcess] = core.run_command(
-            ["arch-chroot", "/mnt", "pacman", "-Q", pkg_name],
-            capture_output=True, destructive=False, show_spinner=False, check=False # check=False to handle non-zero exit if not found
-        )
+
         if proc and proc.returncode == 0 and proc.stdout: # Check stdout for package info
             ui.print_color(f"'{pkg_name}' package IS installed: {proc.stdout.strip()}", ui.Colors.GREEN, prefix=ui.SUCCESS_SYMBOL)
             return True
@@ -121,8 +115,16 @@ def verify_pacstrap(no_verify_arg: bool) -> None:
     
     # Verify a few critical packages
     critical_packages_to_check: TypingList[str] = ["linux-surface", "dracut", "systemd", "base"]
-    for pkg in critical_packages_to_check:
-        if not core.verify_step(_check_package_installed(pkg), f"'{pkg}' package is installed", critical=True):
+    pkg_query_results: TypingList[Optional[subprocess.CompletedProcess]] = [None] * len(critical_packages_to_check)
+    if not cfg.get_dry_run_mode():
+        ui.print_step_info("Verifying critical package installation in /mnt...")
+        # The queries are independent and read-only, so run them together. pacman --sysroot reads the
+        # new system's database directly; parallel arch-chroot calls would race on the /mnt API mounts.
+        pkg_query_results = core.run_commands_batch(
+            [["pacman", "--sysroot", "/mnt", "-Q", pkg] for pkg in critical_packages_to_check]
+        )
+    for pkg, proc in zip(critical_packages_to_check, pkg_query_results):
+        if not core.verify_step(_check_package_installed(pkg, proc), f"'{pkg}' package is installed", critical=True):
             all_ok = False
 
     if all_ok:
@@ -9,7 +9,7 @@ These functions often orchestrate calls to more specialized modules.
 import sys
 import subprocess # For CalledProcessError
 from pathlib import Path
-from typing import Dict, Any, List, Optional, Callable # Added List, Optional, Callable
+from typing import Dict, Any, List, Optional, Callable, Mapping # Added List, Optional, Callable
 
 # Attempt to import from sibling modules
 try:
@@ -56,7 +56,7 @@ def gather_initial_config() -> None:
     ui.print_color(f"Adding Chaotic-AUR: {'Yes' if user_config.get('add_chaotic_aur') else 'No'} (default)", ui.Colors.CYAN)
 
     ui.print_color("Initial configuration set.", ui.Colors.GREEN, prefix=ui.SUCCESS_SYMBOL)
-    cfg.set_current_step(cfg.INSTALL_STEPS.index("prepare_environment"))
+    cfg.set_current_step(cfg.Step.PREPARE_ENVIRONMENT)
     cfg.save_progress() # Save USER_CONFIG with the selected target_drive
     sys.stdout.write("\n")
 
@@ -67,7 +67,7 @@ def display_summary_and_confirm() -> None:
     if cfg.get_dry_run_mode():
         ui.print_color("[DRY RUN MODE - NO DISK CHANGES WILL BE MADE]", ui.Colors.YELLOW, bold=True, prefix=ui.WARNING_SYMBOL)
     
-    user_config: Dict[str, Any] = cfg.get_all_user_config()
+    user_config: Mapping[str, Any] = cfg.get_all_user_config()
     # Ensure all values are strings for display, especially booleans
     summary_user_config: Dict[str, str] = {
         k: (str(v).lower() if isinstance(v, bool) else str(v)) for k, v in user_config.items()
@@ -142,7 +142,7 @@ def check_internet_connection() -> bool:
 def prepare_live_environment() -> None:
     """Prepares the live Arch Linux environment by installing necessary tools and configuring repositories."""
     ui.print_section_header("Preparing Live Environment")
-    if cfg.get_current_step() > cfg.INSTALL_STEPS.index("prepare_environment"):
+    if cfg.get_current_step() > cfg.Step.PREPARE_ENVIRONMENT:
         ui.print_step_info("Skipping (already completed)")
         sys.stdout.write("\n"); return
 
@@ -188,7 +188,7 @@ def prepare_live_environment() -> None:
     core.run_command(["pacman", "-Sy"], destructive=True) # Syncs databases
 
     ui.print_color("Live environment prepared.", ui.Colors.GREEN, prefix=ui.SUCCESS_SYMBOL)
-    cfg.set_current_step(cfg.INSTALL_STEPS.index("partition_format"))
+    cfg.set_current_step(cfg.Step.PARTITION_FORMAT)
     cfg.save_progress()
     sys.stdout.write("\n")
 
@@ -231,7 +231,7 @@ def final_system_integrity_checks(no_verify_arg: bool) -> bool:
 
     ui.print_section_header("Final System Integrity Checks")
     all_ok: bool = True
-    user_config: Dict[str, Any] = cfg.get_all_user_config()
+    user_config: Mapping[str, Any] = cfg.get_all_user_config()
     mnt_base: Path = Path("/mnt")
 
     # --- 1. Verify /mnt/etc/fstab entries ---
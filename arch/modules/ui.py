@@ -54,11 +54,14 @@ def print_color(
     prefix: Optional[str] = None,
     italic: bool = False
 ) -> None:
-    """Prints text in a specified color and style."""
+    """
+    Prints text in a specified color and style as a single write.
+    No flush here: stdout is block-buffered while the installer runs (see main.py), and it is
+    flushed before prompts, spinner frames and child processes that share the terminal.
+    """
     style_str: str = (Colors.BOLD if bold else "") + (Colors.ITALIC if italic else "")
     prefix_str: str = f"{prefix} " if prefix else ""
     sys.stdout.write(f"{prefix_str}{style_str}{color}{text}{Colors.RESET}\n")
-    sys.stdout.flush()
 
 def print_header(title: str) -> None:
     """Prints a main section header with a girly pop aesthetic."""
@@ -67,7 +70,6 @@ def print_header(title: str) -> None:
     # Choosing Option 1 for primary branding
     print_color(f"✨ {title} ✨", Colors.PINK, bold=True)
     sys.stdout.write("\n")
-    sys.stdout.flush()
 
 def print_section_header(title: str) -> None:
     """Prints a subsection header with a girly pop gradient effect."""
@@ -80,7 +82,6 @@ def print_section_header(title: str) -> None:
     # Choosing Option 1 for a cleaner look with ribbon symbols
     print_color(f"{RIBBON_SYMBOL} {styled_title} {RIBBON_SYMBOL}", Colors.LAVENDER, bold=True)
     sys.stdout.write("\n")
-    sys.stdout.flush()
 
 def print_step_info(message: str) -> None:
     """Prints an informational message for a step with a girly pop aesthetic."""